@@ -1,12 +1,96 @@
+import json
 import os
+import threading
+import time
 from datetime import datetime, timezone
 
 import akeyless  # run "pip install akeyless" to install
 from akeyless_cloud_id import CloudId, __version__ as cloud_id_version  # run "pip install akeyless-cloud-id" to install
 
+try:
+    from cryptography.fernet import Fernet, InvalidToken  # run "pip install cryptography" to use the disk secret cache
+except ImportError:
+    Fernet = InvalidToken = None
+
+
+class DiskSecretCache:
+    """
+    Secret values kept on disk between runs so a new process can serve them before it reaches Akeyless.
+
+    The file is encrypted with Fernet from the optional cryptography package ("pip install cryptography"). The key is
+    passed in or read from the AKEYLESS_CACHE_KEY environment variable and is never written next to the cache, since
+    anyone who can read both could decrypt it. Create one with Fernet.generate_key() and keep it in your platform's
+    secret store.
+    """
+
+    def __init__(self, cache_file, fresh_seconds=300, max_stale_seconds=86400, key=None):
+        # Values younger than fresh_seconds are served as they are. Older values are served while a fresh one is
+        # pulled in the background, until they are max_stale_seconds old and must be pulled before they are used
+        if Fernet is None:
+            raise Exception("The disk secret cache needs the cryptography package. Run \"pip install cryptography\".")
+        self.cache_file = cache_file
+        self.fresh_seconds = fresh_seconds
+        self.max_stale_seconds = max_stale_seconds
+        self.lock = threading.Lock()
+        if os.path.dirname(cache_file):
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        key = key or os.getenv("AKEYLESS_CACHE_KEY")
+        if not key:
+            raise Exception("The disk secret cache needs a key. Set AKEYLESS_CACHE_KEY to a key from "
+                            "Fernet.generate_key().")
+        self.fernet = Fernet(key)
+        self.entries = self.load()
+
+    def load(self):
+        try:
+            with open(self.cache_file, "rb") as f:
+                return json.loads(self.fernet.decrypt(f.read()))
+        except FileNotFoundError:
+            return {}
+        except (InvalidToken, ValueError):
+            print(f"Ignoring the disk secret cache {self.cache_file}, it could not be decrypted with the current key")
+            return {}
+
+    def get(self, path):
+        # Returns the cached value and its age in seconds, or None if the value is missing or too old to use
+        with self.lock:
+            entry = self.entries.get(path)
+        if entry is None:
+            return None
+        age = time.time() - entry["fetched_at"]
+        if age >= self.max_stale_seconds:
+            return None
+        return entry["value"], age
+
+    def put(self, path, value):
+        with self.lock:
+            self.entries[path] = {"value": value, "fetched_at": time.time()}
+            self.save()
+
+    def invalidate(self, path=None):
+        with self.lock:
+            if path is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(path, None)
+            self.save()
+
+    def save(self):
+        # Callers hold self.lock. The file is replaced in one step so a crash never leaves a half written cache
+        data = self.fernet.encrypt(json.dumps(self.entries).encode("utf-8"))
+        temp_file = f"{self.cache_file}.tmp"
+        try:
+            with os.fdopen(os.open(temp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as f:
+                f.write(data)
+            os.replace(temp_file, self.cache_file)
+        except OSError as e:
+            print(f"Unable to write the disk secret cache {self.cache_file}: {e}")
+
 
 class AkeylessConnection:
-    def __init__(self, access_id, secret_path):
+    def __init__(self, access_id, secret_path, disk_cache_file=None, disk_cache_fresh_seconds=300,
+                 disk_cache_max_stale_seconds=86400, disk_cache_key=None):
+        # disk_cache_file turns on the encrypted disk cache, see DiskSecretCache for the freshness settings and the key
         # NonProd URL
         self.base_url = "https://api.secmgmt-uat.cvshealth.com"
         # PROD URL
@@ -22,7 +106,21 @@ class AkeylessConnection:
         self.error_log_path = \
             f"{self.error_log_location}/UTC_{datetime.now(timezone.utc).strftime('%Y-%m-%d_%H-%M-%S')}.log"
         self.cloud_id = None
-        self.auth_token = self.akeyless_auth()
+        self.disk_cache = None
+        if disk_cache_file:
+            self.disk_cache = DiskSecretCache(disk_cache_file, disk_cache_fresh_seconds, disk_cache_max_stale_seconds,
+                                              disk_cache_key)
+        self.auth_lock = threading.Lock()
+        self.revalidate_lock = threading.Lock()
+        self.revalidate_thread = None
+        # After a failed background refresh the next one waits revalidate_backoff_seconds, doubling on every failure
+        # up to revalidate_max_backoff_seconds
+        self.revalidate_backoff_seconds = 30
+        self.revalidate_max_backoff_seconds = 600
+        self.revalidate_failures = 0
+        self.revalidate_retry_at = 0
+        # With a disk cache, cached secrets are served straight away and auth waits until Akeyless is first needed
+        self.auth_token = None if self.disk_cache is not None else self.akeyless_auth()
 
     def log_error_for_akeyless(self, error, message):
         default_message = \
@@ -56,18 +154,87 @@ class AkeylessConnection:
 
         return akeyless.V2Api(api_client)
 
+    def get_auth_token(self):
+        # Auth once, the first time Akeyless is needed
+        if self.auth_token is None:
+            with self.auth_lock:
+                if self.auth_token is None:
+                    self.auth_token = self.akeyless_auth()
+        return self.auth_token
+
+    def reauthenticate(self, rejected_token):
+        # Auth again unless another thread already replaced the rejected token
+        with self.auth_lock:
+            if self.auth_token == rejected_token:
+                self.auth_token = self.akeyless_auth()
+        return self.auth_token
+
     def get_rotated_secret_data(self):
+        # Serve the disk cache value if there is one, pulling a new value in the background once it is stale
+        if self.disk_cache is not None:
+            cached = self.disk_cache.get(self.secret_path)
+            if cached is not None:
+                secret_data, age = cached
+                if age >= self.disk_cache.fresh_seconds:
+                    self.revalidate_in_background()
+                return secret_data
+        return self.fetch_rotated_secret_data()
+
+    def revalidate_in_background(self):
+        # One refresh at a time. If it fails the error is logged and the stale value stays in use, and no new refresh
+        # starts until the back off has passed, so an outage does not start a fetch and write a log on every request
+        with self.revalidate_lock:
+            if self.revalidate_thread is not None and self.revalidate_thread.is_alive():
+                return
+            if time.time() < self.revalidate_retry_at:
+                return
+            self.revalidate_thread = threading.Thread(target=self.revalidate, name="akeyless-revalidate", daemon=True)
+            self.revalidate_thread.start()
+
+    def revalidate(self):
+        try:
+            self.fetch_rotated_secret_data()
+        except SystemExit:
+            # log_error_for_akeyless has written the error log. A background refresh must not stop the program
+            print(f"Background refresh of {self.secret_path} failed, the cached value stays in use")
+            self.back_off_revalidation()
+        except Exception as e:
+            print(f"Background refresh of {self.secret_path} failed, the cached value stays in use: {e}")
+            self.back_off_revalidation()
+        else:
+            with self.revalidate_lock:
+                self.revalidate_failures = 0
+                self.revalidate_retry_at = 0
+
+    def back_off_revalidation(self):
+        with self.revalidate_lock:
+            self.revalidate_failures += 1
+            backoff = self.revalidate_backoff_seconds * 2 ** (self.revalidate_failures - 1)
+            self.revalidate_retry_at = time.time() + min(backoff, self.revalidate_max_backoff_seconds)
+
+    def fetch_rotated_secret_data(self):
         # Payload to pull rotated secret value from Akeyless
-        body = akeyless.RotatedSecretGetValue(name=self.secret_path, token=self.auth_token)
+        token = self.get_auth_token()
+        body = akeyless.RotatedSecretGetValue(name=self.secret_path, token=token)
 
         # Make API call
         try:
-            secret_data_response = self.api.rotated_secret_get_value(body)
+            try:
+                secret_data_response = self.api.rotated_secret_get_value(body)
+            except akeyless.ApiException as e:
+                if e.status != 401:
+                    raise
+                # The auth token expired or was revoked. Auth again and send the request once more
+                body.token = self.reauthenticate(token)
+                secret_data_response = self.api.rotated_secret_get_value(body)
         except Exception as e:
             err_msg = f"Error during pulling rotated secret data from Akeyless"
             self.log_error_for_akeyless(e, err_msg)
 
-        return secret_data_response["value"]
+        secret_data = secret_data_response["value"]
+        if self.disk_cache is not None:
+            self.disk_cache.put(self.secret_path, secret_data)
+        return secret_data
 
     def akeyless_auth(self):
         # Generate Cloud ID based on provider
@@ -95,5 +262,9 @@ if __name__ == "__main__":
     # Auth to Akeyless and setup connection data
     akeyless_connection = AkeylessConnection(access_id, secret_path)
 
+    # To start serving secrets before Akeyless is reachable, keep an encrypted copy on disk. The copy is used for up
+    # to a day and refreshed in the background after five minutes. Set AKEYLESS_CACHE_KEY to the encryption key first
+    # akeyless_connection = AkeylessConnection(access_id, secret_path, disk_cache_file="./.akeyless-secret-cache")
+
     # Pull rotated secret data from Akeyless
     secret_data = akeyless_connection.get_rotated_secret_data()
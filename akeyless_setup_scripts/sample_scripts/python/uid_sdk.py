@@ -1,11 +1,184 @@
+import json
 import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
 
 import akeyless  # run "pip install akeyless" to install
 
+try:
+    from cryptography.fernet import Fernet, InvalidToken  # run "pip install cryptography" to use the disk secret cache
+except ImportError:
+    Fernet = InvalidToken = None
+
+
+class SecretCache:
+    """
+    Thread-safe cache of secret values by path. Entries expire after their own time to live and the least recently
+    used entry is dropped once the cache is full.
+    """
+
+    def __init__(self, max_size=128):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path):
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is None or entry["expires_at"] <= time.monotonic():
+                self.entries.pop(path, None)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(path)
+            self.hits += 1
+            return entry["value"]
+
+    def put(self, path, value, ttl):
+        with self.lock:
+            self.entries[path] = {"value": value, "expires_at": time.monotonic() + ttl}
+            self.entries.move_to_end(path)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, path=None):
+        # Drop one path, or every path when none is given
+        with self.lock:
+            if path is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(path, None)
+
+
+class SingleFlight:
+    """
+    Runs one call per key at a time. Callers asking for a key that is already being fetched wait for that call and
+    share its result, so a burst of cache misses for one secret reaches Akeyless once.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.upstream = 0
+        self.coalesced = 0
+
+    def do(self, key, func):
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = {"done": threading.Event(), "result": None, "error": None}
+                self.calls[key] = call
+                self.upstream += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call["done"].wait()
+            if call["error"] is not None:
+                raise call["error"]
+            return call["result"]
+
+        try:
+            call["result"] = func()
+            return call["result"]
+        except BaseException as e:
+            # Includes the SystemExit from log_error_for_akeyless, so every waiter stops the same way
+            call["error"] = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call["done"].set()
+
+
+class DiskSecretCache:
+    """
+    Secret values kept on disk between runs so a new process can serve them before it reaches Akeyless.
+
+    The file is encrypted with Fernet from the optional cryptography package ("pip install cryptography"). The key is
+    passed in or read from the AKEYLESS_CACHE_KEY environment variable and is never written next to the cache, since
+    anyone who can read both could decrypt it. Create one with Fernet.generate_key() and keep it in your platform's
+    secret store.
+    """
+
+    def __init__(self, cache_file, fresh_seconds=300, max_stale_seconds=86400, key=None):
+        # Values younger than fresh_seconds are served as they are. Older values are served while a fresh one is
+        # pulled in the background, until they are max_stale_seconds old and must be pulled before they are used
+        if Fernet is None:
+            raise Exception("The disk secret cache needs the cryptography package. Run \"pip install cryptography\".")
+        self.cache_file = cache_file
+        self.fresh_seconds = fresh_seconds
+        self.max_stale_seconds = max_stale_seconds
+        self.lock = threading.Lock()
+        if os.path.dirname(cache_file):
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+        key = key or os.getenv("AKEYLESS_CACHE_KEY")
+        if not key:
+            raise Exception("The disk secret cache needs a key. Set AKEYLESS_CACHE_KEY to a key from "
+                            "Fernet.generate_key().")
+        self.fernet = Fernet(key)
+        self.entries = self.load()
+
+    def load(self):
+        try:
+            with open(self.cache_file, "rb") as f:
+                return json.loads(self.fernet.decrypt(f.read()))
+        except FileNotFoundError:
+            return {}
+        except (InvalidToken, ValueError):
+            print(f"Ignoring the disk secret cache {self.cache_file}, it could not be decrypted with the current key")
+            return {}
+
+    def get(self, path):
+        # Returns the cached value and its age in seconds, or None if the value is missing or too old to use
+        with self.lock:
+            entry = self.entries.get(path)
+        if entry is None:
+            return None
+        age = time.time() - entry["fetched_at"]
+        if age >= self.max_stale_seconds:
+            return None
+        return entry["value"], age
+
+    def put(self, path, value):
+        with self.lock:
+            self.entries[path] = {"value": value, "fetched_at": time.time()}
+            self.save()
+
+    def invalidate(self, path=None):
+        with self.lock:
+            if path is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(path, None)
+            self.save()
+
+    def save(self):
+        # Callers hold self.lock. The file is replaced in one step so a crash never leaves a half written cache
+        data = self.fernet.encrypt(json.dumps(self.entries).encode("utf-8"))
+        temp_file = f"{self.cache_file}.tmp"
+        try:
+            with os.fdopen(os.open(temp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as f:
+                f.write(data)
+            os.replace(temp_file, self.cache_file)
+        except OSError as e:
+            print(f"Unable to write the disk secret cache {self.cache_file}: {e}")
+
 
 class AkeylessConnection:
-    def __init__(self, access_id, secret_path):
+    def __init__(self, access_id, secret_path, cache_size=128, default_cache_ttl=3600, max_cache_ttl=86400,
+                 background_refresh=False, auth_token_ttl=1800, uid_token_ttl=None, refresh_margin=300,
+                 disk_cache_file=None, disk_cache_fresh_seconds=300, disk_cache_max_stale_seconds=86400,
+                 disk_cache_key=None):
+        # background_refresh starts a thread that renews the auth token refresh_margin seconds before it expires and,
+        # when uid_token_ttl (the auth method's UID token TTL in seconds) is set, rotates the UID token before its TTL.
+        # auth_token_ttl is only used when Akeyless does not return the token's expiry. disk_cache_file turns on the
+        # encrypted disk cache, see DiskSecretCache for the freshness settings and the key
         # NonProd URL
         self.base_url = "https://api.secmgmt-uat.cvshealth.com"
         # PROD URL
@@ -13,17 +186,45 @@ class AkeylessConnection:
         self.api = self.setup_api()
         if access_id in ["p-...", "", None]:
             raise Exception("Access ID is not set. Please update the access_id variable at the bottom of the file.")
-        if secret_path in ["...", "", None]:
+        # One connection can serve many secrets. secret_path is a single path or a list of paths
+        self.secret_paths = [secret_path] if isinstance(secret_path, str) or secret_path is None else list(secret_path)
+        if not self.secret_paths or any(path in ["...", "", None] for path in self.secret_paths):
             raise Exception("Secret path is not set. Please update the secret_path variable at the bottom of the file.")
         self.access_id = access_id
-        self.secret_path = secret_path
+        self.secret_path = self.secret_paths[0]
         self.error_log_location = "./akeyless_error_logs"
         self.error_log_path = \
             f"{self.error_log_location}/UTC_{datetime.now(timezone.utc).strftime('%Y-%m-%d_%H-%M-%S')}.log"
         self.token_file = "./.vault-token"
         self.uid_token = None
+        # Rotated secret values are cached until shortly before their next rotation so repeat calls skip the gateway
+        self.secret_cache = SecretCache(cache_size)
+        self.default_cache_ttl = default_cache_ttl
+        self.max_cache_ttl = max_cache_ttl
+        # Next rotation time and rotation interval per path, described once and reused until the rotation passes
+        self.rotation_schedules = {}
+        self.auth_token_ttl = auth_token_ttl
+        self.auth_token_issued_at = 0
+        self.auth_token_expires_at = 0
+        self.uid_token_ttl = uid_token_ttl
+        self.refresh_margin = refresh_margin
+        self.refresh_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.refresh_thread = None
+        self.disk_cache = None
+        if disk_cache_file:
+            self.disk_cache = DiskSecretCache(disk_cache_file, disk_cache_fresh_seconds, disk_cache_max_stale_seconds,
+                                              disk_cache_key)
+        self.auth_lock = threading.Lock()
+        self.revalidate_lock = threading.Lock()
+        self.revalidating = set()
+        # Concurrent fetches of the same secret share one call to Akeyless
+        self.single_flight = SingleFlight()
         self.read_uid_token_value()
-        self.auth_token = self.akeyless_auth()
+        # With a disk cache, cached secrets are served straight away and auth waits until Akeyless is first needed
+        self.auth_token = None if self.disk_cache is not None else self.akeyless_auth()
+        if background_refresh:
+            self.start_background_refresh()
 
     def log_error_for_akeyless(self, error, message):
         default_message = \
@@ -57,18 +258,194 @@ class AkeylessConnection:
 
         return akeyless.V2Api(api_client)
 
-    def get_rotated_secret_data(self):
+    def get_auth_token(self):
+        # Auth once, the first time Akeyless is needed
+        if self.auth_token is None:
+            with self.auth_lock:
+                if self.auth_token is None:
+                    self.auth_token = self.akeyless_auth()
+        return self.auth_token
+
+    def get_cached_secret_data(self, secret_path, fetch):
+        # Look in the memory cache, then the disk cache. A stale disk value is returned while fetch pulls a new one
+        # in the background
+        secret_data = self.secret_cache.get(secret_path)
+        if secret_data is not None or self.disk_cache is None:
+            return secret_data
+        cached = self.disk_cache.get(secret_path)
+        if cached is None:
+            return None
+        secret_data, age = cached
+        if age < self.disk_cache.fresh_seconds:
+            self.secret_cache.put(secret_path, secret_data, self.disk_cache.fresh_seconds - age)
+        else:
+            self.revalidate_in_background(secret_path, fetch)
+        return secret_data
+
+    def revalidate_in_background(self, secret_path, fetch):
+        # One refresh per path at a time. If it fails the error is logged and the stale value stays in use
+        with self.revalidate_lock:
+            if secret_path in self.revalidating:
+                return
+            self.revalidating.add(secret_path)
+
+        def revalidate():
+            try:
+                fetch(secret_path)
+            except SystemExit:
+                # log_error_for_akeyless has written the error log. A background refresh must not stop the program
+                print(f"Background refresh of {secret_path} failed, the cached value stays in use")
+            except Exception as e:
+                print(f"Background refresh of {secret_path} failed, the cached value stays in use: {e}")
+            finally:
+                with self.revalidate_lock:
+                    self.revalidating.discard(secret_path)
+
+        threading.Thread(target=revalidate, name="akeyless-revalidate", daemon=True).start()
+
+    def get_rotated_secret_data(self, secret_path=None):
+        # Serve the value from the cache while it is fresh
+        secret_path = secret_path or self.secret_path
+        secret_data = self.get_cached_secret_data(secret_path, self.fetch_rotated_secret_data)
+        if secret_data is not None:
+            return secret_data
+        return self.fetch_rotated_secret_data(secret_path)
+
+    def fetch_rotated_secret_data(self, secret_path):
+        return self.single_flight.do(("rotated", secret_path), lambda: self.pull_rotated_secret_data(secret_path))
+
+    def pull_rotated_secret_data(self, secret_path):
         # Payload to pull rotated secret value from Akeyless
-        body = akeyless.RotatedSecretGetValue(name=self.secret_path, token=self.auth_token)
+        body = akeyless.RotatedSecretGetValue(name=secret_path, token=self.get_auth_token())
 
         # Make API call
         try:
             secret_data_response = self.api.rotated_secret_get_value(body)
+        except akeyless.ApiException as e:
+            if e.status not in [401, 403]:
+                self.log_error_for_akeyless(e, f"Error during pulling rotated secret data from Akeyless")
+            # The auth token expired or was revoked. Auth again and retry once
+            self.auth_token = self.akeyless_auth()
+            body.token = self.auth_token
+            try:
+                secret_data_response = self.api.rotated_secret_get_value(body)
+            except Exception as e:
+                err_msg = f"Error during pulling rotated secret data from Akeyless"
+                self.log_error_for_akeyless(e, err_msg)
         except Exception as e:
             err_msg = f"Error during pulling rotated secret data from Akeyless"
             self.log_error_for_akeyless(e, err_msg)
 
-        return secret_data_response["value"]
+        secret_data = secret_data_response["value"]
+        self.secret_cache.put(secret_path, secret_data, self.secret_cache_ttl(secret_path))
+        if self.disk_cache is not None:
+            self.disk_cache.put(secret_path, secret_data)
+        return secret_data
+
+    def get_static_secrets_data(self, secret_paths):
+        # Pull every static secret that is not cached in a single call
+        secrets_data = {path: self.get_cached_secret_data(path, self.fetch_static_secret_data) for path in secret_paths}
+        missing = [path for path, value in secrets_data.items() if value is None]
+        if missing:
+            secrets_data.update(self.fetch_static_secrets_data(missing))
+        return secrets_data
+
+    def fetch_static_secret_data(self, secret_path):
+        return self.fetch_static_secrets_data([secret_path])[secret_path]
+
+    def fetch_static_secrets_data(self, secret_paths):
+        return self.single_flight.do(("static", tuple(secret_paths)),
+                                     lambda: self.pull_static_secrets_data(secret_paths))
+
+    def pull_static_secrets_data(self, secret_paths):
+        # Payload to pull static secret values from Akeyless
+        body = akeyless.GetSecretValue(names=secret_paths, token=self.get_auth_token())
+
+        # Make API call
+        try:
+            secret_values_response = self.api.get_secret_value(body)
+        except Exception as e:
+            err_msg = f"Error during pulling static secret data from Akeyless"
+            self.log_error_for_akeyless(e, err_msg)
+
+        secrets_data = {}
+        for path in secret_paths:
+            secrets_data[path] = secret_values_response[path]
+            self.secret_cache.put(path, secrets_data[path], self.default_cache_ttl)
+            if self.disk_cache is not None:
+                self.disk_cache.put(path, secrets_data[path])
+        return secrets_data
+
+    def get_secrets_data(self, rotated_secret_paths=None, static_secret_paths=None, max_workers=8):
+        # Pull many secrets at once: static secrets in one call and rotated secrets in parallel. Returns a dictionary
+        # of secret path to value. The rotated secrets default to the paths the connection was created with
+        if rotated_secret_paths is None:
+            rotated_secret_paths = self.secret_paths
+        rotated_secret_paths = list(rotated_secret_paths)
+        static_secret_paths = list(static_secret_paths or [])
+
+        secrets_data = {}
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(rotated_secret_paths)))) as executor:
+            rotated = {path: executor.submit(self.get_rotated_secret_data, path) for path in rotated_secret_paths}
+            if static_secret_paths:
+                secrets_data.update(self.get_static_secrets_data(static_secret_paths))
+            for path, future in rotated.items():
+                secrets_data[path] = future.result()
+        return secrets_data
+
+    def get_fetch_stats(self):
+        # Counters for tuning: fetches that went to Akeyless, fetches that waited on one already in progress and
+        # memory cache hits and misses
+        return {
+            "upstream_fetches": self.single_flight.upstream,
+            "coalesced_fetches": self.single_flight.coalesced,
+            "cache_hits": self.secret_cache.hits,
+            "cache_misses": self.secret_cache.misses,
+        }
+
+    def secret_cache_ttl(self, secret_path):
+        # Seconds until the secret's next rotation, or its rotation interval if the next rotation is not known
+        now = time.time()
+        schedule = self.rotation_schedules.get(secret_path)
+        rotated_since = (schedule is not None and schedule["next_rotation"] is not None
+                         and schedule["described_at"] < schedule["next_rotation"] <= now)
+        if schedule is None or rotated_since:
+            # Not described yet, or the known rotation has happened since, so there is a new next rotation to read.
+            # An item with no rotation date, or whose describe failed, keeps its schedule for the rest of the run
+            schedule = self.describe_rotation_schedule(secret_path)
+            self.rotation_schedules[secret_path] = schedule
+
+        if schedule["next_rotation"] is not None:
+            # A rotation that is already overdue falls back to the default TTL instead of describing on every miss
+            ttl = schedule["next_rotation"] - now if schedule["next_rotation"] > now else self.default_cache_ttl
+        else:
+            ttl = schedule["interval"] or self.default_cache_ttl
+        return max(0, min(ttl, self.max_cache_ttl))
+
+    def describe_rotation_schedule(self, secret_path):
+        # The get value response does not say when the secret rotates next, so ask describe_item. If it fails, for
+        # example because the auth method cannot describe items, the default TTL is used for the rest of the run
+        schedule = {"next_rotation": None, "interval": None, "described_at": time.time()}
+        try:
+            item = self.api.describe_item(akeyless.DescribeItem(name=secret_path, token=self.get_auth_token()))
+        except Exception:
+            return schedule
+
+        if item.next_rotation_date is not None:
+            next_rotation = item.next_rotation_date
+            if next_rotation.tzinfo is None:
+                next_rotation = next_rotation.replace(tzinfo=timezone.utc)
+            schedule["next_rotation"] = next_rotation.timestamp()
+        if item.rotation_interval:
+            schedule["interval"] = int(item.rotation_interval) * 86400
+        return schedule
+
+    def invalidate_secret(self, secret_path=None):
+        # Call this when a secret value fails to log in or does not match what the target expects, so the next
+        # get_rotated_secret_data pulls the current value from Akeyless. Leave out secret_path to drop every value
+        self.secret_cache.invalidate(secret_path)
+        if self.disk_cache is not None:
+            self.disk_cache.invalidate(secret_path)
 
     def read_uid_token_value(self):
         # Uid token value needs to be put into a file in the same directory as the script
@@ -82,9 +459,12 @@ class AkeylessConnection:
                 self.write_uid_token_value()
 
     def write_uid_token_value(self):
-        # Write the new uid token value into the location in the variable token_file
-        with open(self.token_file, "w") as f:
+        # Write the new uid token value into the location in the variable token_file. The value goes to a temporary
+        # file first and replaces the old file in one step, so a crash never leaves a half written token
+        temp_file = f"{self.token_file}.tmp"
+        with open(temp_file, "w") as f:
             f.write(self.uid_token)
+        os.replace(temp_file, self.token_file)
 
     def rotate_uid_token(self):
         # Payload to rotate UID token
@@ -113,8 +493,79 @@ class AkeylessConnection:
             err_msg = f"Error during auth to Akeyless while trying to connect to {self.base_url}"
             self.log_error_for_akeyless(e, err_msg)
 
+        expiry = auth_response.creds.expiry if auth_response.creds is not None else None
+        self.auth_token_issued_at = time.time()
+        self.auth_token_expires_at = expiry if expiry else time.time() + self.auth_token_ttl
         return auth_response.token
 
+    def start_background_refresh(self):
+        # Start a daemon thread that keeps the auth token and UID token fresh. Callers keep reading self.auth_token
+        # and are never blocked, because a new token only replaces the old one once it has been issued
+        if self.refresh_thread is not None and self.refresh_thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.refresh_thread = threading.Thread(target=self.refresh_loop, name="akeyless-refresh", daemon=True)
+        self.refresh_thread.start()
+
+    def stop_background_refresh(self):
+        self.stop_event.set()
+        if self.refresh_thread is not None:
+            self.refresh_thread.join()
+            self.refresh_thread = None
+
+    def uid_token_rotation_due_at(self):
+        # The token file is rewritten on every rotation, so its modified time is when the current UID token was issued
+        if not self.uid_token_ttl:
+            return None
+        try:
+            issued_at = os.path.getmtime(self.token_file)
+        except OSError:
+            issued_at = time.time()
+        return issued_at + self.uid_token_ttl - self.refresh_margin
+
+    def refresh_loop(self):
+        while not self.stop_event.is_set():
+            # Renew refresh_margin seconds before expiry, or half way through the token's life if that is shorter.
+            # With a disk cache there is no auth token until Akeyless is first needed, so only the UID token is due
+            due_at = None
+            if self.auth_token is not None:
+                lifetime = self.auth_token_expires_at - self.auth_token_issued_at
+                due_at = self.auth_token_issued_at + max(lifetime - self.refresh_margin, lifetime / 2)
+            uid_due_at = self.uid_token_rotation_due_at()
+            if uid_due_at is not None:
+                due_at = uid_due_at if due_at is None else min(due_at, uid_due_at)
+            if due_at is None:
+                # Look again once a minute for the first auth token
+                if self.stop_event.wait(60):
+                    return
+                continue
+            if self.stop_event.wait(max(0, due_at - time.time())):
+                return
+            try:
+                self.refresh_tokens()
+            except Exception as e:
+                # The current tokens stay in use. Try again shortly instead of exiting like the request path does
+                print(f"Background refresh of the Akeyless tokens failed, retrying in 30 seconds: {e}")
+                self.stop_event.wait(30)
+
+    def refresh_tokens(self):
+        # Rotate the UID token first when it is due, then auth with it so the new auth token comes from the new UID
+        with self.refresh_lock:
+            uid_due_at = self.uid_token_rotation_due_at()
+            if uid_due_at is not None and time.time() >= uid_due_at:
+                rotate_uid_token_response = self.api.uid_rotate_token(akeyless.UidRotateToken(uid_token=self.uid_token))
+                self.uid_token = rotate_uid_token_response.token
+                self.write_uid_token_value()
+                print(f"Rotated the UID token in {self.token_file}")
+
+            auth_body = \
+                akeyless.Auth(access_type="universal_identity", access_id=self.access_id, uid_token=self.uid_token)
+            auth_response = self.api.auth(auth_body)
+            expiry = auth_response.creds.expiry if auth_response.creds is not None else None
+            self.auth_token_issued_at = time.time()
+            self.auth_token_expires_at = expiry if expiry else time.time() + self.auth_token_ttl
+            self.auth_token = auth_response.token
+
 
 if __name__ == "__main__":
     # Update with your access_id and secret_path. These values should be pulled from an environment file
@@ -124,9 +575,25 @@ if __name__ == "__main__":
     # Auth to Akeyless and setup connection data
     akeyless_connection = AkeylessConnection(access_id, secret_path)
 
-    # Pull rotated secret data from Akeyless
+    # Pull rotated secret data from Akeyless. Calls until the next rotation are served from the cache
     secret_data = akeyless_connection.get_rotated_secret_data()
 
+    # To pull many secrets over the one connection, pass a list of paths. Static secrets come back from one call and
+    # rotated secrets are pulled in parallel
+    # akeyless_connection = AkeylessConnection(access_id, ["/cvs/.../rotated-1", "/cvs/.../rotated-2"])
+    # secrets_data = akeyless_connection.get_secrets_data(static_secret_paths=["/cvs/.../static-1"])
+
+    # To start serving secrets before Akeyless is reachable, keep an encrypted copy on disk. The copy is used for up
+    # to a day and refreshed in the background after five minutes. Set AKEYLESS_CACHE_KEY to the encryption key first
+    # akeyless_connection = AkeylessConnection(access_id, secret_path, disk_cache_file="./.akeyless-secret-cache")
+
+    # If the secret fails to log in to your service, drop the cached value so the next call pulls the new one
+    # akeyless_connection.invalidate_secret()
+
+    # Long-running services can let the connection keep its tokens fresh instead of using a cronjob. Set
+    # uid_token_ttl to the UID token TTL of your auth method in seconds
+    # akeyless_connection = AkeylessConnection(access_id, secret_path, background_refresh=True, uid_token_ttl=...)
+
     # NOT REQUIRED - FOR EDUCATIONAL PURPOSES OF HOW TO ROTATE THE UID TOKEN VIA THE SCRIPT
     # THIS IS NORMALLY TAKEN CARE OF OUTSIDE OF THE SCRIPT VIA A CRONJOB OR WINDOWS TASK SCHEDULER
     # Rotate UID token
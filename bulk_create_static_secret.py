@@ -1,6 +1,7 @@
 from akeyless import ApiException, CreateSecret
 
 from configs.akeyless_config import AkeylessConfig
+from toolkit.retry import is_conflict
 
 # Required Values when run solo
 env = "uat"  # UAT or PROD
@@ -82,12 +83,10 @@ def new_static_secret():
 
         return "Secret Successfully Created"
     except ApiException as e:
-        if e.status != 409:
-            print(e)
+        print(e)
+        if is_conflict(e):
             return "Secret Already Exists"
-        else:
-            print(e)
-            return "Error Creating Secret"
+        return "Error Creating Secret"
     except Exception as e:
         print(e)
         return "Error Creating Secret"
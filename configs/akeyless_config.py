@@ -1,10 +1,19 @@
+import atexit
 import datetime
+import threading
 
-from akeyless import ApiClient, Configuration, V2Api, Auth
+from akeyless import Auth
 import dotenv
 import os
 
+from configs.api_client import get_api, pool_settings_from_env
 from configs.input_prompts import create_input_prompt
+from configs.node_selector import NodeRoutingApi, build_node_selector, node_selection_enabled
+from configs.token_manager import ReauthenticatingApi, TokenManager, DEFAULT_TOKEN_CACHE_FILE
+from toolkit.concurrency import AdaptiveConcurrencyLimiter, GovernedApi
+from toolkit.metrics import MeteredApi, api_metrics, start_metrics_server
+from toolkit.retry import RetryingApi, RetryPolicy
+from toolkit.tracing import Tracer, TracedApi
 
 version = "1.2.0"
 engineers = {
@@ -47,18 +56,28 @@ def config_akeyless(environment):
     api_access_id = os.getenv(f"{environment.upper()}_API_ACCESS_ID")
     api_access_key = os.getenv(f"{environment.upper()}_API_ACCESS_KEY")
 
-    configuration = Configuration(
-        host=url
-    )
-
-    api_client = ApiClient(configuration)
-    api = V2Api(api_client)
-
-    print(f"Authing to Akeyless {environment}")
+    if node_selection_enabled():
+        # Send each request to the fastest healthy node and fail over when a node errors or times out
+        selector = build_node_selector(environment.upper(), url)
+        print(selector.describe())
+        api = NodeRoutingApi(selector)
+    else:
+        api = get_api(url, **pool_settings_from_env())
+
+    token_manager = TokenManager(api, environment.upper(), api_access_id, api_access_key,
+                                 cache_file=os.getenv(f"TOKEN_CACHE_FILE", DEFAULT_TOKEN_CACHE_FILE),
+                                 token_ttl=int(os.getenv(f"TOKEN_TTL_SECONDS") or 3600),
+                                 refresh_margin=int(os.getenv(f"TOKEN_REFRESH_MARGIN_SECONDS") or 300))
+    if token_manager.cache_hits and token_manager.validate_cached_token():
+        print(f"Using cached Akeyless {environment} token")
+    else:
+        print(f"Authing to Akeyless {environment}")
     print("--" * 20)
-    auth_token = auth_api_key(api, api_access_id, api_access_key)
+    # Fail fast on bad credentials and keep the token fresh for the rest of the run
+    token_manager.token
+    token_manager.start_background_refresh()
 
-    return api, auth_token
+    return api, token_manager
 
 
 def auth_api_key(api, access_id, access_key) -> str:
@@ -71,17 +90,22 @@ def auth_api_key(api, access_id, access_key) -> str:
     return auth_response.token
 
 
+# Bulk loads call write_error from worker threads, so entries are written one at a time
+error_file_lock = threading.Lock()
+
+
 def write_error(error, message):
-    print(datetime.datetime.now())
-    print(f"An error occurred: {error}")
-    try:
-        with open("../errors.txt", "a") as f:
-            f.write(message)
-            f.write(f"Error: {error}\n")
-    except FileNotFoundError:
-        with open("../errors.txt", "w") as f:
-            f.write(message)
-            f.write(f"Error: {error}\n")
+    with error_file_lock:
+        print(datetime.datetime.now())
+        print(f"An error occurred: {error}")
+        try:
+            with open("../errors.txt", "a") as f:
+                f.write(message)
+                f.write(f"Error: {error}\n")
+        except FileNotFoundError:
+            with open("../errors.txt", "w") as f:
+                f.write(message)
+                f.write(f"Error: {error}\n")
 
 
 class AkeylessConfig:
@@ -94,12 +118,54 @@ class AkeylessConfig:
             env_options = ["UAT", "PROD"]
             self.env = create_input_prompt(env_options, "Select a number for the environment:")
 
-        self.api, self.auth_token = config_akeyless(self.env)
+        self.api, self.token_manager = config_akeyless(self.env)
         self.version = version
         self.is_testing = is_testing
         self.engineer = os.getenv(f"DEFAULT_ENGINEER") or self.choose_engineer(env_file)
         self.engineer_email = engineers[self.engineer]["email"]
         self.default_bulk_load_location = os.getenv(f"DEFAULT_LOCATION_BULK_FILE") or None
+        self.bulk_load_workers = int(os.getenv(f"DEFAULT_BULK_LOAD_WORKERS") or 8)
+        # Every api call goes through one governor that tunes how many requests are in flight. The worker count
+        # is the ceiling
+        self.concurrency_limiter = AdaptiveConcurrencyLimiter(
+            initial_limit=int(os.getenv(f"CONCURRENCY_INITIAL_LIMIT") or 4),
+            min_limit=int(os.getenv(f"CONCURRENCY_MIN_LIMIT") or 1),
+            max_limit=self.bulk_load_workers,
+            latency_target=float(os.getenv(f"CONCURRENCY_LATENCY_TARGET_SECONDS") or 2.0)
+        )
+        # Throttled and transient errors are retried outside the governor, so a backoff does not hold a slot
+        retry_budget = os.getenv(f"RETRY_BUDGET") or "500"
+        self.retry_policy = RetryPolicy(
+            max_attempts=int(os.getenv(f"RETRY_MAX_ATTEMPTS") or 4),
+            base_delay=float(os.getenv(f"RETRY_BASE_DELAY_SECONDS") or 0.5),
+            max_delay=float(os.getenv(f"RETRY_MAX_DELAY_SECONDS") or 10.0),
+            retry_budget=None if retry_budget.lower() == "none" else int(retry_budget)
+        )
+        self.node_selector = self.api.selector if isinstance(self.api, NodeRoutingApi) else None
+        self.api = RetryingApi(GovernedApi(self.api, self.concurrency_limiter), self.retry_policy)
+        # A 401 means the token was revoked or its access key rotated. Get a new one and send the call once more
+        self.api = ReauthenticatingApi(self.api, self.token_manager)
+        # Metrics are kept when they are served for scraping or saved when the run ends
+        self.metrics_file = os.getenv(f"METRICS_FILE") or None
+        self.metrics = None
+        self.metrics_server = None
+        if self.metrics_file or os.getenv(f"METRICS_PORT"):
+            self.metrics = api_metrics(self.token_manager, self.concurrency_limiter)
+            self.api = MeteredApi(self.api, self.metrics)
+            self.metrics_server = start_metrics_server(self.metrics)
+        if self.metrics_file:
+            atexit.register(self.save_metrics)
+        # Tracing is off unless a trace file is set. The tracer wraps the retries so a span covers every attempt
+        self.trace_file = os.getenv(f"TRACE_FILE") or None
+        self.tracer = Tracer() if self.trace_file else None
+        if self.tracer is not None:
+            self.api = TracedApi(self.api, self.tracer)
+            atexit.register(self.save_trace)
+        self.default_bulk_results_location = os.getenv(f"DEFAULT_LOCATION_BULK_RESULTS_FILE") or None
+        self.default_bulk_journal_location = os.getenv(f"DEFAULT_LOCATION_BULK_JOURNAL_FILE") or None
+        self.preflight_existence_check = \
+            (os.getenv(f"PREFLIGHT_EXISTENCE_CHECK") or "true").lower() not in ["false", "no", "0"]
+        self.existence_index = None
         self.default_k8s_cert_location = os.getenv(f"DEFAULT_LOCATION_K8s_CERT_FILE") or None
         self.debug = os.getenv(f"DEBUG") or False
         if self.debug:
@@ -113,6 +179,23 @@ class AkeylessConfig:
                              f"vaulted-by:automation-script:{self.version}",
                              support_tag]
 
+    @property
+    def auth_token(self):
+        return self.token_manager.token
+
+    def save_metrics(self):
+        try:
+            print(f"Metrics saved to {self.metrics.save(self.metrics_file)}")
+        except OSError as e:
+            print(f"Unable to save metrics to {self.metrics_file}: {e}")
+
+    def save_trace(self):
+        # Runs at exit, so a run that stops early or fails still leaves its trace
+        try:
+            print(f"Trace saved to {self.tracer.save(self.trace_file)}")
+        except OSError as e:
+            print(f"Unable to save the trace to {self.trace_file}: {e}")
+
     def choose_engineer(self, env_file):
         engineer_options = []
         for engineer in engineers:
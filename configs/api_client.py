@@ -0,0 +1,125 @@
+import os
+import socket
+import ssl
+import threading
+
+import certifi
+import urllib3
+from akeyless import ApiClient, Configuration, V2Api
+
+from configs.request_phases import enable_phase_timing
+
+# One pooled client per gateway host, shared by every caller in the process
+clients = {}
+clients_lock = threading.Lock()
+
+
+def pool_settings_from_env():
+    """
+    Read the connection pool settings from the environment
+
+    :return: Dictionary of keyword arguments for get_api
+    """
+    return {
+        "pool_size": int(os.getenv(f"API_POOL_SIZE") or 32),
+        "keep_alive": (os.getenv(f"API_KEEP_ALIVE") or "true").lower() not in ["false", "no", "0"],
+        "connect_timeout": float(os.getenv(f"API_CONNECT_TIMEOUT") or 10),
+        "read_timeout": float(os.getenv(f"API_READ_TIMEOUT") or 60),
+        "phase_timing": (os.getenv(f"API_PHASE_TIMING") or "false").lower() in ["true", "yes", "1"],
+    }
+
+
+def keep_alive_socket_options():
+    # Keep idle pooled sockets open through load balancers and firewalls that drop quiet connections
+    options = list(urllib3.connection.HTTPConnection.default_socket_options)
+    options.append((socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1))
+    for name, value in [("TCP_KEEPIDLE", 60), ("TCP_KEEPINTVL", 15), ("TCP_KEEPCNT", 4)]:
+        if hasattr(socket, name):
+            options.append((socket.IPPROTO_TCP, getattr(socket, name), value))
+    return options
+
+
+def build_pool_manager(configuration, pool_size, keep_alive, connect_timeout, read_timeout):
+    """
+    Build the urllib3 pool manager used by the api client. The pool blocks when all connections are busy instead of
+    opening throwaway connections, so parallel callers wait for and reuse the pooled sockets.
+    """
+    pool_args = {
+        "num_pools": 4,
+        "maxsize": pool_size,
+        "block": True,
+        "timeout": urllib3.Timeout(connect=connect_timeout, read=read_timeout),
+        "cert_reqs": ssl.CERT_REQUIRED if configuration.verify_ssl else ssl.CERT_NONE,
+        "ca_certs": configuration.ssl_ca_cert or certifi.where(),
+        "cert_file": configuration.cert_file,
+        "key_file": configuration.key_file,
+    }
+    if keep_alive:
+        pool_args["socket_options"] = keep_alive_socket_options()
+    if configuration.retries is not None:
+        pool_args["retries"] = configuration.retries
+
+    if configuration.proxy:
+        return urllib3.ProxyManager(proxy_url=configuration.proxy, proxy_headers=configuration.proxy_headers,
+                                    **pool_args)
+    return urllib3.PoolManager(**pool_args)
+
+
+def get_api(host, pool_size=32, keep_alive=True, connect_timeout=10, read_timeout=60, phase_timing=False):
+    """
+    Get the shared V2Api for a gateway host, creating it on first use. Later calls for the same host return the same
+    client no matter what settings they pass.
+
+    :param host: Gateway url, like https://api.secmgmt-uat.cvshealth.com
+    :param pool_size: Most connections kept open to the host. Set it to at least the number of parallel workers
+    :param keep_alive: Reuse connections between requests and send TCP keep-alives on idle ones
+    :param connect_timeout: Seconds to wait for a connection
+    :param read_timeout: Seconds to wait for a response
+    :param phase_timing: Record the DNS, connect, TLS, server and deserialize time of every request in
+                         configs.request_phases.phase_recorder
+    :return: api: V2Api using the pooled client
+    """
+    with clients_lock:
+        if host not in clients:
+            configuration = Configuration(host=host)
+            configuration.connection_pool_maxsize = pool_size
+
+            api_client = ApiClient(configuration)
+            if not keep_alive:
+                # The rest client sends its own headers on every request, so pool manager headers never reach the wire
+                api_client.set_default_header("Connection", "close")
+            api_client.rest_client.pool_manager = build_pool_manager(configuration, pool_size, keep_alive,
+                                                                     connect_timeout, read_timeout)
+            clients[host] = V2Api(api_client)
+            if phase_timing:
+                enable_phase_timing(clients[host])
+        return clients[host]
+
+
+def connection_stats(api):
+    """
+    Count requests and new connections made by a client to see how well connections are being reused
+
+    :param api: V2Api from get_api
+    :return: Dictionary with the number of requests, new connections and the share of requests that reused a
+             connection
+    """
+    pools = api.api_client.rest_client.pool_manager.pools
+    requests = 0
+    connections = 0
+    for key in pools.keys():
+        pool = pools.get(key)
+        if pool is not None:
+            requests += pool.num_requests
+            connections += pool.num_connections
+
+    reuse_ratio = 1 - connections / requests if requests else 0.0
+    return {"requests": requests, "connections": connections, "reuse_ratio": reuse_ratio}
+
+
+def close_clients():
+    with clients_lock:
+        for api in clients.values():
+            api.api_client.rest_client.pool_manager.clear()
+            api.api_client.close()
+        clients.clear()
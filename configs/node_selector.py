@@ -0,0 +1,213 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+from configs.api_client import get_api, pool_settings_from_env
+from toolkit.retry import ERROR_THROTTLE, ERROR_TRANSIENT, classify_error, is_connect_error, is_idempotent
+
+
+class NodeSelector:
+    """
+    Keeps a moving latency estimate and health for each gateway node and picks the fastest healthy one.
+
+    A node that errors or times out is taken out of rotation for failure_cooldown seconds. Health checks put nodes back
+    once they answer again. Health check latency is tracked on its own, since the health check path is much cheaper
+    than an api call and would pull the api latency estimate down.
+    """
+
+    def __init__(self, urls, alpha=0.3, failure_cooldown=30.0, health_check_path="/", health_check_timeout=5.0,
+                 pool_settings=None):
+        """
+        :param urls: Gateway urls to choose from, such as the load balancer and each node in {ENV}_BASE_URL_LIST
+        :param alpha: Weight of the newest sample in the moving latency estimate
+        :param failure_cooldown: Seconds a failed node is skipped for
+        :param health_check_path: Path requested on each node to check it is up
+        :param health_check_timeout: Seconds a health check may take
+        :param pool_settings: Keyword arguments for get_api. Read from the environment when left out
+        """
+        self.urls = list(dict.fromkeys(url for url in urls if url))
+        if not self.urls:
+            raise ValueError("No gateway urls to choose from")
+        self.alpha = alpha
+        self.failure_cooldown = failure_cooldown
+        self.health_check_path = health_check_path
+        self.health_check_timeout = health_check_timeout
+        self.pool_settings = pool_settings if pool_settings is not None else pool_settings_from_env()
+
+        self.lock = threading.Lock()
+        self.latency = {url: None for url in self.urls}
+        self.health_latency = {url: None for url in self.urls}
+        self.down_until = {url: 0.0 for url in self.urls}
+        self.requests = {url: 0 for url in self.urls}
+        self.failures = {url: 0 for url in self.urls}
+        self.failovers = 0
+        self.stop_event = threading.Event()
+        self.health_thread = None
+
+    def api(self, url):
+        return get_api(url, **self.pool_settings)
+
+    def is_healthy(self, url, now=None):
+        return self.down_until[url] <= (now if now is not None else time.monotonic())
+
+    def choose(self, exclude=()):
+        """
+        Pick the healthy node with the lowest api latency estimate. Nodes without an estimate yet are tried first so
+        every node gets measured. If every node is down, the one that comes back soonest is used rather than failing
+
+        :param exclude: Nodes already tried for this request
+        :return: url: Gateway url, or None if every node is excluded
+        """
+        with self.lock:
+            candidates = [url for url in self.urls if url not in exclude]
+            if not candidates:
+                return None
+            now = time.monotonic()
+            healthy = [url for url in candidates if self.is_healthy(url, now)]
+            if not healthy:
+                return min(candidates, key=lambda url: self.down_until[url])
+            return min(healthy, key=lambda url: -1 if self.latency[url] is None else self.latency[url])
+
+    def record(self, url, latency, failed=False):
+        with self.lock:
+            self.requests[url] += 1
+            if failed:
+                self.failures[url] += 1
+                self.down_until[url] = time.monotonic() + self.failure_cooldown
+                return
+            self.latency[url] = self.moving_average(self.latency[url], latency)
+            self.down_until[url] = 0.0
+
+    def record_health(self, url, latency, healthy):
+        with self.lock:
+            self.health_latency[url] = self.moving_average(self.health_latency[url], latency)
+            self.down_until[url] = 0.0 if healthy else time.monotonic() + self.failure_cooldown
+
+    def moving_average(self, average, latency):
+        return latency if average is None else self.alpha * latency + (1 - self.alpha) * average
+
+    def check_node(self, url):
+        """
+        Request the health check path on a node and record whether it is up and how long the check took. Any answer
+        below 500 means the node is up
+        """
+        pool_manager = self.api(url).api_client.rest_client.pool_manager
+        start_time = time.perf_counter()
+        try:
+            response = pool_manager.request("GET", url.rstrip("/") + self.health_check_path,
+                                            timeout=self.health_check_timeout, retries=False)
+            healthy = response.status < 500
+        except Exception:
+            healthy = False
+        self.record_health(url, time.perf_counter() - start_time, healthy)
+        return healthy
+
+    def health_check(self):
+        """
+        Check every node at the same time
+
+        :return: Dictionary of url to whether it is healthy
+        """
+        with ThreadPoolExecutor(max_workers=len(self.urls)) as executor:
+            return dict(zip(self.urls, executor.map(self.check_node, self.urls)))
+
+    def start_health_checks(self, interval=30.0):
+        if self.health_thread is not None:
+            return
+
+        def health_loop():
+            while not self.stop_event.wait(interval):
+                self.health_check()
+
+        self.health_thread = threading.Thread(target=health_loop, name="akeyless-node-health", daemon=True)
+        self.health_thread.start()
+
+    def stop_health_checks(self):
+        self.stop_event.set()
+        if self.health_thread is not None:
+            self.health_thread.join(timeout=5)
+            self.health_thread = None
+
+    def state(self):
+        with self.lock:
+            now = time.monotonic()
+            return [{
+                "url": url,
+                "healthy": self.is_healthy(url, now),
+                "latency_seconds": round(self.latency[url], 4) if self.latency[url] is not None else None,
+                "health_check_seconds":
+                    round(self.health_latency[url], 4) if self.health_latency[url] is not None else None,
+                "requests": self.requests[url],
+                "failures": self.failures[url],
+            } for url in self.urls]
+
+    def describe(self):
+        lines = [f"Gateway nodes ({self.failovers} failovers):"]
+        for node in sorted(self.state(), key=lambda node: (not node["healthy"], node["latency_seconds"] or 0)):
+            status = "healthy" if node["healthy"] else "down"
+            lines.append(f"\t{node['url']}: {status}, latency {node['latency_seconds']}s, health check "
+                         f"{node['health_check_seconds']}s, {node['requests']} requests, {node['failures']} failures")
+        return "\n".join(lines)
+
+
+class NodeRoutingApi:
+    """
+    Sends each V2Api call to the node picked by a NodeSelector and fails over to the next node when a node errors or
+    times out. Errors such as 404 or 409 are answers from a working node and are raised as they are. Calls that change
+    something only fail over when the connection could not be made, since a node that timed out may still have made
+    the change
+    """
+
+    def __init__(self, selector):
+        self.selector = selector
+
+    def __getattr__(self, name):
+        attribute = getattr(self.selector.api(self.selector.choose()), name)
+        if name.startswith("_") or not callable(attribute):
+            return attribute
+
+        @wraps(attribute)
+        def routed(*args, **kwargs):
+            tried = []
+            while True:
+                url = self.selector.choose(exclude=tried)
+                tried.append(url)
+                start_time = time.perf_counter()
+                try:
+                    result = getattr(self.selector.api(url), name)(*args, **kwargs)
+                except Exception as e:
+                    failed = classify_error(e) in [ERROR_THROTTLE, ERROR_TRANSIENT]
+                    self.selector.record(url, time.perf_counter() - start_time, failed=failed)
+                    can_fail_over = failed and (is_idempotent(name) or is_connect_error(e))
+                    if not can_fail_over or len(tried) >= len(self.selector.urls):
+                        raise
+                    with self.selector.lock:
+                        self.selector.failovers += 1
+                    continue
+                self.selector.record(url, time.perf_counter() - start_time)
+                return result
+
+        return routed
+
+
+def node_selection_enabled():
+    return (os.getenv(f"NODE_SELECTION") or "false").lower() in ["true", "yes", "1"]
+
+
+def build_node_selector(environment, load_balancer_url):
+    """
+    Build a NodeSelector over the load balancer and every node in {ENV}_BASE_URL_LIST, check each node once and start
+    the background health checks
+
+    :param environment: Environment name, such as UAT
+    :param load_balancer_url: The environment's load balancer url
+    """
+    node_urls = [url.strip() for url in (os.getenv(f"{environment}_BASE_URL_LIST") or "").split(",") if url.strip()]
+    selector = NodeSelector([load_balancer_url] + node_urls,
+                            failure_cooldown=float(os.getenv(f"NODE_FAILURE_COOLDOWN_SECONDS") or 30),
+                            health_check_path=os.getenv(f"NODE_HEALTH_CHECK_PATH") or "/")
+    selector.health_check()
+    selector.start_health_checks(float(os.getenv(f"NODE_HEALTH_CHECK_INTERVAL_SECONDS") or 30))
+    return selector
@@ -0,0 +1,202 @@
+import json
+import socket
+import threading
+import time
+from functools import wraps
+
+import urllib3
+
+from toolkit.latency_recorder import LatencyHistogram
+
+PHASES = ["dns", "connect", "tls", "server", "deserialize", "other", "total"]
+
+# Phases of the request running on each thread
+current = threading.local()
+
+
+def add_phase(phase, seconds):
+    phases = getattr(current, "phases", None)
+    if phases is not None:
+        phases[phase] = phases.get(phase, 0.0) + seconds
+
+
+class TimedConnectionMixin:
+    """
+    Splits opening a connection into DNS lookup, TCP connect and TLS handshake, and times how long the gateway takes
+    to answer once the request is sent
+    """
+
+    def _new_conn(self):
+        dns_host = self._dns_host
+        start_time = time.perf_counter()
+        try:
+            resolved = socket.getaddrinfo(dns_host, self.port, type=socket.SOCK_STREAM)[0][4][0]
+        except (socket.gaierror, IndexError):
+            # Let urllib3 resolve it again and raise its usual error
+            resolved = None
+        resolved_time = time.perf_counter()
+        add_phase("dns", resolved_time - start_time)
+
+        if resolved is not None:
+            self._dns_host = resolved
+        try:
+            sock = super()._new_conn()
+        finally:
+            self._dns_host = dns_host
+        connected_time = time.perf_counter()
+        add_phase("connect", connected_time - resolved_time)
+        current.new_conn_time = connected_time - start_time
+        return sock
+
+    def connect(self):
+        current.new_conn_time = 0.0
+        start_time = time.perf_counter()
+        super().connect()
+        if isinstance(self, urllib3.connection.HTTPSConnection):
+            add_phase("tls", time.perf_counter() - start_time - current.new_conn_time)
+
+    def request(self, *args, **kwargs):
+        # urllib3 only connects HTTPS connections before sending. Plain HTTP ones connect lazily while the request is
+        # written, so connect here first to keep the connect time out of the server phase
+        if self.sock is None:
+            self.connect()
+        current.sent_time = time.perf_counter()
+        return super().request(*args, **kwargs)
+
+    def getresponse(self, *args, **kwargs):
+        response = super().getresponse(*args, **kwargs)
+        sent_time = getattr(current, "sent_time", None)
+        if sent_time is not None:
+            add_phase("server", time.perf_counter() - sent_time)
+        return response
+
+
+class TimedHTTPConnection(TimedConnectionMixin, urllib3.connection.HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(TimedConnectionMixin, urllib3.connection.HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(urllib3.HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(urllib3.HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class PhaseRecorder:
+    """
+    Thread-safe aggregate of request phases, one histogram per endpoint and phase
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.new_connections = {}
+
+    def record(self, endpoint, phases):
+        with self.lock:
+            if "dns" in phases:
+                self.new_connections[endpoint] = self.new_connections.get(endpoint, 0) + 1
+            for phase in PHASES:
+                key = (endpoint, phase)
+                if key not in self.histograms:
+                    self.histograms[key] = LatencyHistogram()
+                self.histograms[key].record(phases.get(phase, 0.0))
+
+    def summary(self):
+        """
+        Phase timings for each endpoint
+
+        :return: List of dictionaries with endpoint, request count, new connections and the mean and p95 of each phase
+        """
+        with self.lock:
+            endpoints = sorted({endpoint for endpoint, _ in self.histograms})
+            rows = []
+            for endpoint in endpoints:
+                row = {"endpoint": endpoint, "count": self.histograms[(endpoint, "total")].count,
+                       "new_connections": self.new_connections.get(endpoint, 0)}
+                for phase in PHASES:
+                    histogram = self.histograms[(endpoint, phase)]
+                    row[f"{phase}_mean"] = histogram.mean()
+                    row[f"{phase}_p95"] = histogram.percentile(95)
+                rows.append(row)
+            return rows
+
+    def print_summary(self):
+        print("Request phases per endpoint (mean seconds)")
+        print(f"\t{'endpoint':<40}{'count':>7}{'new conn':>9}" + "".join(f"{phase:>12}" for phase in PHASES))
+        for row in self.summary():
+            phases = "".join(f"{row[f'{phase}_mean']:>12.4f}" for phase in PHASES)
+            print(f"\t{row['endpoint']:<40}{row['count']:>7}{row['new_connections']:>9}{phases}")
+        print("--" * 20)
+
+    def save(self, results_file):
+        with open(results_file, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+        return results_file
+
+
+# Shared by every client built with phase timing on
+phase_recorder = PhaseRecorder()
+
+
+def report_phases(results_file):
+    """
+    Print the shared phase timings and save them next to a latency results file, if phase timing is on
+
+    :param results_file: Latency results file, the phases are saved as <name>_phases.json
+    :return: The phases file, or None if nothing was recorded
+    """
+    if not phase_recorder.summary():
+        return None
+    phase_recorder.print_summary()
+    return phase_recorder.save(results_file.rsplit(".", 1)[0] + "_phases.json")
+
+
+def enable_phase_timing(api, recorder=None):
+    """
+    Record DNS, connect, TLS, server and deserialize time for every request made by an api client. Requests on a
+    reused connection have no DNS, connect or TLS time. "other" is the rest of the call: serializing the request,
+    reading the response body and SDK overhead
+
+    :param api: V2Api to instrument
+    :param recorder: PhaseRecorder to record into. Defaults to the shared phase_recorder
+    """
+    recorder = recorder if recorder is not None else phase_recorder
+    api_client = api.api_client
+    pool_manager = api_client.rest_client.pool_manager
+    pool_manager.clear()
+    pool_manager.pool_classes_by_scheme = {"http": TimedHTTPConnectionPool, "https": TimedHTTPSConnectionPool}
+
+    call_api = api_client.call_api
+    deserialize = api_client.deserialize
+
+    @wraps(deserialize)
+    def timed_deserialize(*args, **kwargs):
+        start_time = time.perf_counter()
+        try:
+            return deserialize(*args, **kwargs)
+        finally:
+            add_phase("deserialize", time.perf_counter() - start_time)
+
+    @wraps(call_api)
+    def timed_call_api(resource_path, *args, **kwargs):
+        current.phases = {}
+        current.sent_time = None
+        start_time = time.perf_counter()
+        try:
+            return call_api(resource_path, *args, **kwargs)
+        finally:
+            phases = current.phases
+            current.phases = None
+            phases["total"] = time.perf_counter() - start_time
+            phases["other"] = max(0.0, phases["total"] - sum(phases.get(phase, 0.0) for phase in PHASES[:5]))
+            recorder.record(resource_path, phases)
+
+    api_client.deserialize = timed_deserialize
+    api_client.call_api = timed_call_api
+    return recorder
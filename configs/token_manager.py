@@ -0,0 +1,234 @@
+import json
+import os
+import threading
+import time
+from functools import wraps
+
+from akeyless import ApiException, Auth, ValidateToken
+
+# Statuses the gateway answers with when a token was revoked, expired early or belongs to a rotated access key
+REJECTED_TOKEN_STATUSES = [401]
+
+DEFAULT_TOKEN_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".akeyless_onboarding", "token_cache.json")
+
+
+class TokenManager:
+    """
+    Owns the auth token for one environment and access id.
+
+    The token is cached on disk with its expiry so a new process reuses it instead of authenticating again, and a
+    background thread renews it before it expires so long bulk runs never send an expired token. Every worker reads
+    the same token through the thread-safe token property. The auth round trip happens outside self.lock, so workers
+    keep reading the current token while a new one is issued.
+    """
+
+    def __init__(self, api, environment, access_id, access_key, cache_file=DEFAULT_TOKEN_CACHE_FILE,
+                 token_ttl=3600, refresh_margin=300):
+        """
+        :param api: V2Api used to authenticate
+        :param environment: Environment the token is for, like UAT or PROD
+        :param access_id: API key access id
+        :param access_key: API key access key
+        :param cache_file: Location of the on-disk token cache. The cache is not used when empty or None
+        :param token_ttl: Seconds a token is assumed to be valid for when the auth response has no expiry
+        :param refresh_margin: Seconds before expiry that the background thread renews the token
+        """
+        self.api = api
+        self.environment = environment
+        self.access_id = access_id
+        self.access_key = access_key
+        self.cache_file = cache_file
+        self.cache_key = f"{environment}:{access_id}"
+        self.token_ttl = token_ttl
+        self.refresh_margin = refresh_margin
+        # Tokens with less time than this left are never handed out
+        self.minimum_validity = min(30, refresh_margin)
+
+        self.lock = threading.Lock()
+        # Held for the whole auth round trip so only one thread authenticates at a time
+        self.auth_lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.refresh_thread = None
+        self._token = None
+        self.expires_at = 0
+        self.refresh_count = 0
+        self.cache_hits = 0
+
+        self.load_cache()
+
+    @property
+    def token(self):
+        token = self.valid_token()
+        if token is not None:
+            return token
+        with self.auth_lock:
+            # Another worker may have authenticated while this one waited
+            token = self.valid_token()
+            if token is None:
+                token = self.authenticate()
+            return token
+
+    def valid_token(self):
+        with self.lock:
+            if self._token is None or time.time() >= self.expires_at - self.minimum_validity:
+                return None
+            return self._token
+
+    def invalidate(self, token=None):
+        """
+        Drop the current token so the next read authenticates again. Used when the gateway rejects the token.
+
+        :param token: The token that was rejected. Nothing happens if the token has already been replaced.
+        """
+        with self.lock:
+            if token is None or token == self._token:
+                self._token = None
+                self.expires_at = 0
+
+    def validate_cached_token(self):
+        """
+        Check a token loaded from the disk cache with the gateway and drop it if it was rejected, so a revoked token or
+        one issued for a rotated access key does not break every run until it expires
+
+        :return: False if the cached token was dropped
+        """
+        with self.lock:
+            token = self._token
+        if token is None or not self.cache_hits:
+            return True
+        try:
+            response = self.api.validate_token(ValidateToken(token=token))
+            valid = response.is_valid is not False
+        except ApiException as e:
+            # Anything but a rejection, such as a gateway without the endpoint, leaves the token to be tried as normal
+            valid = e.status not in REJECTED_TOKEN_STATUSES + [403]
+        if not valid:
+            print(f"Cached Akeyless {self.environment} token was rejected, authenticating again")
+            self.invalidate(token)
+        return valid
+
+    def authenticate(self):
+        # Callers hold self.auth_lock. The new token is only swapped in under self.lock once it has been issued
+        auth_body = Auth(
+            access_id=self.access_id,
+            access_key=self.access_key
+        )
+        auth_response = self.api.auth(auth_body)
+
+        expiry = auth_response.creds.expiry if auth_response.creds is not None else None
+        token = auth_response.token
+        expires_at = expiry if expiry else time.time() + self.token_ttl
+        with self.lock:
+            self._token = token
+            self.expires_at = expires_at
+            self.refresh_count += 1
+        self.save_cache(token, expires_at)
+        return token
+
+    def load_cache(self):
+        if not self.cache_file:
+            return
+        try:
+            with open(self.cache_file, "r") as f:
+                entry = json.load(f).get(self.cache_key)
+        except (FileNotFoundError, ValueError, AttributeError):
+            return
+
+        if entry and entry.get("expires_at", 0) > time.time() + self.refresh_margin:
+            self._token = entry["token"]
+            self.expires_at = entry["expires_at"]
+            self.cache_hits += 1
+
+    def save_cache(self, token, expires_at):
+        # Callers hold self.auth_lock, so only one thread writes the cache file at a time
+        if not self.cache_file:
+            return
+        try:
+            try:
+                with open(self.cache_file, "r") as f:
+                    cache = json.load(f)
+            except (FileNotFoundError, ValueError):
+                cache = {}
+            if not isinstance(cache, dict):
+                cache = {}
+
+            now = time.time()
+            cache = {key: entry for key, entry in cache.items() if entry.get("expires_at", 0) > now}
+            cache[self.cache_key] = {"token": token, "expires_at": expires_at}
+
+            # Write the new cache next to the old one and swap it in, so readers never see a partial file
+            os.makedirs(os.path.dirname(self.cache_file) or ".", exist_ok=True)
+            temp_file = f"{self.cache_file}.{os.getpid()}.tmp"
+            fd = os.open(temp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w") as f:
+                json.dump(cache, f)
+            os.replace(temp_file, self.cache_file)
+        except OSError as e:
+            print(f"Unable to write the token cache {self.cache_file}: {e}")
+
+    def start_background_refresh(self):
+        """
+        Start a daemon thread that renews the token refresh_margin seconds before it expires
+        """
+        if self.refresh_thread is not None and self.refresh_thread.is_alive():
+            return
+        self.stop_event.clear()
+        self.refresh_thread = threading.Thread(target=self.refresh_loop, name="akeyless-token-refresh", daemon=True)
+        self.refresh_thread.start()
+
+    def stop_background_refresh(self):
+        self.stop_event.set()
+        if self.refresh_thread is not None:
+            self.refresh_thread.join()
+            self.refresh_thread = None
+
+    def refresh_loop(self):
+        while not self.stop_event.is_set():
+            with self.lock:
+                wait = self.expires_at - self.refresh_margin - time.time()
+            if self.stop_event.wait(max(wait, 1)):
+                return
+
+            try:
+                with self.auth_lock:
+                    with self.lock:
+                        due = time.time() >= self.expires_at - self.refresh_margin
+                    if due:
+                        self.authenticate()
+            except Exception as e:
+                # Readers fall back to authenticating themselves once the token is about to expire
+                print(f"Background token refresh for {self.environment} failed: {e}")
+                self.stop_event.wait(30)
+
+
+class ReauthenticatingApi:
+    """
+    Wraps a V2Api so a call rejected with a 401 gets a new token from the TokenManager and is sent once more. The
+    rejected token is replaced in the manager and its disk cache, so every worker moves to the new one.
+    """
+
+    def __init__(self, api, token_manager):
+        self.api = api
+        self.token_manager = token_manager
+        self.reauthentications = 0
+
+    def __getattr__(self, name):
+        attribute = getattr(self.api, name)
+        if name.startswith("_") or not callable(attribute):
+            return attribute
+
+        @wraps(attribute)
+        def reauthenticating_call(*args, **kwargs):
+            try:
+                return attribute(*args, **kwargs)
+            except ApiException as e:
+                body = args[0] if args else kwargs.get("body")
+                token = getattr(body, "token", None)
+                if e.status not in REJECTED_TOKEN_STATUSES or not token:
+                    raise
+                self.token_manager.invalidate(token)
+                body.token = self.token_manager.token
+                self.reauthentications += 1
+                return attribute(*args, **kwargs)
+
+        return reauthenticating_call
@@ -1,14 +1,23 @@
+import argparse
+
 from create_resources.create_access_role import choose_role_option
-from create_resources.create_rotated_secret import choose_secret_option
+from create_resources.create_rotated_secret import choose_secret_option, get_bulk_load_csv
 from create_resources.create_auth_method import choose_auth_option
+from create_resources.onboarding_plan import apply_onboarding_plan, build_onboarding_plan, load_onboarding_plan, \
+    print_onboarding_plan, save_onboarding_plan
 from configs.akeyless_config import AkeylessConfig
+from configs.input_prompts import create_multiple_choice_prompt, get_comma_delineated_input
+from toolkit.existence_index import app_prefix, build_existence_index
 
-if __name__ == "__main__":
-    # Set-up API and Auth
-    akeyless_config = AkeylessConfig(".env")
 
+def onboard_interactively(akeyless_config):
     created_rotated_secrets, app_info = choose_secret_option(akeyless_config, True)
 
+    # List the app path once so auth methods and roles that already exist are not created again
+    if app_info and akeyless_config.preflight_existence_check:
+        build_existence_index(akeyless_config,
+                              [app_prefix(app_info['line_of_business'], app_info['app_team_name'], app_info['itpm'])])
+
     created_auth_methods = choose_auth_option(akeyless_config, app_info)
 
     created_access_roles = choose_role_option(akeyless_config, app_info, created_auth_methods)
@@ -55,3 +64,84 @@ if __name__ == "__main__":
         else:
             print(f"\t\tAlready exists: {role_path}")
 
+
+def choose_plan_inputs(akeyless_config):
+    bulk_load_csv = get_bulk_load_csv(akeyless_config)
+
+    auth_options = ["Azure-AD", "GCP", "AWS", "K8s (WIP)", "UID", "API-Key", "OIDC"]
+    prompt = "Select a number for the auth method types needed (comma separated):\n"
+    auth_types = create_multiple_choice_prompt(auth_options, prompt)
+
+    oidc_groups = None
+    if "OIDC" in auth_types:
+        prompt = f"Type the AD group names to add to the Sub Claims (comma separated): "
+        oidc_groups = ",".join(get_comma_delineated_input(prompt))
+
+    return bulk_load_csv, auth_types, oidc_groups
+
+
+def plan_onboarding(akeyless_config, plan_file):
+    bulk_load_csv, auth_types, oidc_groups = choose_plan_inputs(akeyless_config)
+    plan = build_onboarding_plan(akeyless_config, bulk_load_csv, auth_types, oidc_groups)
+    print_onboarding_plan(plan)
+    save_onboarding_plan(plan, plan_file)
+    print(f"Plan written to {plan_file}. Run with 'apply {plan_file}' to make these changes.")
+    return plan
+
+
+def apply_onboarding(akeyless_config, plan_file):
+    if plan_file:
+        plan = load_onboarding_plan(plan_file)
+        print_onboarding_plan(plan)
+    else:
+        bulk_load_csv, auth_types, oidc_groups = choose_plan_inputs(akeyless_config)
+        plan = build_onboarding_plan(akeyless_config, bulk_load_csv, auth_types, oidc_groups)
+        print_onboarding_plan(plan)
+
+    if not akeyless_config.is_testing:
+        check = input("Apply this plan? (y/n):\n")
+        print("--" * 20)
+        if check.lower() not in ["y", "ys", "ye", "es", "yes", ""]:
+            print("Exiting Program")
+            exit()
+
+    created = apply_onboarding_plan(akeyless_config, plan)
+
+    print(f"Created {len(created['secrets'])} secrets and {len(created['roles'])} roles")
+    for auth_method_path, auth_data in created["auth_methods"].items():
+        print(f"\t{auth_method_path}:")
+        if auth_data.get("is_new"):
+            for key in ["access_id", "uid_token", "access_key"]:
+                if auth_data.get(key) is not None:
+                    print(f"\t\t{key}: {auth_data[key]}")
+        else:
+            print(f"\t\tAlready exists")
+    if created["drift"]:
+        print(f"{len(created['drift'])} role associations already existed when applied and were not changed. "
+              f"Run plan again to see their sub claims:")
+        for association in created["drift"]:
+            print(f"\t! {association['role_path']} <- {association['auth_method_path']}")
+    return created
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Onboard an azure app's secrets, auth methods and access role")
+    subparsers = parser.add_subparsers(dest="mode")
+    plan_parser = subparsers.add_parser("plan", help="Show the changes an onboarding needs without making them")
+    plan_parser.add_argument("plan_file", nargs="?", default="onboarding_plan.json",
+                             help="Where to save the plan (default onboarding_plan.json)")
+    apply_parser = subparsers.add_parser("apply", help="Make only the changes in a plan")
+    apply_parser.add_argument("plan_file", nargs="?", default=None,
+                              help="Plan saved by the plan mode. A new plan is built when left out")
+    args = parser.parse_args()
+
+    # Set-up API and Auth
+    akeyless_config = AkeylessConfig(".env")
+
+    match args.mode:
+        case "plan":
+            plan_onboarding(akeyless_config, args.plan_file)
+        case "apply":
+            apply_onboarding(akeyless_config, args.plan_file)
+        case _:
+            onboard_interactively(akeyless_config)
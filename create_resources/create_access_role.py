@@ -1,24 +1,35 @@
-from akeyless import ApiException, CreateRole, SetRoleRule, AssocRoleAuthMethod
+from concurrent.futures import ThreadPoolExecutor
+
+from akeyless import ApiException, CreateRole, SetRoleRule, AssocRoleAuthMethod, GetRole
 
 from configs.akeyless_config import write_error, AkeylessConfig
-from configs.input_prompts import get_comma_delineated_input, create_multiple_choice_prompt
+from configs.input_prompts import get_comma_delineated_input, create_multiple_choice_prompt, get_input
+from toolkit.existence_index import already_exists, mark_created
+from toolkit.retry import classify_error, is_conflict
+from toolkit.tracing import traced
 
 auth_methods = ["/cvs/iam/asm/authmethod/taylor/asd"]
 
 rule_type_options = ['item-rule', 'auth-method-rule', 'role-rule']
 permission_options = ['read', 'list', 'create', 'update', 'delete']
 
+ROLE_RULE_WORKERS = 8
 
-def set_deny_rules(config, role_name):
-    deny_rules = {
-        'role-rule': ['/cvs/iam/asm/roles/admin/asm-admin'],
-        'item-rule': ['/cvs/iam/asm/keys/gateway/secretsmanager-gw-uat-dfckey'],
-        'auth-method-rule': ['/cvs/iam/asm/authmethod/certs/gateway/*'],
-    }
+# Deny rules every onboarded role gets
+DEFAULT_DENY_RULES = {
+    'role-rule': ['/cvs/iam/asm/roles/admin/asm-admin'],
+    'item-rule': ['/cvs/iam/asm/keys/gateway/secretsmanager-gw-uat-dfckey'],
+    'auth-method-rule': ['/cvs/iam/asm/authmethod/certs/gateway/*'],
+}
+OIDC_AUTH_METHOD_PATH = "/cvs/iam/asm/authmethod/oidc/pingid_sso_uat"
+
+
+def set_deny_rules(config, role_name, current_rules=None):
+    deny_rules = {rule_type: list(paths) for rule_type, paths in DEFAULT_DENY_RULES.items()}
     permissions = ['deny']
 
     if role_name is None:
-        role_name = get_comma_delineated_input("Role absolute path: ")
+        role_name = get_input("Role absolute path: ")
 
         prompt = "Select the numbers of the needed rule types (comma separated): "
         rule_types = create_multiple_choice_prompt(rule_type_options, prompt)
@@ -34,20 +45,21 @@ def set_deny_rules(config, role_name):
             permissions = create_multiple_choice_prompt(permission_options, prompt)
 
     # Add deny rules to role
+    rules = []
     for rule in deny_rules:
         for deny_path in deny_rules[rule]:
-            body = SetRoleRule(capability=permissions, path=deny_path, rule_type=rule,
-                               role_name=role_name, token=config.auth_token)
-            config.api.set_role_rule(body)
+            rules.append((rule, deny_path, permissions))
+    return apply_role_rules(config, role_name, rules, current_rules)
 
 
-def set_allow_rules(config, role_name, allow_path):
+def set_allow_rules(config, role_name, allow_path, current_rules=None):
     allow_rules = {
         'role-rule': [],
         'item-rule': [],
         'auth-method-rule': [],
     }
     permissions = ["read", "list"]
+    rules = []
 
     if allow_path is None:
         prompt = "Select the numbers of the rule types needed (comma separated): "
@@ -64,10 +76,7 @@ def set_allow_rules(config, role_name, allow_path):
                 if new_permissions:
                     permissions = new_permissions
                 allow_rules[rule_type].append([path, permissions])
-
-                body = SetRoleRule(capability=permissions, path=path, rule_type=rule_type,
-                                   role_name=role_name, token=config.auth_token)
-                config.api.set_role_rule(body)
+                rules.append((rule_type, path, permissions))
 
     else:
         role_name = role_name
@@ -76,9 +85,152 @@ def set_allow_rules(config, role_name, allow_path):
         # Add allow rules to role
         for rule in allow_rules:
             for allow_path in allow_rules[rule]:
-                body = SetRoleRule(capability=permissions, path=allow_path, rule_type=rule,
-                                   role_name=role_name, token=config.auth_token)
-                config.api.set_role_rule(body)
+                rules.append((rule, allow_path, permissions))
+
+    return apply_role_rules(config, role_name, rules, current_rules)
+
+
+def fetch_role(config, role_name):
+    """
+    Get a role with a single api call
+
+    :param config: Akeyless configuration for api and auth token
+    :param role_name: Absolute path of the role in akeyless
+    :return: role: The Role, or None if the role is not found
+    """
+    try:
+        return config.api.get_role(GetRole(name=role_name, token=config.auth_token))
+    except ApiException as e:
+        if e.status == 404:
+            return None
+        raise
+
+
+def role_rules(role):
+    current_rules = {}
+    if role is not None and role.rules is not None:
+        for path_rule in role.rules.path_rules or []:
+            current_rules[(path_rule.type, path_rule.path)] = set(path_rule.capabilities or [])
+    return current_rules
+
+
+def role_auth_methods(role):
+    if role is None:
+        return {}
+    return {assoc.auth_method_name: assoc.auth_method_sub_claims for assoc in role.role_auth_methods_assoc or []}
+
+
+def role_association_ids(role):
+    if role is None:
+        return {}
+    return {assoc.auth_method_name: assoc.assoc_id for assoc in role.role_auth_methods_assoc or []}
+
+
+def get_role_rules(config, role_name):
+    """
+    Get the rules a role has today with a single api call
+
+    :param config: Akeyless configuration for api and auth token
+    :param role_name: Absolute path of the role in akeyless
+    :return: current_rules: Dictionary of (rule_type, path) to the set of capabilities. Empty if the role is not found
+    """
+    return role_rules(fetch_role(config, role_name))
+
+
+def app_role_rules(app_info):
+    """
+    Rules the read-all role of an onboarded app should have
+
+    :param app_info: Dictionary with the line_of_business, app_team_name and itpm of the app
+    :return: List of (rule_type, path, capabilities)
+    """
+    rules = []
+    for rule_type, paths in DEFAULT_DENY_RULES.items():
+        for path in paths:
+            rules.append((rule_type, path, ['deny']))
+    rules.append(('item-rule', app_allow_path(app_info), ["read", "list"]))
+    return rules
+
+
+def app_role_path(app_info):
+    line_of_business = app_info['line_of_business']
+    app_team_name = app_info['app_team_name']
+    itpm = app_info['itpm']
+    return f"/cvs/{line_of_business}/{app_team_name}-{itpm}/roles/{app_team_name}-{itpm}-read-all"
+
+
+def app_allow_path(app_info):
+    return f"/cvs/{app_info['line_of_business']}/{app_info['app_team_name']}-{app_info['itpm']}/secrets/*"
+
+
+def plan_role_rules(current_rules, rules):
+    """
+    Work out which rules are missing from the role or have different capabilities
+
+    :param current_rules: Dictionary from get_role_rules
+    :param rules: List of (rule_type, path, capabilities) the role should have. Later entries for the same rule type
+                  and path replace earlier ones, the same way repeated set-role-rule calls would
+    :return: delta: List of (rule_type, path, capabilities) that need a set-role-rule call
+    """
+    wanted = {}
+    for rule_type, path, capabilities in rules:
+        wanted[(rule_type, path)] = list(capabilities)
+
+    delta = []
+    for (rule_type, path), capabilities in wanted.items():
+        if current_rules.get((rule_type, path)) != set(capabilities):
+            delta.append((rule_type, path, capabilities))
+    return delta
+
+
+def apply_role_rules(config, role_name, rules, current_rules=None, workers=ROLE_RULE_WORKERS):
+    """
+    Set only the rules the role is missing, in parallel, and report how many set-role-rule calls were saved
+
+    :param config: Akeyless configuration for api and auth token
+    :param role_name: Absolute path of the role in akeyless
+    :param rules: List of (rule_type, path, capabilities) the role should have
+    :param current_rules: Rules the role has today from get_role_rules. They are fetched when None
+    :param workers: Number of set-role-rule calls to send at the same time
+    :return: rule_data: Dictionary with the number of rules wanted, applied, failed and calls saved
+    """
+    if current_rules is None:
+        current_rules = get_role_rules(config, role_name)
+
+    delta = plan_role_rules(current_rules, rules)
+
+    def set_rule(rule):
+        rule_type, path, capabilities = rule
+        body = SetRoleRule(capability=capabilities, path=path, rule_type=rule_type,
+                           role_name=role_name, token=config.auth_token)
+        try:
+            config.api.set_role_rule(body)
+            return True
+        except ApiException as e:
+            msg = f"Role Path: {role_name}\nRule: {rule_type} {path} {capabilities}\n"
+            write_error(e, msg)
+            return False
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(set_rule, delta))
+
+    # Keep the caller's view of the role current so the next set of rules is planned against it
+    for (rule_type, path, capabilities), applied in zip(delta, results):
+        if applied:
+            current_rules[(rule_type, path)] = set(capabilities)
+
+    rule_data = {
+        "rules": len(rules),
+        "applied": results.count(True),
+        "failed": results.count(False),
+        "calls_saved": len(rules) - len(delta)
+    }
+    print(f"Role {role_name}: set {rule_data['applied']} of {len(rules)} rules, "
+          f"{rule_data['calls_saved']} already in place")
+    if rule_data["failed"]:
+        print(f"\t{rule_data['failed']} rules failed, see errors.txt")
+    print("--" * 20)
+    return rule_data
 
 
 def add_auth_methods(config, role_name, auth_methods=None):
@@ -87,7 +239,7 @@ def add_auth_methods(config, role_name, auth_methods=None):
         prompt = f"Type the Auth Method paths to attach to the Access Role '{role_name}' (comma separated): "
         response = get_comma_delineated_input(prompt)
         for val in response:
-            if val == "/cvs/iam/asm/authmethod/oidc/pingid_sso_uat":
+            if val == OIDC_AUTH_METHOD_PATH:
                 prompt = f"Type the AD group names for the Sub Claims (comma separated): "
                 groups = ",".join(get_comma_delineated_input(prompt))
                 sub_claim = {"groups": groups}
@@ -96,7 +248,7 @@ def add_auth_methods(config, role_name, auth_methods=None):
                 auth_methods[val] = {"auth_method_path": val, "sub_claims": None}
     for auth_method in auth_methods:
         if auth_method == "OIDC":
-            am_name = "/cvs/iam/asm/authmethod/oidc/pingid_sso_uat"
+            am_name = OIDC_AUTH_METHOD_PATH
         else:
             am_name = auth_methods[auth_method]["auth_method_path"]
             auth_methods[auth_method]["sub_claims"] = None
@@ -109,14 +261,16 @@ def add_auth_methods(config, role_name, auth_methods=None):
             if e.status == 404:
                 print("Auth Method not found. Please confirm path and try again. "
                       "Previous additions to the role persist and do not need to be repeated.")
-            elif e.status != 409:
+            elif not is_conflict(e):
                 print(e)
                 continue
 
 
 def set_auth_rules(config, role_path, allow_path, auth_methods):
-    set_deny_rules(config, role_path)
-    set_allow_rules(config, role_path, allow_path)
+    # Fetch the role's rules once and plan both sets of rules against them
+    current_rules = get_role_rules(config, role_path)
+    set_deny_rules(config, role_path, current_rules)
+    set_allow_rules(config, role_path, allow_path, current_rules)
     add_auth_methods(config, role_path, auth_methods)
 
 
@@ -132,12 +286,20 @@ def create_akeyless_role(config, role_path):
         role_path = input("Role absolute path: ")
         print("--" * 20)
 
+    if already_exists(config, role_path):
+        role_data = {
+            "role_path": role_path,
+            "is_new": False
+        }
+        return role_data
+
     try:
         body = CreateRole(token=config.auth_token,
                           name=role_path,
                           description=f"Created by {config.engineer}. Script version: {config.version}."
                           )
         config.api.create_role(body)
+        mark_created(config, role_path)
         role_data = {
             "role_path": role_path,
             "is_new": True
@@ -146,25 +308,21 @@ def create_akeyless_role(config, role_path):
     except ApiException as e:
         msg = f"Role Path: {role_path}\n"
         write_error(e, msg)
-        if e.status == 409:
+        if is_conflict(e):
             role_data = {
                 "role_path": role_path,
                 "is_new": False
             }
             return role_data
-        print("something else occurred")
-        print(f"e.status = {e.status}")
+        print(f"Failed to create {role_path}: {classify_error(e)} error, status {e.status}. See errors.txt")
         return None
 
 
+@traced("choose_role_option")
 def choose_role_option(config, app_info=None, auth_methods=None):
     if app_info:
-        line_of_business = app_info['line_of_business']
-        app_team_name = app_info['app_team_name']
-        itpm = app_info['itpm']
-        secret_name = app_info['secret_name']
-        path = f"/cvs/{line_of_business}/{app_team_name}-{itpm}/roles/{app_team_name}-{itpm}-read-all"
-        allow_path = f"/cvs/{line_of_business}/{app_team_name}-{itpm}/secrets/*"
+        path = app_role_path(app_info)
+        allow_path = app_allow_path(app_info)
     else:
         path = None
         allow_path = None
@@ -3,7 +3,10 @@ from akeyless import (ApiException, CreateAuthMethodAzureAD, CreateAuthMethodUni
 from configs.akeyless_config import write_error, AkeylessConfig
 from configs.input_prompts import create_input_prompt, create_multiple_choice_prompt, get_comma_delineated_input, \
     get_input
-from create_resources.create_access_role import add_auth_methods
+from create_resources.create_access_role import add_auth_methods, OIDC_AUTH_METHOD_PATH
+from toolkit.existence_index import already_exists, mark_created
+from toolkit.retry import classify_error, is_conflict
+from toolkit.tracing import traced
 
 
 def create_azure_ad_auth_method(config, auth_method_path):
@@ -23,6 +26,15 @@ def create_azure_ad_auth_method(config, auth_method_path):
         auth_method_path = input("Auth method path: ")
         print("--" * 20)
 
+    if already_exists(config, auth_method_path):
+        auth_data = {
+            "access_id": None,
+            "uid_token": None,
+            "auth_method_path": auth_method_path,
+            "is_new": False
+        }
+        return auth_data
+
     bound_resource_names = []
     bound_sub_id = []
     bound_spid = []
@@ -64,6 +76,7 @@ def create_azure_ad_auth_method(config, auth_method_path):
 
     try:
         response = config.api.create_auth_method_azure_ad(body)
+        mark_created(config, auth_method_path)
         auth_data = {
             "access_id": response.access_id,
             "uid_token": None,
@@ -74,7 +87,7 @@ def create_azure_ad_auth_method(config, auth_method_path):
     except ApiException as e:
         msg = f"Auth Path: {auth_method_path}\n"
         write_error(e, msg)
-        if e.status == 409:
+        if is_conflict(e):
             auth_data = {
                 "access_id": None,
                 "uid_token": None,
@@ -98,6 +111,16 @@ def create_api_auth_method(config, auth_method_path):
         auth_method_path = input("Auth method absolute path: ")
         print("--" * 20)
 
+    if already_exists(config, auth_method_path):
+        auth_data = {
+            "access_id": None,
+            "uid_token": None,
+            "access_key": None,
+            "auth_method_path": auth_method_path,
+            "is_new": False
+        }
+        return auth_data
+
     # Create UID auth body
     body = AuthMethodCreateApiKey(
         name=auth_method_path,
@@ -108,6 +131,7 @@ def create_api_auth_method(config, auth_method_path):
     # Create auth method and token
     try:
         response = config.api.auth_method_create_api_key(body)
+        mark_created(config, auth_method_path)
         access_id = response.access_id
         access_key = response.access_key
 
@@ -127,7 +151,7 @@ def create_api_auth_method(config, auth_method_path):
     except ApiException as e:
         msg = f"Auth Path: {auth_method_path}\n"
         write_error(e, msg)
-        if e.status == 409:
+        if is_conflict(e):
             auth_data = {
                 "access_id": None,
                 "uid_token": None,
@@ -136,8 +160,7 @@ def create_api_auth_method(config, auth_method_path):
                 "is_new": False
             }
             return auth_data
-        print("something else occurred")
-        print(f"e.status = {e.status}")
+        print(f"Failed to create {auth_method_path}: {classify_error(e)} error, status {e.status}. See errors.txt")
 
 
 def create_gcp_auth_method(config, auth_method_path):
@@ -153,6 +176,13 @@ def create_gcp_auth_method(config, auth_method_path):
         auth_method_path = input("Auth method absolute path: ")
         print("--" * 20)
 
+    if already_exists(config, auth_method_path):
+        auth_data = {
+            "auth_method_path": auth_method_path,
+            "is_new": False
+        }
+        return auth_data
+
     prompt = "Input the Google Project Names to allow access to (comma separated):"
     bound_projects = get_comma_delineated_input(prompt)
 
@@ -173,6 +203,7 @@ def create_gcp_auth_method(config, auth_method_path):
     # Create auth method and token
     try:
         response = config.api.auth_method_create_gcp(body)
+        mark_created(config, auth_method_path)
         access_id = response.access_id
 
         auth_data = {
@@ -189,14 +220,13 @@ def create_gcp_auth_method(config, auth_method_path):
     except ApiException as e:
         msg = f"Auth Path: {auth_method_path}\n"
         write_error(e, msg)
-        if e.status == 409:
+        if is_conflict(e):
             auth_data = {
                 "auth_method_path": auth_method_path,
                 "is_new": False
             }
             return auth_data
-        print("something else occurred")
-        print(f"e.status = {e.status}")
+        print(f"Failed to create {auth_method_path}: {classify_error(e)} error, status {e.status}. See errors.txt")
 
 
 def create_aws_auth_method(config, auth_method_path):
@@ -212,6 +242,13 @@ def create_aws_auth_method(config, auth_method_path):
         auth_method_path = input("Auth method absolute path: ")
         print("--" * 20)
 
+    if already_exists(config, auth_method_path):
+        auth_data = {
+            "auth_method_path": auth_method_path,
+            "is_new": False
+        }
+        return auth_data
+
     prompt = "Input the AWS Account ID(s) to allow access to (comma separated):"
     bound_accounts = get_comma_delineated_input(prompt)
 
@@ -226,6 +263,7 @@ def create_aws_auth_method(config, auth_method_path):
     # Create auth method and token
     try:
         response = config.api.auth_method_create_aws_iam(body)
+        mark_created(config, auth_method_path)
         access_id = response.access_id
 
         auth_data = {
@@ -242,14 +280,13 @@ def create_aws_auth_method(config, auth_method_path):
     except ApiException as e:
         msg = f"Auth Path: {auth_method_path}\n"
         write_error(e, msg)
-        if e.status == 409:
+        if is_conflict(e):
             auth_data = {
                 "auth_method_path": auth_method_path,
                 "is_new": False
             }
             return auth_data
-        print("something else occurred")
-        print(f"e.status = {e.status}")
+        print(f"Failed to create {auth_method_path}: {classify_error(e)} error, status {e.status}. See errors.txt")
 
 
 def create_k8s_auth_method(config, auth_method_path):
@@ -265,6 +302,15 @@ def create_k8s_auth_method(config, auth_method_path):
         auth_method_path = input("Auth method path: ")
         print("--" * 20)
 
+    if already_exists(config, auth_method_path):
+        auth_data = {
+            "access_id": None,
+            "uid_token": None,
+            "auth_method_path": auth_method_path,
+            "is_new": False
+        }
+        return auth_data
+
     k8s_cluster_api_types_options = ["Native K8s", "Rancher (WIP)"]
     prompt = "Select K8s cluster api type:\n"
     k8s_cluster_api_type = create_input_prompt(k8s_cluster_api_types_options, prompt)
@@ -324,6 +370,7 @@ def create_k8s_auth_method(config, auth_method_path):
 
     try:
         response = config.api.gateway_create_k8s_auth_config(body)
+        mark_created(config, auth_method_path)
         auth_data = {
             "access_id": response.access_id,
             "uid_token": None,
@@ -334,7 +381,7 @@ def create_k8s_auth_method(config, auth_method_path):
     except ApiException as e:
         msg = f"Auth Path: {auth_method_path}\n"
         write_error(e, msg)
-        if e.status == 409:
+        if is_conflict(e):
             auth_data = {
                 "access_id": None,
                 "uid_token": None,
@@ -358,6 +405,13 @@ def create_uid_auth_method(config, auth_method_path):
         auth_method_path = input("Auth method absolute path: ")
         print("--" * 20)
 
+    if already_exists(config, auth_method_path):
+        auth_data = {
+            "auth_method_path": auth_method_path,
+            "is_new": False
+        }
+        return auth_data
+
     # Create UID auth body
     body = CreateAuthMethodUniversalIdentity(
         name=auth_method_path,
@@ -375,6 +429,7 @@ def create_uid_auth_method(config, auth_method_path):
     # Create auth method and token
     try:
         response = config.api.create_auth_method_universal_identity(body)
+        mark_created(config, auth_method_path)
         access_id = response.access_id
 
         response = config.api.uid_generate_token(body2)
@@ -394,7 +449,7 @@ def create_uid_auth_method(config, auth_method_path):
 
         return auth_data
     except ApiException as e:
-        if e.status == 409:
+        if is_conflict(e):
             auth_data = {
                 "auth_method_path": auth_method_path,
                 "is_new": False
@@ -403,10 +458,19 @@ def create_uid_auth_method(config, auth_method_path):
         else:
             msg = f"Auth Path: {auth_method_path}\n"
             write_error(e, msg)
-            print("something else occurred")
-            print(f"e.status = {e.status}")
+            print(f"Failed to create {auth_method_path}: {classify_error(e)} error, status {e.status}. "
+                  f"See errors.txt")
 
 
+def app_auth_method_path(app_info, auth_type):
+    line_of_business = app_info['line_of_business']
+    app_team_name = app_info['app_team_name']
+    itpm = app_info['itpm']
+    return (f"/cvs/{line_of_business}/{app_team_name}-{itpm}/authmethod/{auth_type.lower()}/{app_team_name}-{itpm}-"
+            f"{auth_type.lower()}")
+
+
+@traced("choose_auth_option")
 def choose_auth_option(config, app_info):
     auth_options = ["Azure-AD", "GCP", "AWS", "K8s (WIP)", "UID", "API-Key", "OIDC"]
     prompt = "Select a number for the auth method types needed (comma separated):\n"
@@ -416,12 +480,7 @@ def choose_auth_option(config, app_info):
 
     for value in auth_methods:
         if app_info:
-            line_of_business = app_info['line_of_business']
-            app_team_name = app_info['app_team_name']
-            itpm = app_info['itpm']
-            secret_name = app_info['secret_name']
-            path = (f"/cvs/{line_of_business}/{app_team_name}-{itpm}/authmethod/{value.lower()}/{app_team_name}-{itpm}-"
-                    f"{value.lower()}")
+            path = app_auth_method_path(app_info, value)
         else:
             path = None
 
@@ -465,7 +524,7 @@ def choose_auth_option(config, app_info):
                 groups = ",".join(get_comma_delineated_input(prompt))
                 sub_claim = {"groups": groups}
                 auth = {
-                    "auth_method_path": "/cvs/iam/asm/authmethod/oidc/pingid_sso_uat",
+                    "auth_method_path": OIDC_AUTH_METHOD_PATH,
                     "is_new": False,
                     "sub_claims": sub_claim
                 }
@@ -482,6 +541,17 @@ def choose_auth_option(config, app_info):
     return auth_method_data
 
 
+# Auth method types that are created per app, keyed by the option shown in choose_auth_option
+auth_method_creators = {
+    "Azure-AD": create_azure_ad_auth_method,
+    "GCP": create_gcp_auth_method,
+    "AWS": create_aws_auth_method,
+    "K8s (WIP)": create_k8s_auth_method,
+    "UID": create_uid_auth_method,
+    "API-Key": create_api_auth_method,
+}
+
+
 if __name__ == "__main__":
     akeyless_config = AkeylessConfig("../.env")
 
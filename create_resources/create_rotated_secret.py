@@ -1,7 +1,26 @@
 import csv
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+
 from akeyless import ApiException, CreateRotatedSecret
 from configs.akeyless_config import AkeylessConfig, write_error
 from configs.input_prompts import create_input_prompt
+from toolkit.bulk_load_journal import BulkLoadJournal
+from toolkit.existence_index import already_exists, app_prefix, build_existence_index
+from toolkit.retry import is_conflict
+from toolkit.tracing import traced
+
+SECRET_CREATED = "created"
+SECRET_EXISTS = "already-exists"
+SECRET_FAILED = "failed"
+SECRET_SKIPPED = "already-loaded"
+
+RESULT_CSV_FIELDS = ["row", "secret_path", "status", "error", "app_team_name", "line_of_business", "itpm", "app_id",
+                     "row_hash"]
 
 
 def input_values(application_id="", tags="", description="", itpm="", app_team_name="", line_of_business="", secret_name=""):
@@ -30,37 +49,66 @@ def input_values(application_id="", tags="", description="", itpm="", app_team_n
     return application_id, secret_name, line_of_business, app_team_name, itpm, description, tags
 
 
-def azure_load(config, secret=None):
-    if secret is None:
-        application_id, secret_name, line_of_business, app_team_name, itpm, description, tags = input_values()
-        tags.extend(config.default_tags)
+def parse_secret_row(config, secret):
+    """
+    Build the secret values for a single row of the bulk load csv file
 
-        # Create secret path
+    :param config: Akeyless configuration for api and auth token
+    :param secret: A row of the bulk load csv file
+    :return: secret_info: Dictionary with the secret path, app info and the values used to create the secret
+    """
+    if secret[1].strip() == "":
+        secret_name = secret[2]
+        line_of_business = secret[3]
+        app_team_name = secret[4]
+        itpm = secret[5]
         secret_path = f"/cvs/{line_of_business}/{app_team_name}-{itpm}/secrets/azure/{secret_name}"
     else:
-        if secret[1].strip() == "":
-            secret_name = secret[2]
-            line_of_business = secret[3]
-            app_team_name = secret[4]
-            itpm = secret[5]
-            secret_path = f"/cvs/{line_of_business}/{app_team_name}-{itpm}/secrets/azure/{secret_name}"
-        else:
-            secret_path = f"{secret[1]}"
-            line_of_business = secret_path.split("/")[2]
-            app_team_name = secret_path.split("/")[3].split("-")[0]
-            itpm = secret_path.split("/")[3].split("-")[1]
-            secret_name = secret_path.split("/")[6]
-
-        description = secret[6]
-        application_id = secret[7]
-        tags = [f"owner1:{secret[8]}", f"owner2:{secret[9]}"]
-        tags.extend(config.default_tags)
-        if secret[10] not in [None, ""]:
-            tags.append(f"owner3:{secret[10]}")
+        secret_path = f"{secret[1]}"
+        line_of_business = secret_path.split("/")[2]
+        app_team_name = secret_path.split("/")[3].split("-")[0]
+        itpm = secret_path.split("/")[3].split("-")[1]
+        secret_name = secret_path.split("/")[6]
+
+    description = secret[6]
+    application_id = secret[7]
+    tags = [f"owner1:{secret[8]}", f"owner2:{secret[9]}"]
+    tags.extend(config.default_tags)
+    if secret[10] not in [None, ""]:
+        tags.append(f"owner3:{secret[10]}")
 
     if description.strip() == "":
-        description = (f"Default description - This secret belongs to the azure app {app_team_name.upper()}; App ID: "
-                       f"{application_id}. For support please contact {config.engineer_email}. Script version: {config.version}.")
+        description = default_description(config, app_team_name, application_id)
+
+    secret_info = {
+        "secret_path": secret_path,
+        "description": description,
+        "app_info": {
+            "app_team_name": app_team_name,
+            "app_id": application_id,
+            "line_of_business": line_of_business,
+            "tags": tags,
+            "itpm": itpm,
+            "secret_name": secret_name
+        }
+    }
+    return secret_info
+
+
+def default_description(config, app_team_name, application_id):
+    return (f"Default description - This secret belongs to the azure app {app_team_name.upper()}; App ID: "
+            f"{application_id}. For support please contact {config.engineer_email}. Script version: {config.version}.")
+
+
+def azure_load(config):
+    application_id, secret_name, line_of_business, app_team_name, itpm, description, tags = input_values()
+    tags.extend(config.default_tags)
+
+    # Create secret path
+    secret_path = f"/cvs/{line_of_business}/{app_team_name}-{itpm}/secrets/azure/{secret_name}"
+
+    if description.strip() == "":
+        description = default_description(config, app_team_name, application_id)
 
     if not config.is_testing:
         check = input(f"Are these values correct? (y/n):\n"
@@ -91,39 +139,405 @@ def azure_load(config, secret=None):
 
 
 def add_rotated_secret(config, secret_path, application_id, tags, description):
-    body = create_body(config, secret_path, application_id, tags, description)
+    status, error = submit_rotated_secret(config, secret_path, application_id, tags, description)
 
-    try:
-        config.api.create_rotated_secret(body)
+    if status == SECRET_CREATED:
         print(f"Successfully loaded {secret_path}")
         print("--" * 20)
         return secret_path
+    elif status == SECRET_EXISTS:
+        print(f"The secret {secret_path} already exists")
+        print("--" * 20)
+        return secret_path
+
+
+def submit_rotated_secret(config, secret_path, application_id, tags, description):
+    """
+    Send the create rotated secret request without any printing so it can be used from worker threads
+
+    :param config: Akeyless configuration for api and auth token
+    :param secret_path: Absolute path of the secret in akeyless
+    :param application_id: Azure application id the secret rotates for
+    :param tags: Tags to add to the secret
+    :param description: Description of the secret
+    :return: status, error: One of SECRET_CREATED, SECRET_EXISTS or SECRET_FAILED and the error if it failed
+    """
+    if already_exists(config, secret_path):
+        return SECRET_EXISTS, None
+
+    body = create_body(config, secret_path, application_id, tags, description)
+
+    # The new secret is not added to the existence index. Every row has its own secret path, so the index would
+    # only grow with the size of the csv file, and a repeated row is still caught by the 409 handling
+    try:
+        config.api.create_rotated_secret(body)
+        return SECRET_CREATED, None
     except ApiException as e:
-        if "Status 409 Conflict" in e.body:
-            print(f"The secret {secret_path} already exists")
-            print("--" * 20)
-            return secret_path
-        else:
-            msg = f"Secret Path: {secret_path}\n"
-            write_error(e, msg)
+        if is_conflict(e):
+            return SECRET_EXISTS, None
+        msg = f"Secret Path: {secret_path}\n"
+        write_error(e, msg)
+        return SECRET_FAILED, e
+    except Exception as e:
+        msg = f"Secret Path: {secret_path}\n"
+        write_error(e, msg)
+        return SECRET_FAILED, e
 
 
-def azure_bulk_load(config, secret_data):
+def get_bulk_load_csv(config):
     if config.default_bulk_load_location:
         bulk_load_csv = config.default_bulk_load_location
     else:
         bulk_load_csv = input(f"Input the absolute path of the csv file to upload: ").strip()
         print("--" * 20)
-    with open(bulk_load_csv, "r") as file:
+    return bulk_load_csv
+
+
+def azure_bulk_load(config, results_file=None):
+    """
+    Load the rows of the bulk load csv file one at a time. Uses the same read, validate and write stages as
+    azure_stream_bulk_load, so rows and results are never held in memory.
+
+    :param config: Akeyless configuration for api and auth token
+    :param results_file: Path of the results file. Defaults to config.default_bulk_results_location or a
+                         timestamped '.jsonl' file next to the csv file
+    :return: summary: Dictionary with the row counts per status, rows/sec, the results file and the app info of
+             the last row that loaded
+    """
+    return azure_stream_bulk_load(config, workers=1, results_file=results_file)
+
+
+def read_bulk_rows(bulk_load_csv):
+    """
+    Read the bulk load csv file one row at a time
+
+    :param bulk_load_csv: Path to the bulk load csv file
+    :return: Generator of (row_number, row) tuples. Data rows start on line 2 of the file
+    """
+    with open(bulk_load_csv, "r", newline="") as file:
         csv_reader = csv.reader(file)
-        headers = next(csv_reader)
-        for secret in csv_reader:
-            response, app_info = azure_load(config, secret)
-            if response is not None:
-                secret_data.append(response)
-    return secret_data, app_info
+        headers = next(csv_reader, None)
+        for row_number, secret in enumerate(csv_reader, start=2):
+            yield row_number, secret
+
+
+def normalize_rows(config, rows):
+    """
+    Turn csv rows into secret records. Rows that can not be parsed are passed on already marked as failed
+
+    :param config: Akeyless configuration for api and auth token
+    :param rows: Generator of (row_number, row) tuples from read_bulk_rows
+    :return: Generator of secret records with the row number, secret path, description, app info, status and error
+    """
+    for row_number, secret in rows:
+        record = {
+            "row": row_number,
+            "secret_path": None,
+            "description": None,
+            "app_info": None,
+            "status": None,
+            "error": None,
+            "row_hash": None
+        }
+        secret = [value.strip() for value in secret]
+        record["row_hash"] = BulkLoadJournal.row_hash(secret)
+        try:
+            secret_info = parse_secret_row(config, secret)
+            record.update(secret_info)
+        except (IndexError, ValueError) as e:
+            record["status"] = SECRET_FAILED
+            record["error"] = ValueError(f"Row {row_number} could not be parsed: {e}")
+        yield record
+
+
+def validate_rows(records):
+    """
+    Mark records missing the values needed to create the rotated secret as failed
+
+    :param records: Generator of secret records from normalize_rows
+    :return: Generator of the same secret records
+    """
+    for record in records:
+        if record["status"] is None:
+            app_info = record["app_info"]
+            missing = [key for key in ["app_id", "secret_name", "line_of_business", "app_team_name", "itpm"]
+                       if not app_info[key]]
+            if missing:
+                record["status"] = SECRET_FAILED
+                record["error"] = ValueError(f"Row {record['row']} is missing {', '.join(missing)}")
+            elif not record["secret_path"].startswith("/cvs/") or len(record["secret_path"].split("/")) != 7:
+                record["status"] = SECRET_FAILED
+                record["error"] = ValueError(f"Row {record['row']} has an invalid secret path "
+                                             f"{record['secret_path']}")
+        yield record
+
+
+def skip_journaled_rows(records, journal):
+    """
+    Mark records the journal already has as finished so they are not sent to akeyless again
+
+    :param records: Generator of secret records from validate_rows
+    :param journal: BulkLoadJournal from an earlier run of the same file
+    :return: Generator of the same secret records
+    """
+    for record in records:
+        if record["status"] is None and journal.is_complete(record["secret_path"], record["row_hash"]):
+            record["status"] = SECRET_SKIPPED
+        yield record
+
+
+def submit_rows(config, records, workers=None, journal=None):
+    """
+    Create the rotated secret for every valid record using a pool of worker threads that share the authenticated api.
+    Only a small window of records is in flight at a time, so memory stays flat no matter how big the file is.
+
+    :param config: Akeyless configuration for api and auth token
+    :param records: Generator of secret records from validate_rows
+    :param workers: Number of rows to load at the same time. Defaults to config.bulk_load_workers
+    :param journal: BulkLoadJournal to record every finished row in. Nothing is recorded when None
+    :return: Generator of results, in csv order, with the row number, secret path, status, error and app info
+    """
+    workers = workers or config.bulk_load_workers
+    window = workers * 2
+    in_flight = deque()
+
+    def load_record(record):
+        app_info = record["app_info"]
+        record["status"], record["error"] = submit_rotated_secret(config, record["secret_path"], app_info["app_id"],
+                                                                  app_info["tags"], record["description"])
+        if journal is not None:
+            journal.record(record["secret_path"], record["row_hash"], record["status"])
+        return record
+
+    def finish(item):
+        return item.result() if isinstance(item, Future) else item
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for record in records:
+            if record["status"] is not None:
+                if record["status"] == SECRET_FAILED:
+                    write_error(record["error"], f"CSV Row: {record['row']}\n")
+                in_flight.append(record)
+            else:
+                in_flight.append(executor.submit(load_record, record))
+
+            # Results come back in csv order, so wait on the oldest row once the window is full
+            while len(in_flight) >= window:
+                yield finish(in_flight.popleft())
+
+        while in_flight:
+            yield finish(in_flight.popleft())
+
+
+def write_results(results, results_file):
+    """
+    Write each result to the results file as soon as it is produced. The format is picked from the file extension,
+    '.csv' for csv and anything else for json lines.
+
+    :param results: Generator of results from submit_rows
+    :param results_file: Path of the file to write the results to
+    :return: Generator of the same results
+    """
+    with open(results_file, "w", newline="") as file:
+        if results_file.lower().endswith(".csv"):
+            writer = csv.DictWriter(file, fieldnames=RESULT_CSV_FIELDS)
+            writer.writeheader()
+            write = writer.writerow
+        else:
+            def write(row):
+                file.write(json.dumps(row) + "\n")
+
+        for result in results:
+            write(serialize_result(result, results_file.lower().endswith(".csv")))
+            file.flush()
+            yield result
+
+
+def serialize_result(result, flatten):
+    app_info = result["app_info"] or {}
+    if flatten:
+        return {
+            "row": result["row"],
+            "secret_path": result["secret_path"],
+            "status": result["status"],
+            "error": str(result["error"]) if result["error"] is not None else "",
+            "app_team_name": app_info.get("app_team_name", ""),
+            "line_of_business": app_info.get("line_of_business", ""),
+            "itpm": app_info.get("itpm", ""),
+            "app_id": app_info.get("app_id", ""),
+            "row_hash": result["row_hash"]
+        }
+    return {
+        "row": result["row"],
+        "secret_path": result["secret_path"],
+        "status": result["status"],
+        "error": str(result["error"]) if result["error"] is not None else None,
+        "app_info": result["app_info"],
+        "row_hash": result["row_hash"]
+    }
+
+
+def bulk_load_pipeline(config, bulk_load_csv, workers=None, results_file=None, journal=None):
+    """
+    Chain the bulk load stages together: read, normalize, validate, skip rows already in the journal, submit and
+    optionally write the results
+
+    :param config: Akeyless configuration for api and auth token
+    :param bulk_load_csv: Path to the bulk load csv file
+    :param workers: Number of rows to load at the same time. Defaults to config.bulk_load_workers
+    :param results_file: Path of the file to stream the results to. Results are not written when None
+    :param journal: BulkLoadJournal used to skip finished rows and record new ones. Not used when None
+    :return: Generator of results, in csv order
+    """
+    rows = read_bulk_rows(bulk_load_csv)
+    records = validate_rows(normalize_rows(config, rows))
+    if journal is not None:
+        records = skip_journaled_rows(records, journal)
+    results = submit_rows(config, records, workers, journal)
+    if results_file:
+        results = write_results(results, results_file)
+    return results
+
+
+def default_results_file(bulk_load_csv):
+    timestamp = datetime.now(timezone.utc).strftime('%Y-%m-%d_%H-%M-%S')
+    return f"{os.path.splitext(bulk_load_csv)[0]}_results_UTC_{timestamp}.jsonl"
+
+
+def default_journal_file(config, bulk_load_csv):
+    # The same csv file always maps to the same journal so a rerun picks up where the last one stopped
+    return config.default_bulk_journal_location or f"{os.path.splitext(bulk_load_csv)[0]}_journal.jsonl"
+
+
+def preflight_bulk_load(config, bulk_load_csv):
+    """
+    List every app path in the bulk load csv file once so secrets that already exist are skipped without a create
+    request. Only the distinct app paths are kept in memory.
+
+    :param config: Akeyless configuration for api and auth token
+    :param bulk_load_csv: Path to the bulk load csv file
+    """
+    if not config.preflight_existence_check:
+        return
+
+    prefixes = set()
+    for record in validate_rows(normalize_rows(config, read_bulk_rows(bulk_load_csv))):
+        if record["status"] is None:
+            app_info = record["app_info"]
+            prefixes.add(app_prefix(app_info["line_of_business"], app_info["app_team_name"], app_info["itpm"]))
+    build_existence_index(config, prefixes)
+
+
+def confirm_bulk_load(config, bulk_load_csv, workers):
+    if not config.is_testing:
+        check = input(f"Load the secrets in {bulk_load_csv} with {workers} workers? (y/n):\n")
+        print("--" * 20)
+        if check.lower() not in ["y", "ys", "ye", "es", "yes", ""]:
+            print("Exiting Program")
+            exit()
+
+
+def get_bulk_load_workers(config):
+    """
+    Ask how many rows to load at the same time. 1 loads one row at a time
+
+    :param config: Akeyless configuration for api and auth token
+    :return: workers: Number of rows to load at the same time. Defaults to config.bulk_load_workers
+    """
+    if config.is_testing:
+        return config.bulk_load_workers
+
+    while True:
+        workers = input(f"Number of rows to load at the same time, 1 loads one row at a time "
+                        f"(default {config.bulk_load_workers}):\n").strip()
+        if workers == "":
+            workers = str(config.bulk_load_workers)
+        if workers.isnumeric() and int(workers) > 0:
+            print("--" * 20)
+            return int(workers)
+        print(f'Invalid option. Please enter a whole number greater than 0. Input value was "{workers}"')
+        print("--" * 20)
+
+
+def azure_stream_bulk_load(config, workers=None, results_file=None):
+    """
+    Load every row of the bulk load csv file without holding the rows or results in memory. Each result is written
+    to the results file as soon as its row finishes.
+
+    :param config: Akeyless configuration for api and auth token
+    :param workers: Number of rows to load at the same time. Defaults to config.bulk_load_workers
+    :param results_file: Path of the results file. Defaults to config.default_bulk_results_location or a
+                         timestamped '.jsonl' file next to the csv file
+    :return: summary: Dictionary with the row counts per status, rows/sec, the results file and the app info of
+             the last row that loaded
+    """
+    workers = workers or config.bulk_load_workers
+    bulk_load_csv = get_bulk_load_csv(config)
+    results_file = results_file or config.default_bulk_results_location or default_results_file(bulk_load_csv)
+    confirm_bulk_load(config, bulk_load_csv, workers)
+    preflight_bulk_load(config, bulk_load_csv)
+
+    summary = new_bulk_load_summary()
+    summary["results_file"] = results_file
+    journal_file = default_journal_file(config, bulk_load_csv)
+    with BulkLoadJournal(journal_file) as journal:
+        for result in bulk_load_pipeline(config, bulk_load_csv, workers, results_file, journal):
+            count_result(summary, result)
+            if result["status"] != SECRET_FAILED:
+                summary["app_info"] = result["app_info"]
+    # Nothing is left to resume once every row has loaded. Removing the journal means a later run of the same file,
+    # for example after the secrets were deleted, sends every row again instead of skipping them all
+    if summary[SECRET_FAILED] == 0:
+        os.remove(journal_file)
+    print_bulk_load_summary(summary, config)
+
+    return summary
+
+
+def new_bulk_load_summary():
+    return {
+        "rows": 0,
+        SECRET_CREATED: 0,
+        SECRET_EXISTS: 0,
+        SECRET_FAILED: 0,
+        SECRET_SKIPPED: 0,
+        "start_time": time.perf_counter(),
+        "results_file": None,
+        "app_info": None
+    }
+
+
+def count_result(summary, result):
+    summary["rows"] += 1
+    summary[result["status"]] += 1
+    return result
+
+
+def print_bulk_load_summary(summary, config=None):
+    total_time = time.perf_counter() - summary["start_time"]
+    summary["rows_per_second"] = summary["rows"] / total_time if total_time > 0 else 0.0
+
+    print(f"Loaded {summary['rows']} rows in {total_time:.2f} seconds ({summary['rows_per_second']:.2f} rows/sec)")
+    print(f"\tCreated: {summary[SECRET_CREATED]}")
+    print(f"\tAlready exists: {summary[SECRET_EXISTS]}")
+    print(f"\tFailed: {summary[SECRET_FAILED]}")
+    if summary[SECRET_SKIPPED]:
+        print(f"\tSkipped, already loaded by an earlier run: {summary[SECRET_SKIPPED]}")
+    if summary["results_file"]:
+        print(f"\tResults written to {summary['results_file']}")
+    if config is not None and config.concurrency_limiter is not None:
+        summary["concurrency"] = config.concurrency_limiter.state()
+        print(f"\t{config.concurrency_limiter.describe()}")
+    if config is not None and config.retry_policy is not None:
+        summary["retries"] = config.retry_policy.stats()
+        print(f"\t{config.retry_policy.describe()}")
+    if config is not None and config.node_selector is not None:
+        summary["nodes"] = config.node_selector.state()
+        print(config.node_selector.describe())
+    print("--" * 20)
 
 
+@traced("choose_secret_option")
 def choose_secret_option(config, load_script):
     load_options = ["Single Secret Load", "Bulk Secret Load"]
     prompt = "Select a number for the load type:\n"
@@ -138,7 +552,9 @@ def choose_secret_option(config, load_script):
             if response is not None:
                 secret_data.append(response)
         case "Bulk Secret Load":
-            response, app_info = azure_bulk_load(config, secret_data)
+            # Bulk load results are only kept in the results file so huge files do not fill up memory
+            secret_data = None
+            app_info = azure_stream_bulk_load(config, get_bulk_load_workers(config))["app_info"]
         case _:
             print(f"Option {load_type} is not currently supported.")
 
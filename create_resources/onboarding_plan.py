@@ -0,0 +1,231 @@
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from akeyless import ApiException, AssocRoleAuthMethod, UpdateAssoc
+
+from configs.akeyless_config import write_error
+from create_resources.create_access_role import app_role_path, app_role_rules, apply_role_rules, create_akeyless_role, \
+    fetch_role, plan_role_rules, role_association_ids, role_auth_methods, role_rules, OIDC_AUTH_METHOD_PATH
+from create_resources.create_auth_method import app_auth_method_path, auth_method_creators
+from create_resources.create_rotated_secret import normalize_rows, read_bulk_rows, submit_rotated_secret, \
+    validate_rows, SECRET_FAILED
+from toolkit.existence_index import already_exists, app_prefix, build_existence_index
+from toolkit.retry import is_conflict
+from toolkit.tracing import traced
+
+
+def new_plan():
+    return {
+        "secrets": [],
+        "roles": [],
+        "auth_methods": [],
+        "associations": [],
+        "association_updates": [],
+        "rules": {},
+        "invalid_rows": [],
+        "unchanged": {"secrets": 0, "roles": 0, "auth_methods": 0, "associations": 0, "rules": 0}
+    }
+
+
+@traced("build_onboarding_plan")
+def build_onboarding_plan(config, bulk_load_csv, auth_types, oidc_groups=None):
+    """
+    Work out every create, association and rule change an onboarding run needs, without changing anything. Current
+    state is read with one listing per app path and one get-role call per app.
+
+    :param config: Akeyless configuration for api and auth token
+    :param bulk_load_csv: Path to the bulk load csv file with the secrets to onboard
+    :param auth_types: Auth method types to create for every app, from the options in choose_auth_option
+    :param oidc_groups: Comma separated AD groups to add as OIDC sub claims when "OIDC" is in auth_types
+    :return: plan: Dictionary of the secrets, roles and auth methods to create, the role associations to add or update
+             and the rule changes per role
+    """
+    plan = new_plan()
+    apps = {}
+    for record in validate_rows(normalize_rows(config, read_bulk_rows(bulk_load_csv))):
+        if record["status"] == SECRET_FAILED:
+            plan["invalid_rows"].append({"row": record["row"], "error": str(record["error"])})
+            continue
+        app_info = record["app_info"]
+        prefix = app_prefix(app_info["line_of_business"], app_info["app_team_name"], app_info["itpm"])
+        apps.setdefault(prefix, app_info)
+        plan["secrets"].append({
+            "secret_path": record["secret_path"],
+            "application_id": app_info["app_id"],
+            "tags": app_info["tags"],
+            "description": record["description"]
+        })
+
+    build_existence_index(config, apps.keys())
+
+    secrets = plan["secrets"]
+    plan["secrets"] = [secret for secret in secrets if not already_exists(config, secret["secret_path"])]
+    plan["unchanged"]["secrets"] = len(secrets) - len(plan["secrets"])
+
+    for prefix, app_info in apps.items():
+        role_path = app_role_path(app_info)
+        role = fetch_role(config, role_path) if already_exists(config, role_path) else None
+        if role is None:
+            plan["roles"].append(role_path)
+        else:
+            plan["unchanged"]["roles"] += 1
+
+        associated = role_auth_methods(role)
+        for auth_type in auth_types:
+            if auth_type == "OIDC":
+                sub_claims = {"groups": oidc_groups}
+                current_groups = (associated.get(OIDC_AUTH_METHOD_PATH) or {}).get("groups")
+                if current_groups is not None and set(current_groups) == set(oidc_groups.split(",")):
+                    plan["unchanged"]["associations"] += 1
+                elif OIDC_AUTH_METHOD_PATH in associated:
+                    # The role can only be associated with the OIDC auth method once, so change the groups in place
+                    plan["association_updates"].append({
+                        "role_path": role_path,
+                        "auth_method_path": OIDC_AUTH_METHOD_PATH,
+                        "assoc_id": role_association_ids(role)[OIDC_AUTH_METHOD_PATH],
+                        "sub_claims": sub_claims
+                    })
+                else:
+                    plan["associations"].append({"role_path": role_path, "auth_method_path": OIDC_AUTH_METHOD_PATH,
+                                                 "sub_claims": sub_claims})
+                continue
+
+            auth_method_path = app_auth_method_path(app_info, auth_type)
+            if already_exists(config, auth_method_path):
+                plan["unchanged"]["auth_methods"] += 1
+            else:
+                plan["auth_methods"].append({"auth_type": auth_type, "auth_method_path": auth_method_path})
+
+            if auth_method_path in associated:
+                plan["unchanged"]["associations"] += 1
+            else:
+                plan["associations"].append({"role_path": role_path, "auth_method_path": auth_method_path,
+                                             "sub_claims": None})
+
+        rules = app_role_rules(app_info)
+        delta = plan_role_rules(role_rules(role), rules)
+        plan["unchanged"]["rules"] += len(rules) - len(delta)
+        if delta:
+            plan["rules"][role_path] = [list(rule) for rule in delta]
+
+    return plan
+
+
+def print_onboarding_plan(plan):
+    print("Onboarding plan:")
+    print(f"\tSecrets to create: {len(plan['secrets'])}")
+    for secret in plan["secrets"]:
+        print(f"\t\t+ {secret['secret_path']}")
+    print(f"\tRoles to create: {len(plan['roles'])}")
+    for role_path in plan["roles"]:
+        print(f"\t\t+ {role_path}")
+    print(f"\tAuth methods to create: {len(plan['auth_methods'])}")
+    for auth_method in plan["auth_methods"]:
+        print(f"\t\t+ {auth_method['auth_method_path']} ({auth_method['auth_type']})")
+    print(f"\tRole associations to add: {len(plan['associations'])}")
+    for association in plan["associations"]:
+        sub_claims = f" with sub claims {association['sub_claims']}" if association["sub_claims"] else ""
+        print(f"\t\t+ {association['role_path']} <- {association['auth_method_path']}{sub_claims}")
+    association_updates = plan.get("association_updates", [])
+    if association_updates:
+        print(f"\tRole associations to update: {len(association_updates)}")
+        for association in association_updates:
+            print(f"\t\t~ {association['role_path']} <- {association['auth_method_path']} "
+                  f"with sub claims {association['sub_claims']}")
+    print(f"\tRole rules to set: {sum(len(rules) for rules in plan['rules'].values())}")
+    for role_path, rules in plan["rules"].items():
+        for rule_type, path, capabilities in rules:
+            print(f"\t\t~ {role_path}: {rule_type} {path} {capabilities}")
+    if plan["invalid_rows"]:
+        print(f"\tInvalid csv rows that will be skipped: {len(plan['invalid_rows'])}")
+        for invalid_row in plan["invalid_rows"]:
+            print(f"\t\t! {invalid_row['error']}")
+    unchanged = plan["unchanged"]
+    print(f"\tAlready in place: {unchanged['secrets']} secrets, {unchanged['roles']} roles, "
+          f"{unchanged['auth_methods']} auth methods, {unchanged['associations']} associations, "
+          f"{unchanged['rules']} rules")
+    print("--" * 20)
+
+
+def save_onboarding_plan(plan, plan_file):
+    with open(plan_file, "w") as f:
+        json.dump(plan, f, indent=2)
+
+
+def load_onboarding_plan(plan_file):
+    with open(plan_file, "r") as f:
+        return json.load(f)
+
+
+@traced("apply_onboarding_plan")
+def apply_onboarding_plan(config, plan, workers=None):
+    """
+    Make only the changes in the plan. Secrets, associations and rules are sent in parallel; auth methods are created
+    one at a time because some of them prompt for their limits.
+
+    :param config: Akeyless configuration for api and auth token
+    :param plan: Plan from build_onboarding_plan
+    :param workers: Number of requests to send at the same time. Defaults to config.bulk_load_workers
+    :return: created: Dictionary of the created secret paths, role data, auth method data, the associations added or
+             updated and the associations that changed since the plan was made
+    """
+    workers = workers or config.bulk_load_workers
+    created = {"secrets": [], "roles": [], "auth_methods": {}, "associations": [], "drift": []}
+
+    def create_secret(secret):
+        status, error = submit_rotated_secret(config, secret["secret_path"], secret["application_id"],
+                                              secret["tags"], secret["description"])
+        return secret["secret_path"], status
+
+    def associate(association):
+        body = AssocRoleAuthMethod(role_name=association["role_path"], am_name=association["auth_method_path"],
+                                   sub_claims=association["sub_claims"], token=config.auth_token)
+        try:
+            config.api.assoc_role_auth_method(body)
+            return association
+        except ApiException as e:
+            if is_conflict(e):
+                # Someone associated it after the plan was made, possibly with other sub claims
+                created["drift"].append(association)
+            else:
+                msg = f"Role Path: {association['role_path']}\nAuth Path: {association['auth_method_path']}\n"
+                write_error(e, msg)
+
+    def update_association(association):
+        body = UpdateAssoc(assoc_id=association["assoc_id"], sub_claims=association["sub_claims"],
+                           token=config.auth_token)
+        try:
+            config.api.update_assoc(body)
+            return association
+        except ApiException as e:
+            msg = f"Role Path: {association['role_path']}\nAuth Path: {association['auth_method_path']}\n"
+            write_error(e, msg)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for secret_path, status in executor.map(create_secret, plan["secrets"]):
+            if status != SECRET_FAILED:
+                created["secrets"].append(secret_path)
+
+    for role_path in plan["roles"]:
+        role_data = create_akeyless_role(config, role_path)
+        if role_data is not None:
+            created["roles"].append(role_data)
+
+    for auth_method in plan["auth_methods"]:
+        auth_data = auth_method_creators[auth_method["auth_type"]](config, auth_method["auth_method_path"])
+        if auth_data is not None:
+            created["auth_methods"][auth_method["auth_method_path"]] = auth_data
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for association in executor.map(associate, plan["associations"]):
+            if association is not None:
+                created["associations"].append(association)
+        for association in executor.map(update_association, plan.get("association_updates", [])):
+            if association is not None:
+                created["associations"].append(association)
+
+    for role_path, rules in plan["rules"].items():
+        # The plan already holds only the missing rules, so apply them against an empty view of the role
+        apply_role_rules(config, role_path, [tuple(rule) for rule in rules], current_rules={}, workers=workers)
+
+    return created
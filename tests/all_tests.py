@@ -1,3 +1,4 @@
+import json
 import unittest
 from unittest import skip
 
@@ -14,14 +15,16 @@ class AllTests(unittest.TestCase):
     def setUpClass(cls):
         cls.config = AkeylessConfig(".env", True)
         cls.role_path = "/cvs/iam/asm-ITPM0123456789/roles/script_test_role"
-        cls.secret_data = []
 
     # Executed once before each test in this class
     def setUp(self):
         pass
 
     def test_create_azure_rotated_secrets(self):
-        response, app_info = azure_bulk_load(self.config, self.secret_data)
+        summary = azure_bulk_load(self.config)
+        app_info = summary["app_info"]
+        with open(summary["results_file"], "r") as file:
+            response = [json.loads(line)["secret_path"] for line in file]
         self.assertEqual("asm", app_info['app_team_name'])
         self.assertEqual("f00913c3-0a8b-48a4-b9f6-30ed61626622", app_info['app_id'])
         self.assertEqual("iam", app_info['line_of_business'])
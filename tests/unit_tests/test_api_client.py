@@ -0,0 +1,70 @@
+import json
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from akeyless import Auth
+
+from configs.api_client import close_clients, connection_stats, get_api
+from toolkit.stand_in_server import StandInServer
+
+
+class AuthHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.dumps({"token": "t-123"}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ApiClientTests(unittest.TestCase):
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), AuthHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.host = f"http://127.0.0.1:{self.server.server_port}"
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        self.addCleanup(close_clients)
+
+    def test_one_client_per_host(self):
+        self.assertIs(get_api(self.host), get_api(self.host, pool_size=2))
+
+    def test_parallel_requests_reuse_pooled_connections(self):
+        api = get_api(self.host, pool_size=4)
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            tokens = list(executor.map(lambda i: api.auth(Auth(access_id="p-123", access_key="key")).token,
+                                       range(200)))
+
+        stats = connection_stats(api)
+        self.assertEqual(["t-123"] * 200, tokens)
+        self.assertEqual(200, stats["requests"])
+        self.assertLessEqual(stats["connections"], 4)
+        self.assertGreater(stats["reuse_ratio"], 0.9)
+
+    def test_keep_alive_off_closes_every_connection(self):
+        # The stand-in only closes the connection when the request carries 'Connection: close'
+        for keep_alive, connections in [(True, 1), (False, 5)]:
+            stand_in = StandInServer()
+            accepted = []
+            get_request = stand_in.server.get_request
+            stand_in.server.get_request = lambda: accepted.append(1) or get_request()
+            with stand_in:
+                api = get_api(stand_in.url, keep_alive=keep_alive)
+                for i in range(5):
+                    api.auth(Auth(access_id="p-123", access_key="key"))
+
+            self.assertEqual(connections, len(accepted))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,61 @@
+import os
+import unittest
+
+from toolkit.benchmarks import compare_to_baseline, run_benchmarks
+
+
+def make_results(throughput, p95, calibration_throughput=None, calibration_p95=None):
+    scenario = {"throughput": throughput, "p95": p95}
+    if calibration_throughput is not None:
+        scenario["relative_throughput"] = throughput / calibration_throughput
+        scenario["relative_p95"] = p95 / calibration_p95
+    return {"scenarios": {"secret_retrieval": scenario}}
+
+
+def regressions(results, baseline):
+    return compare_to_baseline(results, baseline, threshold=0.2, p95_threshold=0.2)
+
+
+class BenchmarkTests(unittest.TestCase):
+    def test_run_against_stand_in(self):
+        results = run_benchmarks(latency=0.001, scale=0.05, workers=4,
+                                 scenarios=["bulk_csv_concurrent_load", "role_rule_application", "secret_retrieval"])
+
+        scenarios = results["scenarios"]
+        self.assertEqual(scenarios["bulk_csv_concurrent_load"]["units"], 20)
+        self.assertEqual(scenarios["role_rule_application"]["units"], 8)
+        self.assertEqual(scenarios["secret_retrieval"]["units"], 25)
+        self.assertGreater(scenarios["secret_retrieval"]["throughput"], 0)
+        self.assertEqual(scenarios["secret_retrieval"]["api_calls"]["get_secret_value"]["errors"], 0)
+        self.assertEqual(results["calibration"]["units"], 5)
+        self.assertGreaterEqual(results["calibration"]["p95_spread"], 0)
+        self.assertGreater(scenarios["secret_retrieval"]["relative_throughput"], 0)
+        self.assertNotIn("UAT_LOAD_BALANCER_BASE_URL", os.environ)
+
+    def test_compare_to_baseline(self):
+        baseline = make_results(100.0, 0.010)
+
+        self.assertEqual(regressions(make_results(95.0, 0.011), baseline), [])
+        self.assertEqual(len(regressions(make_results(70.0, 0.011), baseline)), 1)
+        self.assertEqual(len(regressions(make_results(70.0, 0.020), baseline)), 2)
+
+    def test_compare_relative_to_calibration(self):
+        baseline = make_results(100.0, 0.010, calibration_throughput=200.0, calibration_p95=0.005)
+
+        # A machine half as fast is not a regression
+        self.assertEqual(regressions(make_results(50.0, 0.020, 100.0, 0.010), baseline), [])
+        self.assertEqual(len(regressions(make_results(100.0, 0.020, 200.0, 0.005), baseline)), 1)
+
+    def test_p95_threshold_follows_the_calibration_spread(self):
+        baseline = make_results(100.0, 0.010, calibration_throughput=200.0, calibration_p95=0.005)
+        results = make_results(100.0, 0.013, calibration_throughput=200.0, calibration_p95=0.005)
+
+        self.assertEqual(len(compare_to_baseline(results, baseline)), 0)
+        self.assertEqual(len(regressions(results, baseline)), 1)
+        # A noisy calibration in either run widens the threshold to its spread
+        baseline["calibration"] = {"p95_spread": 0.5}
+        self.assertEqual(regressions(results, baseline), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
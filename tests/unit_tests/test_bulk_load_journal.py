@@ -0,0 +1,57 @@
+import json
+import os
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from toolkit.bulk_load_journal import BulkLoadJournal
+
+
+class BulkLoadJournalTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.journal_file = os.path.join(self.temp_dir.name, "journal.jsonl")
+
+    def test_only_completed_rows_are_skipped(self):
+        with BulkLoadJournal(self.journal_file) as journal:
+            journal.record("/cvs/a", "hash-a", "created")
+            journal.record("/cvs/b", "hash-b", "already-exists")
+            journal.record("/cvs/c", "hash-c", "failed")
+            self.assertEqual(set(), journal.completed)
+
+        journal = BulkLoadJournal(self.journal_file)
+        self.addCleanup(journal.close)
+        self.assertTrue(journal.is_complete("/cvs/a", "hash-a"))
+        self.assertTrue(journal.is_complete("/cvs/b", "hash-b"))
+        self.assertFalse(journal.is_complete("/cvs/c", "hash-c"))
+        self.assertFalse(journal.is_complete("/cvs/a", "other-hash"))
+
+    def test_concurrent_writers_do_not_interleave(self):
+        with BulkLoadJournal(self.journal_file) as journal:
+            with ThreadPoolExecutor(max_workers=16) as executor:
+                list(executor.map(lambda i: journal.record(f"/cvs/{i}", str(i), "created"), range(2000)))
+
+        with open(self.journal_file, "r") as f:
+            entries = [json.loads(line) for line in f]
+        self.assertEqual(2000, len(entries))
+        self.assertEqual({f"/cvs/{i}" for i in range(2000)}, {entry["secret_path"] for entry in entries})
+
+    def test_partial_last_line_is_ignored(self):
+        with BulkLoadJournal(self.journal_file) as journal:
+            journal.record("/cvs/a", "hash-a", "created")
+        with open(self.journal_file, "a") as f:
+            f.write('{"secret_path": "/cvs/b", "row_ha')
+
+        with BulkLoadJournal(self.journal_file) as journal:
+            self.assertEqual(1, journal.skipped_lines)
+            self.assertTrue(journal.is_complete("/cvs/a", "hash-a"))
+            self.assertFalse(journal.is_complete("/cvs/b", "hash-b"))
+            journal.record("/cvs/b", "hash-b", "created")
+
+        with BulkLoadJournal(self.journal_file) as journal:
+            self.assertTrue(journal.is_complete("/cvs/b", "hash-b"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import base64
+import importlib.util
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from types import ModuleType
+from unittest import mock
+
+import akeyless
+
+SAMPLE_DIRECTORY = os.path.join(os.path.dirname(__file__), "..", "..", "akeyless_setup_scripts", "sample_scripts",
+                                "python")
+
+
+class FakeCloudId:
+    # Stands in for akeyless_cloud_id, which needs cloud credentials to generate an id
+    def generate(self):
+        return "cloud-id"
+
+    def generateAzure(self):
+        return "cloud-id"
+
+    def generateGcp(self, audience=None):
+        return "cloud-id"
+
+
+class FakeFernet:
+    # Stands in for cryptography's Fernet, which is an optional dependency of the samples
+    def __init__(self, key):
+        self.key = key
+
+    def encrypt(self, data):
+        return base64.b64encode(data[::-1])
+
+    def decrypt(self, token):
+        return base64.b64decode(token)[::-1]
+
+
+def load_sample(name):
+    cloud_id_module = ModuleType("akeyless_cloud_id")
+    cloud_id_module.CloudId = FakeCloudId
+    cloud_id_module.__version__ = "test"
+    with mock.patch.dict(sys.modules, {"akeyless_cloud_id": cloud_id_module}):
+        spec = importlib.util.spec_from_file_location(name, os.path.join(SAMPLE_DIRECTORY, f"{name}.py"))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    return module
+
+
+SAMPLES = [load_sample(name) for name in ["aws_cloud_id_sdk", "azure_cloud_id_sdk", "gcp_cloud_id_sdk"]]
+
+
+def make_api():
+    api = mock.Mock()
+    api.auth.side_effect = lambda body: akeyless.AuthOutput(token=f"t-{api.auth.call_count}")
+    api.rotated_secret_get_value.return_value = {"value": {"username": "app", "password": "secret"}}
+    return api
+
+
+def join_revalidate_threads():
+    for thread in [thread for thread in threading.enumerate() if thread.name == "akeyless-revalidate"]:
+        thread.join()
+
+
+class CloudIdConnectionTests(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(directory.name)
+        self.api = make_api()
+
+    def connect(self, sample, **kwargs):
+        with mock.patch.object(sample.AkeylessConnection, "setup_api", lambda connection: self.api):
+            return sample.AkeylessConnection("p-123", "/app/rotated/one", **kwargs)
+
+    def test_expired_token_is_renewed_and_the_request_sent_again(self):
+        for sample in SAMPLES:
+            with self.subTest(sample.__name__):
+                self.api = make_api()
+                connection = self.connect(sample)
+                self.api.rotated_secret_get_value.side_effect = [akeyless.ApiException(status=401),
+                                                                 {"value": "secret"}]
+
+                self.assertEqual(connection.get_rotated_secret_data(), "secret")
+                self.assertEqual(connection.auth_token, "t-2")
+                self.assertEqual(self.api.rotated_secret_get_value.call_args.args[0].token, "t-2")
+
+    def test_failed_background_refresh_backs_off(self):
+        os.mkdir("akeyless_error_logs")
+        for sample in SAMPLES:
+            fernet = mock.patch.multiple(sample, Fernet=FakeFernet, InvalidToken=ValueError)
+            with self.subTest(sample.__name__), fernet:
+                self.api = make_api()
+                cached = self.connect(sample, disk_cache_file=f"{sample.__name__}_secrets", disk_cache_key="key")
+                secret_data = cached.get_rotated_secret_data()
+
+                connection = self.connect(sample, disk_cache_file=f"{sample.__name__}_secrets", disk_cache_key="key",
+                                          disk_cache_fresh_seconds=0)
+                self.api.rotated_secret_get_value.side_effect = akeyless.ApiException(status=500)
+                log_error = mock.patch.object(connection, "log_error_for_akeyless",
+                                              wraps=connection.log_error_for_akeyless)
+                with mock.patch("builtins.print"), log_error as log_error_for_akeyless:
+                    for _ in range(3):
+                        self.assertEqual(connection.get_rotated_secret_data(), secret_data)
+                        join_revalidate_threads()
+
+                # Only the first request started a refresh, the next ones are inside the back off
+                self.assertEqual(self.api.rotated_secret_get_value.call_count, 2)
+                log_error_for_akeyless.assert_called_once()
+                self.assertGreater(connection.revalidate_retry_at, time.time())
+
+                # Once the back off has passed the next request refreshes again, and a success clears the back off
+                connection.revalidate_retry_at = 0
+                self.api.rotated_secret_get_value.side_effect = None
+                connection.get_rotated_secret_data()
+                join_revalidate_threads()
+                self.assertEqual(self.api.rotated_secret_get_value.call_count, 3)
+                self.assertEqual(connection.revalidate_failures, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from akeyless import ApiException
+
+from toolkit.concurrency import AdaptiveConcurrencyLimiter, GovernedApi, is_throttle_signal
+
+
+class AdaptiveConcurrencyLimiterTests(unittest.TestCase):
+    def test_limit_grows_while_healthy(self):
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=2, max_limit=4, latency_target=None)
+        for _ in range(20):
+            with limiter.slot():
+                pass
+        self.assertEqual(limiter.state()["limit"], 4)
+
+    def test_throttle_backs_off_once_per_cooldown(self):
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=8, max_limit=8, cooldown=60)
+        for _ in range(3):
+            with self.assertRaises(ApiException):
+                with limiter.slot():
+                    raise ApiException(status=429)
+        state = limiter.state()
+        self.assertEqual(state["limit"], 4)
+        self.assertEqual(state["throttles"], 3)
+        self.assertEqual(state["backoffs"], 1)
+
+    def test_conflicts_do_not_count_against_health(self):
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=1, max_limit=2, latency_target=None)
+        with self.assertRaises(ApiException):
+            with limiter.slot():
+                raise ApiException(status=409)
+        self.assertEqual(limiter.state()["error_rate"], 0.0)
+        self.assertFalse(is_throttle_signal(ApiException(status=409)))
+        self.assertTrue(is_throttle_signal(ApiException(status=503)))
+
+    def test_in_flight_never_exceeds_limit(self):
+        limiter = AdaptiveConcurrencyLimiter(initial_limit=2, max_limit=2)
+        active = []
+        peak = []
+        lock = threading.Lock()
+
+        def call():
+            with limiter.slot():
+                with lock:
+                    active.append(1)
+                    peak.append(len(active))
+                time.sleep(0.01)
+                with lock:
+                    active.pop()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(lambda _: call(), range(16)))
+        self.assertLessEqual(max(peak), 2)
+        self.assertEqual(limiter.state()["in_flight"], 0)
+
+    def test_governed_api_wraps_calls(self):
+        api = mock.Mock()
+        api.create_secret.return_value = "ok"
+        limiter = AdaptiveConcurrencyLimiter()
+        governed = GovernedApi(api, limiter)
+
+        self.assertEqual(governed.create_secret("body"), "ok")
+        api.create_secret.assert_called_once_with("body")
+        self.assertEqual(limiter.state()["successes"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from akeyless import ApiException, Role, Rules, PathRule
+
+from create_resources.create_access_role import apply_role_rules, get_role_rules, plan_role_rules, set_auth_rules
+
+ROLE = "/cvs/iam/asm-ITPM0123456789/roles/asm-ITPM0123456789-read-all"
+ALLOW_PATH = "/cvs/iam/asm-ITPM0123456789/secrets/*"
+
+
+def make_config(path_rules):
+    api = mock.Mock()
+    api.get_role.return_value = Role(role_name=ROLE, rules=Rules(path_rules=path_rules))
+    return SimpleNamespace(api=api, auth_token="t-123")
+
+
+class RoleRulePlannerTests(unittest.TestCase):
+    def test_plan_only_includes_missing_or_changed_rules(self):
+        current_rules = {
+            ("item-rule", "/cvs/a/*"): {"read", "list"},
+            ("item-rule", "/cvs/b/*"): {"read"},
+        }
+        rules = [
+            ("item-rule", "/cvs/a/*", ["list", "read"]),
+            ("item-rule", "/cvs/b/*", ["read", "list"]),
+            ("role-rule", "/cvs/c", ["deny"]),
+        ]
+
+        delta = plan_role_rules(current_rules, rules)
+
+        self.assertEqual([("item-rule", "/cvs/b/*", ["read", "list"]), ("role-rule", "/cvs/c", ["deny"])], delta)
+
+    def test_existing_rules_are_not_sent_again(self):
+        config = make_config([
+            PathRule(type="role-rule", path="/cvs/iam/asm/roles/admin/asm-admin", capabilities=["deny"]),
+            PathRule(type="item-rule", path="/cvs/iam/asm/keys/gateway/secretsmanager-gw-uat-dfckey",
+                     capabilities=["deny"]),
+            PathRule(type="auth-method-rule", path="/cvs/iam/asm/authmethod/certs/gateway/*",
+                     capabilities=["deny"]),
+            PathRule(type="item-rule", path=ALLOW_PATH, capabilities=["read", "list"]),
+        ])
+
+        set_auth_rules(config, ROLE, ALLOW_PATH, {})
+
+        config.api.get_role.assert_called_once()
+        config.api.set_role_rule.assert_not_called()
+
+    def test_missing_rules_are_applied_and_counted(self):
+        config = make_config([PathRule(type="role-rule", path="/cvs/r", capabilities=["deny"])])
+        rules = [("role-rule", "/cvs/r", ["deny"]), ("item-rule", "/cvs/a/*", ["read"]),
+                 ("item-rule", "/cvs/b/*", ["read"])]
+
+        rule_data = apply_role_rules(config, ROLE, rules)
+
+        self.assertEqual({"rules": 3, "applied": 2, "failed": 0, "calls_saved": 1}, rule_data)
+        self.assertEqual({"/cvs/a/*", "/cvs/b/*"},
+                         {call.args[0].path for call in config.api.set_role_rule.call_args_list})
+
+    @mock.patch("create_resources.create_access_role.write_error")
+    def test_failed_rules_are_reported(self, write_error):
+        config = make_config([])
+        config.api.set_role_rule.side_effect = ApiException(status=500, reason="Internal Server Error")
+
+        rule_data = apply_role_rules(config, ROLE, [("item-rule", "/cvs/a/*", ["read"])])
+
+        self.assertEqual(1, rule_data["failed"])
+        write_error.assert_called_once()
+
+    def test_missing_role_has_no_rules(self):
+        config = make_config([])
+        config.api.get_role.side_effect = ApiException(status=404, reason="Not Found")
+
+        self.assertEqual({}, get_role_rules(config, ROLE))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,255 @@
+import csv
+import json
+import os
+import tempfile
+import time
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from akeyless import ApiException
+
+from create_resources.create_rotated_secret import azure_bulk_load, azure_stream_bulk_load, choose_secret_option, \
+    SECRET_CREATED, SECRET_EXISTS, SECRET_FAILED, SECRET_SKIPPED
+from toolkit.existence_index import ExistenceIndex
+
+BULK_LOAD_CSV = os.path.join(os.path.dirname(os.path.dirname(__file__)), "test_bulk_load.csv")
+
+
+def make_config(api, journal_file):
+    return SimpleNamespace(
+        api=api,
+        auth_token="t-123",
+        env="UAT",
+        version="test",
+        engineer_email="engineer@email.com",
+        default_tags=["csp:azure"],
+        default_bulk_load_location=BULK_LOAD_CSV,
+        bulk_load_workers=4,
+        default_bulk_results_location=None,
+        default_bulk_journal_location=journal_file,
+        preflight_existence_check=False,
+        concurrency_limiter=None,
+        retry_policy=None,
+        node_selector=None,
+        existence_index=None,
+        is_testing=True
+    )
+
+
+def read_results(results_file):
+    with open(results_file, "r") as file:
+        return [json.loads(line) for line in file]
+
+
+class BulkLoadTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.journal_file = os.path.join(self.temp_dir.name, "journal.jsonl")
+        self.results_file = os.path.join(self.temp_dir.name, "results.jsonl")
+
+    def test_results_are_in_csv_order(self):
+        api = mock.Mock()
+        config = make_config(api, self.journal_file)
+
+        summary = azure_stream_bulk_load(config, workers=2, results_file=self.results_file)
+
+        results = read_results(self.results_file)
+        self.assertEqual(2, summary[SECRET_CREATED])
+        self.assertEqual([2, 3], [result["row"] for result in results])
+        self.assertEqual("/cvs/iam/asm-ITPM0123456789/secrets/azure/script_test_azure_secret",
+                         results[0]["secret_path"])
+        self.assertEqual("/cvs/iam/asm-ITPM0123456789/secrets/azure/script_test_azure_secret_2",
+                         results[1]["secret_path"])
+        self.assertEqual([SECRET_CREATED, SECRET_CREATED], [result["status"] for result in results])
+        self.assertEqual("asm", results[1]["app_info"]["app_team_name"])
+        self.assertEqual(2, api.create_rotated_secret.call_count)
+
+    def test_created_rows_are_not_added_to_the_existence_index(self):
+        api = mock.Mock()
+        config = make_config(api, self.journal_file)
+        config.existence_index = ExistenceIndex()
+
+        azure_stream_bulk_load(config, workers=2, results_file=self.results_file)
+
+        self.assertEqual(2, api.create_rotated_secret.call_count)
+        self.assertEqual(set(), config.existence_index.paths)
+
+    @mock.patch("create_resources.create_rotated_secret.write_error")
+    def test_conflict_and_failure_statuses(self, write_error):
+        conflict = ApiException(status=409, reason="Conflict")
+        failure = ApiException(status=500, reason="Internal Server Error")
+
+        def create_rotated_secret(body):
+            if body.name.endswith("_2"):
+                raise failure
+            raise conflict
+
+        api = mock.Mock()
+        api.create_rotated_secret.side_effect = create_rotated_secret
+        config = make_config(api, self.journal_file)
+
+        azure_stream_bulk_load(config, results_file=self.results_file)
+
+        results = read_results(self.results_file)
+        self.assertEqual(SECRET_EXISTS, results[0]["status"])
+        self.assertEqual(SECRET_FAILED, results[1]["status"])
+        self.assertEqual(str(failure), results[1]["error"])
+        write_error.assert_called_once()
+
+    def test_bulk_load_sends_one_row_at_a_time(self):
+        in_flight = []
+        most_in_flight = []
+
+        def create_rotated_secret(body):
+            in_flight.append(body.name)
+            time.sleep(0.05)
+            most_in_flight.append(len(in_flight))
+            in_flight.remove(body.name)
+
+        api = mock.Mock()
+        api.create_rotated_secret.side_effect = create_rotated_secret
+        config = make_config(api, self.journal_file)
+
+        summary = azure_bulk_load(config, results_file=self.results_file)
+
+        self.assertEqual([1, 1], most_in_flight)
+        self.assertEqual(2, summary[SECRET_CREATED])
+        self.assertEqual("asm", summary["app_info"]["app_team_name"])
+        self.assertEqual([2, 3], [result["row"] for result in read_results(self.results_file)])
+
+
+class StreamBulkLoadTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.journal_file = os.path.join(self.temp_dir.name, "journal.jsonl")
+
+    def write_csv(self, rows):
+        bulk_load_csv = os.path.join(self.temp_dir.name, "bulk_load.csv")
+        with open(BULK_LOAD_CSV, "r", newline="") as file:
+            headers = next(csv.reader(file))
+        with open(bulk_load_csv, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(headers)
+            writer.writerows(rows)
+        return bulk_load_csv
+
+    @mock.patch("create_resources.create_rotated_secret.write_error")
+    def test_results_are_streamed_to_jsonl(self, write_error):
+        rows = [["azure", "", f"secret_{i}", "iam", "asm", "ITPM0123456789", "", "app-id", "o1", "o2", ""]
+                for i in range(25)]
+        rows.append(["azure", "", "no_app_id", "iam", "asm", "ITPM0123456789", "", "", "o1", "o2", ""])
+        rows.append(["azure", "/cvs/bad-path"])
+        api = mock.Mock()
+        config = make_config(api, self.journal_file)
+        config.default_bulk_load_location = self.write_csv(rows)
+        results_file = os.path.join(self.temp_dir.name, "results.jsonl")
+
+        summary = azure_stream_bulk_load(config, workers=3, results_file=results_file)
+
+        with open(results_file, "r") as file:
+            results = [json.loads(line) for line in file]
+        self.assertEqual(list(range(2, 29)), [result["row"] for result in results])
+        self.assertEqual("/cvs/iam/asm-ITPM0123456789/secrets/azure/secret_24", results[24]["secret_path"])
+        self.assertEqual("secret_24", results[24]["app_info"]["secret_name"])
+        self.assertEqual(SECRET_FAILED, results[25]["status"])
+        self.assertIn("app_id", results[25]["error"])
+        self.assertEqual(SECRET_FAILED, results[26]["status"])
+        self.assertEqual(27, summary["rows"])
+        self.assertEqual(25, summary[SECRET_CREATED])
+        self.assertEqual(2, summary[SECRET_FAILED])
+        self.assertEqual(25, api.create_rotated_secret.call_count)
+        self.assertEqual(2, write_error.call_count)
+
+    def test_results_are_streamed_to_csv(self):
+        api = mock.Mock()
+        config = make_config(api, self.journal_file)
+        results_file = os.path.join(self.temp_dir.name, "results.csv")
+
+        azure_stream_bulk_load(config, results_file=results_file)
+
+        with open(results_file, "r", newline="") as file:
+            results = list(csv.DictReader(file))
+        self.assertEqual(["2", "3"], [result["row"] for result in results])
+        self.assertEqual([SECRET_CREATED, SECRET_CREATED], [result["status"] for result in results])
+        self.assertEqual("ITPM0123456789", results[1]["itpm"])
+
+    @mock.patch("create_resources.create_rotated_secret.write_error")
+    def test_resumed_run_skips_journaled_rows(self, write_error):
+        rows = [["azure", "", f"secret_{i}", "iam", "asm", "ITPM0123456789", "", "app-id", "o1", "o2", ""]
+                for i in range(10)]
+
+        def create_rotated_secret(body):
+            if body.name.endswith("_7"):
+                raise ApiException(status=503, reason="Service Unavailable")
+
+        api = mock.Mock()
+        api.create_rotated_secret.side_effect = create_rotated_secret
+        config = make_config(api, self.journal_file)
+        config.default_bulk_load_location = self.write_csv(rows)
+
+        first = azure_stream_bulk_load(config, workers=4, results_file=os.path.join(self.temp_dir.name, "1.jsonl"))
+        api.create_rotated_secret.reset_mock(side_effect=True)
+        second = azure_stream_bulk_load(config, workers=4, results_file=os.path.join(self.temp_dir.name, "2.jsonl"))
+
+        self.assertEqual(1, first[SECRET_FAILED])
+        self.assertEqual(9, second[SECRET_SKIPPED])
+        self.assertEqual(1, second[SECRET_CREATED])
+        api.create_rotated_secret.assert_called_once()
+        self.assertTrue(api.create_rotated_secret.call_args.args[0].name.endswith("secret_7"))
+        self.assertFalse(os.path.exists(self.journal_file))
+
+    def test_journal_is_kept_until_every_row_loads(self):
+        rows = [["azure", "", f"secret_{i}", "iam", "asm", "ITPM0123456789", "", "app-id", "o1", "o2", ""]
+                for i in range(3)]
+        api = mock.Mock()
+        api.create_rotated_secret.side_effect = [None, ApiException(status=400, reason="Bad Request"), None]
+        config = make_config(api, self.journal_file)
+        config.default_bulk_load_location = self.write_csv(rows)
+
+        with mock.patch("create_resources.create_rotated_secret.write_error"):
+            azure_stream_bulk_load(config, workers=1, results_file=os.path.join(self.temp_dir.name, "1.jsonl"))
+        self.assertTrue(os.path.exists(self.journal_file))
+
+        api.create_rotated_secret.reset_mock(side_effect=True)
+        azure_stream_bulk_load(config, workers=1, results_file=os.path.join(self.temp_dir.name, "2.jsonl"))
+        self.assertFalse(os.path.exists(self.journal_file))
+
+        # The secrets were deleted after the finished run, so a rerun loads every row again
+        azure_stream_bulk_load(config, workers=1, results_file=os.path.join(self.temp_dir.name, "3.jsonl"))
+        self.assertEqual(4, api.create_rotated_secret.call_count)
+
+    def test_edited_row_is_loaded_again(self):
+        row = ["azure", "", "secret", "iam", "asm", "ITPM0123456789", "", "app-id", "o1", "o2", ""]
+        api = mock.Mock()
+        config = make_config(api, self.journal_file)
+        config.default_bulk_load_location = self.write_csv([row])
+        azure_stream_bulk_load(config, results_file=os.path.join(self.temp_dir.name, "1.jsonl"))
+
+        row[6] = "new description"
+        config.default_bulk_load_location = self.write_csv([row])
+        summary = azure_stream_bulk_load(config, results_file=os.path.join(self.temp_dir.name, "2.jsonl"))
+
+        self.assertEqual(1, summary[SECRET_CREATED])
+        self.assertEqual(2, api.create_rotated_secret.call_count)
+
+
+class ChooseSecretOptionTests(unittest.TestCase):
+    @mock.patch("create_resources.create_rotated_secret.azure_stream_bulk_load")
+    @mock.patch("builtins.input", side_effect=["2", "0", "3"])
+    def test_bulk_load_asks_for_the_worker_count(self, _input, azure_stream_bulk_load):
+        config = make_config(mock.Mock(), None)
+        config.is_testing = False
+        azure_stream_bulk_load.return_value = {"app_info": {"app_team_name": "asm"}}
+
+        secret_data, app_info = choose_secret_option(config, True)
+
+        azure_stream_bulk_load.assert_called_once_with(config, 3)
+        self.assertIsNone(secret_data)
+        self.assertEqual({"app_team_name": "asm"}, app_info)
+
+
+if __name__ == '__main__':
+    unittest.main()
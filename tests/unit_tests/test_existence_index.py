@@ -0,0 +1,94 @@
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from akeyless import ApiException, Item, ListItemsInPathOutput, ListRolesOutput, Role, ListAuthMethodsOutput, AuthMethod
+
+from create_resources.create_access_role import create_akeyless_role
+from create_resources.create_rotated_secret import submit_rotated_secret, SECRET_EXISTS
+from toolkit.existence_index import build_existence_index
+
+PREFIX = "/cvs/iam/asm-ITPM0123456789/"
+
+
+def list_items(body):
+    pages = {
+        (PREFIX.rstrip("/"), None): ListItemsInPathOutput(
+            items=[Item(item_name=f"{PREFIX}secrets/azure/secret_1")],
+            folders=[f"{PREFIX}secrets", f"{PREFIX}secrets/azure"],
+            next_page="page-2"),
+        (PREFIX.rstrip("/"), "page-2"): ListItemsInPathOutput(
+            items=[Item(item_name=f"{PREFIX}secrets/azure/secret_2")]),
+        (f"{PREFIX}secrets", None): ListItemsInPathOutput(),
+        (f"{PREFIX}secrets/azure", None): ListItemsInPathOutput(
+            items=[Item(item_name=f"{PREFIX}secrets/azure/secret_3")]),
+    }
+    return pages[(body.path, body.pagination_token)]
+
+
+def make_config():
+    api = mock.Mock()
+    api.list_items.side_effect = list_items
+    api.list_roles.return_value = ListRolesOutput(roles=[Role(role_name=f"{PREFIX}roles/read-all"),
+                                                         Role(role_name="/cvs/other/roles/read-all")])
+    api.list_auth_methods.return_value = ListAuthMethodsOutput(
+        auth_methods=[AuthMethod(auth_method_name=f"{PREFIX}authmethod/uid/asm-uid")])
+    return SimpleNamespace(api=api, auth_token="t-123", env="UAT", existence_index=None, engineer="engineer",
+                           version="test")
+
+
+class ExistenceIndexTests(unittest.TestCase):
+    def test_index_follows_pages_and_folders(self):
+        config = make_config()
+
+        index = build_existence_index(config, [PREFIX, PREFIX])
+
+        self.assertTrue(index.exists(f"{PREFIX}secrets/azure/secret_1"))
+        self.assertTrue(index.exists(f"{PREFIX}secrets/azure/secret_2"))
+        self.assertTrue(index.exists(f"{PREFIX}secrets/azure/secret_3"))
+        self.assertTrue(index.exists(f"{PREFIX}roles/read-all"))
+        self.assertTrue(index.exists(f"{PREFIX}authmethod/uid/asm-uid"))
+        self.assertFalse(index.exists("/cvs/other/roles/read-all"))
+        self.assertEqual(4, config.api.list_items.call_count)
+        self.assertEqual(1, config.api.list_roles.call_count)
+
+    @mock.patch("toolkit.existence_index.write_error")
+    def test_failed_listing_leaves_the_prefix_unindexed(self, write_error):
+        config = make_config()
+        config.api.list_roles.side_effect = [ApiException(status=403), config.api.list_roles.return_value]
+
+        index = build_existence_index(config, [PREFIX])
+        write_error.assert_called_once()
+        self.assertFalse(index.exists(f"{PREFIX}roles/read-all"))
+        self.assertEqual(index.failed_prefixes, {PREFIX})
+
+        build_existence_index(config, [PREFIX])
+        self.assertTrue(index.exists(f"{PREFIX}roles/read-all"))
+        self.assertEqual(index.failed_prefixes, set())
+
+    def test_create_functions_skip_existing_paths(self):
+        config = make_config()
+        build_existence_index(config, [PREFIX])
+
+        status, error = submit_rotated_secret(config, f"{PREFIX}secrets/azure/secret_1", "app-id", [], "description")
+        role_data = create_akeyless_role(config, f"{PREFIX}roles/read-all")
+
+        self.assertEqual(SECRET_EXISTS, status)
+        self.assertFalse(role_data["is_new"])
+        config.api.create_rotated_secret.assert_not_called()
+        config.api.create_role.assert_not_called()
+
+    def test_created_paths_are_added_to_the_index(self):
+        config = make_config()
+        build_existence_index(config, [PREFIX])
+
+        first = create_akeyless_role(config, f"{PREFIX}roles/new-role")
+        second = create_akeyless_role(config, f"{PREFIX}roles/new-role")
+
+        self.assertTrue(first["is_new"])
+        self.assertFalse(second["is_new"])
+        config.api.create_role.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+
+from akeyless import ApiException
+
+from toolkit.latency_recorder import LatencyHistogram, LatencyRecorder, compare_runs, load_summary, rank_urls
+
+
+class LatencyHistogramTests(unittest.TestCase):
+    def test_percentiles_within_bucket_precision(self):
+        histogram = LatencyHistogram()
+        for millisecond in range(1, 1001):
+            histogram.record(millisecond / 1000)
+
+        self.assertEqual(histogram.count, 1000)
+        self.assertAlmostEqual(histogram.percentile(50), 0.5, delta=0.5 * 0.05)
+        self.assertAlmostEqual(histogram.percentile(95), 0.95, delta=0.95 * 0.05)
+        self.assertEqual(histogram.percentile(100), 1.0)
+        self.assertLess(len(histogram.buckets), 200)
+
+    def test_round_trip(self):
+        histogram = LatencyHistogram()
+        for value in [0.01, 0.02, 0.5]:
+            histogram.record(value)
+        copy = LatencyHistogram.from_dict(histogram.to_dict())
+        self.assertEqual(copy.percentile(95), histogram.percentile(95))
+        self.assertEqual(copy.max, 0.5)
+
+
+class LatencyRecorderTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+
+    def make_recorder(self, latency):
+        recorder = LatencyRecorder("UAT")
+        for _ in range(20):
+            recorder.record("get_static_secret", "https://gw1", "ok", latency)
+        recorder.record("get_static_secret", "https://gw1", "503", latency)
+        return recorder
+
+    def test_summary_counts_statuses(self):
+        recorder = self.make_recorder(0.1)
+        with self.assertRaises(ApiException):
+            with recorder.measure("create_secret", "https://gw1"):
+                raise ApiException(status=429)
+
+        rows = {row["operation"]: row for row in recorder.summary()}
+        self.assertEqual(rows["get_static_secret"]["count"], 21)
+        self.assertEqual(rows["get_static_secret"]["errors"], 1)
+        self.assertEqual(rows["create_secret"]["statuses"], {"429": 1})
+
+    def test_save_load_and_compare(self):
+        baseline_file = os.path.join(self.temp_dir.name, "baseline.json")
+        current_file = os.path.join(self.temp_dir.name, "current.csv")
+        self.make_recorder(0.1).save(baseline_file)
+        self.make_recorder(0.2).save(current_file)
+
+        self.assertEqual(LatencyRecorder.load(baseline_file).summary(), load_summary(baseline_file))
+        comparison = compare_runs(load_summary(baseline_file), load_summary(current_file), threshold=0.1)
+        self.assertEqual(len(comparison), 1)
+        self.assertTrue(comparison[0]["regressed"])
+        self.assertFalse(compare_runs(load_summary(baseline_file), load_summary(baseline_file))[0]["regressed"])
+
+    def test_rank_urls(self):
+        recorder = LatencyRecorder("UAT")
+        recorder.record("auth", "https://slow", "ok", 0.5)
+        recorder.record("get_static_secret", "https://slow", "ok", 0.5)
+        recorder.record("auth", "https://fast", "ok", 0.1)
+        recorder.record("get_static_secret", "https://fast", "ok", 0.1)
+        recorder.record("auth", "https://broken", "503", 0.01)
+
+        ranking = rank_urls(recorder.summary())
+        self.assertEqual([node["url"] for node in ranking], ["https://fast", "https://slow", "https://broken"])
+        self.assertEqual(ranking[2]["errors"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
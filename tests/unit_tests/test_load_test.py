@@ -0,0 +1,41 @@
+import unittest
+
+from toolkit.load_test import parse_operation_mix, run_load_test, summarize_load_test
+
+
+class LoadTestTests(unittest.TestCase):
+    def test_parse_operation_mix(self):
+        self.assertEqual(parse_operation_mix("auth=1, get_static=4,create"),
+                         {"auth": 1.0, "get_static": 4.0, "create": 1.0})
+
+    def test_users_run_the_operation_mix(self):
+        def create(user):
+            user.created.append(user.iterations)
+
+        def delete(user):
+            if not user.created:
+                return False
+            user.created.pop()
+
+        def fail(user):
+            raise RuntimeError("gateway unavailable")
+
+        operations = {"create": create, "delete": delete, "fail": fail}
+        results = run_load_test(operations, {"create": 2, "delete": 1, "fail": 1}, users=4, iterations=25, seed=7)
+        summary = summarize_load_test(results)
+
+        self.assertEqual(len(results["virtual_users"]), 4)
+        self.assertTrue(all(user.iterations == 25 for user in results["virtual_users"]))
+        self.assertEqual(summary["fail"]["errors"], summary["fail"]["count"])
+        self.assertEqual(summary["create"]["errors"], 0)
+        recorded = sum(operation["count"] for operation in summary.values())
+        self.assertLessEqual(recorded, 100)
+        self.assertGreaterEqual(summary["create"]["p99"], summary["create"]["p50"])
+
+    def test_unknown_operation(self):
+        with self.assertRaises(ValueError):
+            run_load_test({"auth": lambda user: None}, {"login": 1}, iterations=1)
+
+
+if __name__ == "__main__":
+    unittest.main()
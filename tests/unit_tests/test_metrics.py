@@ -0,0 +1,80 @@
+import os
+import tempfile
+import unittest
+import urllib.request
+from types import SimpleNamespace
+from unittest import mock
+
+from akeyless import ApiException
+
+from toolkit.metrics import (IN_FLIGHT, REQUEST_DURATION, REQUESTS, RETRIES, TOKEN_REFRESHES, MeteredApi,
+                             MetricsRegistry, MetricsServer, api_metrics)
+from toolkit.retry import RetryingApi, RetryPolicy
+
+
+class MetricsRegistryTests(unittest.TestCase):
+    def test_render_counters_and_histograms(self):
+        registry = MetricsRegistry()
+        registry.counter("calls_total", "Calls")
+        registry.histogram("call_seconds", "Call latency", buckets=[0.1, 1.0])
+        registry.inc("calls_total", endpoint="/auth", status="ok")
+        registry.inc("calls_total", endpoint="/auth", status="ok")
+        registry.observe("call_seconds", 0.5, endpoint="/auth")
+
+        text = registry.render()
+        self.assertIn("# TYPE calls_total counter", text)
+        self.assertIn('calls_total{endpoint="/auth",status="ok"} 2', text)
+        self.assertIn('call_seconds_bucket{endpoint="/auth",le="0.1"} 0', text)
+        self.assertIn('call_seconds_bucket{endpoint="/auth",le="1.0"} 1', text)
+        self.assertIn('call_seconds_bucket{endpoint="/auth",le="+Inf"} 1', text)
+        self.assertIn('call_seconds_count{endpoint="/auth"} 1', text)
+
+    def test_callbacks_are_read_when_rendered(self):
+        token_manager = SimpleNamespace(refresh_count=1)
+        registry = api_metrics(token_manager=token_manager)
+        token_manager.refresh_count = 3
+        self.assertIn(f"{TOKEN_REFRESHES} 3", registry.render())
+
+    def test_save_writes_a_snapshot(self):
+        registry = api_metrics()
+        registry.inc(REQUESTS, endpoint="/auth", status="ok")
+        with tempfile.TemporaryDirectory() as directory:
+            metrics_file = registry.save(os.path.join(directory, "metrics.prom"))
+            with open(metrics_file) as f:
+                self.assertIn(f'{REQUESTS}{{endpoint="/auth",status="ok"}} 1', f.read())
+
+
+class MeteredApiTests(unittest.TestCase):
+    def test_calls_record_status_latency_and_retries(self):
+        api = mock.Mock()
+        api.get_secret_value.side_effect = [ApiException(status=503), {"secret": "value"}]
+        api.delete_item.side_effect = ApiException(status=404)
+        registry = api_metrics()
+        metered_api = MeteredApi(RetryingApi(api, RetryPolicy(base_delay=0)), registry, gateway="https://gw")
+
+        metered_api.get_secret_value(None)
+        with self.assertRaises(ApiException):
+            metered_api.delete_item(None)
+
+        labels = {"endpoint": "/get-secret-value", "gateway": "https://gw"}
+        self.assertEqual(registry.value(REQUESTS, status="ok", **labels), 1)
+        self.assertEqual(registry.value(RETRIES, **labels), 1)
+        self.assertEqual(registry.value(IN_FLIGHT, **labels), 0)
+        self.assertEqual(registry.value(REQUEST_DURATION, **labels)["count"], 1)
+        self.assertEqual(registry.value(REQUESTS, status="404", endpoint="/delete-item", gateway="https://gw"), 1)
+
+
+class MetricsServerTests(unittest.TestCase):
+    def test_metrics_endpoint(self):
+        registry = api_metrics()
+        registry.inc(REQUESTS, endpoint="/auth", status="ok")
+        server = MetricsServer(registry)
+        try:
+            with urllib.request.urlopen(server.start(), timeout=5) as response:
+                self.assertIn(REQUESTS, response.read().decode("utf-8"))
+        finally:
+            server.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import json
+import threading
+import unittest
+import socket
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from akeyless import ApiException, Auth, CreateSecret
+
+from configs.api_client import close_clients
+from configs.node_selector import NodeRoutingApi, NodeSelector
+
+
+def make_handler(status):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            self.send_response(status)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            body = json.dumps({"token": "t-123"}).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+class NodeSelectorTests(unittest.TestCase):
+    def start_server(self, status):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(status))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        return f"http://127.0.0.1:{server.server_port}"
+
+    def setUp(self):
+        self.addCleanup(close_clients)
+        self.healthy_url = self.start_server(200)
+        self.broken_url = self.start_server(503)
+
+    def test_chooses_fastest_healthy_node(self):
+        selector = NodeSelector(["https://slow", "https://fast", "https://down"])
+        selector.record("https://slow", 0.5)
+        selector.record("https://fast", 0.1)
+        selector.record("https://down", 0.01, failed=True)
+
+        self.assertEqual(selector.choose(), "https://fast")
+        self.assertEqual(selector.choose(exclude=["https://fast"]), "https://slow")
+
+    def test_health_check_marks_broken_nodes_down(self):
+        selector = NodeSelector([self.broken_url, self.healthy_url])
+
+        self.assertEqual(selector.health_check(), {self.broken_url: False, self.healthy_url: True})
+        self.assertEqual(selector.choose(), self.healthy_url)
+
+    def test_health_checks_do_not_change_the_api_latency(self):
+        selector = NodeSelector([self.healthy_url])
+        selector.record(self.healthy_url, 0.5)
+
+        selector.health_check()
+
+        node = selector.state()[0]
+        self.assertEqual(node["latency_seconds"], 0.5)
+        self.assertLess(node["health_check_seconds"], 0.5)
+
+    def test_fails_over_to_the_next_node(self):
+        selector = NodeSelector([self.broken_url, self.healthy_url])
+        api = NodeRoutingApi(selector)
+
+        self.assertEqual(api.auth(Auth(access_id="p-123", access_key="key")).token, "t-123")
+        self.assertEqual(selector.failovers, 1)
+        state = {node["url"]: node for node in selector.state()}
+        self.assertFalse(state[self.broken_url]["healthy"])
+        self.assertEqual(selector.choose(), self.healthy_url)
+
+    def test_create_does_not_fail_over_after_reaching_a_node(self):
+        selector = NodeSelector([self.broken_url, self.healthy_url])
+        api = NodeRoutingApi(selector)
+
+        with self.assertRaises(ApiException):
+            api.create_secret(CreateSecret(name="/app/secret", value="v", token="t-123"))
+        self.assertEqual(selector.failovers, 0)
+
+    def test_create_fails_over_when_the_node_cannot_be_reached(self):
+        with socket.socket() as unused:
+            unused.bind(("127.0.0.1", 0))
+            unreachable_url = f"http://127.0.0.1:{unused.getsockname()[1]}"
+        selector = NodeSelector([unreachable_url, self.healthy_url])
+        api = NodeRoutingApi(selector)
+
+        api.create_secret(CreateSecret(name="/app/secret", value="v", token="t-123"))
+        self.assertEqual(selector.failovers, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
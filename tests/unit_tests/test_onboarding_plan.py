@@ -0,0 +1,107 @@
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+from akeyless import ApiException, AuthMethod, Item, ListAuthMethodsOutput, ListItemsInPathOutput, ListRolesOutput, PathRule, \
+    Role, RoleAuthMethodAssociation, Rules
+
+from create_resources.create_access_role import OIDC_AUTH_METHOD_PATH
+from create_resources.onboarding_plan import apply_onboarding_plan, build_onboarding_plan, load_onboarding_plan, \
+    save_onboarding_plan
+
+BULK_LOAD_CSV = os.path.join(os.path.dirname(os.path.dirname(__file__)), "test_bulk_load.csv")
+PREFIX = "/cvs/iam/asm-ITPM0123456789/"
+ROLE = f"{PREFIX}roles/asm-ITPM0123456789-read-all"
+UID_AUTH_METHOD = f"{PREFIX}authmethod/uid/asm-ITPM0123456789-uid"
+API_KEY_AUTH_METHOD = f"{PREFIX}authmethod/api-key/asm-ITPM0123456789-api-key"
+
+
+def make_config():
+    api = mock.Mock()
+    api.list_items.return_value = ListItemsInPathOutput(
+        items=[Item(item_name=f"{PREFIX}secrets/azure/script_test_azure_secret")])
+    api.list_roles.return_value = ListRolesOutput(roles=[Role(role_name=ROLE)])
+    api.list_auth_methods.return_value = ListAuthMethodsOutput(auth_methods=[AuthMethod(auth_method_name=UID_AUTH_METHOD)])
+    api.get_role.return_value = Role(
+        role_name=ROLE,
+        rules=Rules(path_rules=[
+            PathRule(type="role-rule", path="/cvs/iam/asm/roles/admin/asm-admin", capabilities=["deny"]),
+            PathRule(type="item-rule", path="/cvs/iam/asm/keys/gateway/secretsmanager-gw-uat-dfckey",
+                     capabilities=["deny"]),
+            PathRule(type="auth-method-rule", path="/cvs/iam/asm/authmethod/certs/gateway/*", capabilities=["deny"]),
+        ]),
+        role_auth_methods_assoc=[RoleAuthMethodAssociation(auth_method_name=UID_AUTH_METHOD)])
+    api.auth_method_create_api_key.return_value = SimpleNamespace(access_id="p-new", access_key="key")
+    return SimpleNamespace(api=api, auth_token="t-123", env="UAT", existence_index=None, bulk_load_workers=4,
+                           engineer="engineer", version="test", engineer_email="engineer@email.com",
+                           default_tags=["csp:azure"], default_description="description")
+
+
+class OnboardingPlanTests(unittest.TestCase):
+    def test_plan_only_contains_the_delta(self):
+        config = make_config()
+
+        plan = build_onboarding_plan(config, BULK_LOAD_CSV, ["UID", "API-Key"])
+
+        self.assertEqual([f"{PREFIX}secrets/azure/script_test_azure_secret_2"],
+                         [secret["secret_path"] for secret in plan["secrets"]])
+        self.assertEqual([], plan["roles"])
+        self.assertEqual([{"auth_type": "API-Key", "auth_method_path": API_KEY_AUTH_METHOD}], plan["auth_methods"])
+        self.assertEqual([API_KEY_AUTH_METHOD], [assoc["auth_method_path"] for assoc in plan["associations"]])
+        self.assertEqual({ROLE: [["item-rule", f"{PREFIX}secrets/*", ["read", "list"]]]}, plan["rules"])
+        self.assertEqual({"secrets": 1, "roles": 1, "auth_methods": 1, "associations": 1, "rules": 3},
+                         plan["unchanged"])
+        config.api.create_rotated_secret.assert_not_called()
+        config.api.set_role_rule.assert_not_called()
+
+    def test_apply_sends_only_the_planned_changes(self):
+        config = make_config()
+        plan = build_onboarding_plan(config, BULK_LOAD_CSV, ["UID", "API-Key"])
+        with tempfile.TemporaryDirectory() as temp_dir:
+            plan_file = os.path.join(temp_dir, "plan.json")
+            save_onboarding_plan(plan, plan_file)
+            plan = load_onboarding_plan(plan_file)
+
+        created = apply_onboarding_plan(config, plan)
+
+        self.assertEqual([f"{PREFIX}secrets/azure/script_test_azure_secret_2"], created["secrets"])
+        self.assertEqual("p-new", created["auth_methods"][API_KEY_AUTH_METHOD]["access_id"])
+        config.api.create_rotated_secret.assert_called_once()
+        config.api.create_role.assert_not_called()
+        config.api.auth_method_create_api_key.assert_called_once()
+        config.api.create_auth_method_universal_identity.assert_not_called()
+        config.api.assoc_role_auth_method.assert_called_once()
+        config.api.set_role_rule.assert_called_once()
+        self.assertEqual([API_KEY_AUTH_METHOD], [assoc["auth_method_path"] for assoc in created["associations"]])
+
+    def test_oidc_association_with_other_groups_is_updated(self):
+        config = make_config()
+        config.api.get_role.return_value.role_auth_methods_assoc.append(RoleAuthMethodAssociation(
+            assoc_id="ass-oidc", auth_method_name=OIDC_AUTH_METHOD_PATH, auth_method_sub_claims={"groups": ["old"]}))
+
+        plan = build_onboarding_plan(config, BULK_LOAD_CSV, ["UID", "OIDC"], oidc_groups="group-a,group-b")
+        created = apply_onboarding_plan(config, plan)
+
+        self.assertEqual([], plan["associations"])
+        self.assertEqual([{"role_path": ROLE, "auth_method_path": OIDC_AUTH_METHOD_PATH, "assoc_id": "ass-oidc",
+                           "sub_claims": {"groups": "group-a,group-b"}}], plan["association_updates"])
+        config.api.assoc_role_auth_method.assert_not_called()
+        body = config.api.update_assoc.call_args.args[0]
+        self.assertEqual(("ass-oidc", {"groups": "group-a,group-b"}), (body.assoc_id, body.sub_claims))
+        self.assertEqual([OIDC_AUTH_METHOD_PATH], [assoc["auth_method_path"] for assoc in created["associations"]])
+
+    def test_conflicting_association_is_reported_as_drift(self):
+        config = make_config()
+        plan = build_onboarding_plan(config, BULK_LOAD_CSV, ["UID", "API-Key"])
+        config.api.assoc_role_auth_method.side_effect = ApiException(status=409, reason="Conflict")
+
+        created = apply_onboarding_plan(config, plan)
+
+        self.assertEqual([], created["associations"])
+        self.assertEqual([API_KEY_AUTH_METHOD], [assoc["auth_method_path"] for assoc in created["drift"]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import time
+import unittest
+from unittest import mock
+
+import urllib3
+from akeyless import Auth, CreateSecret
+
+from configs.api_client import close_clients, get_api
+from configs.request_phases import PHASES, PhaseRecorder, enable_phase_timing
+from toolkit.stand_in_server import StandInServer
+
+
+class RequestPhasesTests(unittest.TestCase):
+    def setUp(self):
+        self.stand_in = StandInServer(latency={"/create-secret": "fixed:0.05"})
+        self.stand_in.start()
+        self.addCleanup(self.stand_in.stop)
+        self.addCleanup(close_clients)
+
+    def test_phases_per_endpoint(self):
+        api = get_api(self.stand_in.url)
+        recorder = enable_phase_timing(api, PhaseRecorder())
+
+        token = api.auth(Auth(access_id="p-123", access_key="key")).token
+        for index in range(3):
+            api.create_secret(CreateSecret(name=f"/app/secret-{index}", value="v", token=token))
+
+        rows = {row["endpoint"]: row for row in recorder.summary()}
+        self.assertEqual(rows["/auth"]["count"], 1)
+        self.assertEqual(rows["/auth"]["new_connections"], 1)
+        create = rows["/create-secret"]
+        self.assertEqual(create["count"], 3)
+        # The connection opened for /auth is reused
+        self.assertEqual(create["new_connections"], 0)
+        self.assertGreaterEqual(create["server_mean"], 0.05)
+        self.assertGreater(create["deserialize_mean"], 0)
+        self.assertEqual(create["tls_mean"], 0)
+        self.assertTrue(all(f"{phase}_p95" in create for phase in PHASES))
+
+    def test_connect_time_is_not_counted_as_server_time(self):
+        api = get_api(self.stand_in.url)
+        recorder = enable_phase_timing(api, PhaseRecorder())
+        create_connection = urllib3.util.connection.create_connection
+
+        def slow_create_connection(*args, **kwargs):
+            time.sleep(0.1)
+            return create_connection(*args, **kwargs)
+
+        with mock.patch.object(urllib3.connection.connection, "create_connection", slow_create_connection):
+            api.auth(Auth(access_id="p-123", access_key="key"))
+
+        auth = recorder.summary()[0]
+        self.assertGreaterEqual(auth["connect_mean"], 0.1)
+        self.assertLess(auth["server_mean"], 0.1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from configs.api_client import close_clients
+from toolkit import response_times
+from toolkit.stand_in_server import StandInServer
+
+
+class ProbeTests(unittest.TestCase):
+    def setUp(self):
+        self.healthy = StandInServer(seed=1)
+        self.failing = StandInServer(seed=1, faults={"/get-secret-value": {503: 1.0}})
+        for stand_in in [self.healthy, self.failing]:
+            stand_in.start()
+            self.addCleanup(stand_in.stop)
+        self.addCleanup(close_clients)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patcher = mock.patch.dict(os.environ, {
+            "TEST_BASE_URL_LIST": f"{self.healthy.url},{self.failing.url}",
+            "TEST_API_ACCESS_ID": "p-123",
+            "TEST_API_ACCESS_KEY": "key",
+            "TEST_STATIC_SECRET": "/probe/static",
+            "TEST_ROTATED_SECRET": "/probe/rotated",
+            "LATENCY_RESULTS_FILE": os.path.join(directory.name, "results.json"),
+        })
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_errors_are_recorded_against_their_own_node(self):
+        errors = response_times.main("TEST")
+
+        self.assertEqual([error.status for error in errors], [503])
+        statuses = {(row["operation"], row["url"]): row["statuses"] for row in response_times.recorder.summary()}
+        self.assertEqual(statuses[("get_static_secret", self.failing.url)], {"503": 1})
+        self.assertEqual(statuses[("get_static_secret", self.healthy.url)], {"ok": 1})
+        self.assertEqual(statuses[("delete_static_secret", self.failing.url)], {"ok": 1})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import unittest
+from unittest import mock
+
+import urllib3
+from akeyless import ApiException
+
+from toolkit.retry import (ERROR_CONFLICT, ERROR_FATAL, ERROR_THROTTLE, ERROR_TRANSIENT, RetryingApi, RetryPolicy,
+                           classify_error)
+
+
+def api_error(status, body=None):
+    error = ApiException(status=status)
+    error.body = body
+    return error
+
+
+class ClassifyErrorTests(unittest.TestCase):
+    def test_classification(self):
+        self.assertEqual(classify_error(api_error(409)), ERROR_CONFLICT)
+        self.assertEqual(classify_error(api_error(400, "Status 409 Conflict: item already exists")), ERROR_CONFLICT)
+        self.assertEqual(classify_error(api_error(429)), ERROR_THROTTLE)
+        self.assertEqual(classify_error(api_error(502)), ERROR_THROTTLE)
+        self.assertEqual(classify_error(api_error(500)), ERROR_TRANSIENT)
+        self.assertEqual(classify_error(urllib3.exceptions.ReadTimeoutError(None, "/", "timed out")), ERROR_TRANSIENT)
+        self.assertEqual(classify_error(api_error(401)), ERROR_FATAL)
+        self.assertEqual(classify_error(ValueError()), ERROR_FATAL)
+
+
+class RetryPolicyTests(unittest.TestCase):
+    def test_transient_errors_are_retried(self):
+        func = mock.Mock(side_effect=[api_error(503), api_error(500), "ok"])
+        policy = RetryPolicy(base_delay=0)
+
+        self.assertEqual(policy.call(func), "ok")
+        stats = policy.stats()
+        self.assertEqual(stats["attempts"], 3)
+        self.assertEqual(stats["retries"], 2)
+        self.assertEqual(stats["errors"][ERROR_THROTTLE], 1)
+
+    def test_conflicts_are_not_retried(self):
+        func = mock.Mock(side_effect=api_error(409))
+        policy = RetryPolicy(base_delay=0)
+
+        with self.assertRaises(ApiException):
+            policy.call(func)
+        self.assertEqual(func.call_count, 1)
+
+    def test_gives_up_after_max_attempts(self):
+        func = mock.Mock(side_effect=api_error(503))
+        policy = RetryPolicy(max_attempts=3, base_delay=0)
+
+        with self.assertRaises(ApiException):
+            policy.call(func)
+        self.assertEqual(func.call_count, 3)
+
+    def test_budget_is_shared_across_calls(self):
+        func = mock.Mock(side_effect=api_error(503))
+        policy = RetryPolicy(max_attempts=5, base_delay=0, retry_budget=2)
+
+        for _ in range(2):
+            with self.assertRaises(ApiException):
+                policy.call(func)
+        self.assertEqual(func.call_count, 4)
+        self.assertEqual(policy.stats()["budget_exhausted"], 2)
+
+    def test_backoff_is_capped(self):
+        policy = RetryPolicy(base_delay=1, max_delay=3)
+        for attempt in range(1, 10):
+            self.assertLessEqual(policy.backoff(attempt), 3)
+
+    def test_retrying_api_wraps_calls(self):
+        api = mock.Mock()
+        api.get_role.side_effect = [api_error(504), "ok"]
+        retrying = RetryingApi(api, RetryPolicy(base_delay=0))
+
+        self.assertEqual(retrying.get_role("body"), "ok")
+        self.assertEqual(api.get_role.call_count, 2)
+
+    def test_create_that_timed_out_reading_is_not_sent_again(self):
+        api = mock.Mock()
+        api.create_auth_method_universal_identity.side_effect = [
+            urllib3.exceptions.ReadTimeoutError(None, "/create-auth-method-universal-identity", "read timed out"), "ok"]
+        retrying = RetryingApi(api, RetryPolicy(base_delay=0))
+
+        with self.assertRaises(urllib3.exceptions.ReadTimeoutError):
+            retrying.create_auth_method_universal_identity("body")
+        self.assertEqual(api.create_auth_method_universal_identity.call_count, 1)
+
+    def test_create_that_never_connected_is_sent_again(self):
+        api = mock.Mock()
+        refused = urllib3.exceptions.MaxRetryError(
+            None, "/create-role", urllib3.exceptions.NewConnectionError(None, "connection refused"))
+        api.create_role.side_effect = [refused, "ok"]
+        retrying = RetryingApi(api, RetryPolicy(base_delay=0))
+
+        self.assertEqual(retrying.create_role("body"), "ok")
+        self.assertEqual(api.create_role.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+
+from akeyless import (ApiException, AssocRoleAuthMethod, Auth, AuthMethodCreateApiKey, CreateRole, CreateSecret,
+                      GetRole, GetSecretValue, ListItems, SetRoleRule, UpdateAssoc)
+
+from configs.api_client import close_clients, get_api
+from toolkit.retry import is_conflict
+from toolkit.stand_in_server import StandInServer, parse_faults, parse_latency
+
+
+class StandInServerTests(unittest.TestCase):
+    def setUp(self):
+        self.stand_in = StandInServer(seed=1, page_size=2)
+        self.stand_in.start()
+        self.addCleanup(self.stand_in.stop)
+        self.addCleanup(close_clients)
+        self.api = get_api(self.stand_in.url)
+        self.token = self.api.auth(Auth(access_id="p-123", access_key="key")).token
+
+    def test_secrets(self):
+        self.api.create_secret(CreateSecret(name="/app/secrets/one", value="v1", token=self.token))
+        with self.assertRaises(ApiException) as context:
+            self.api.create_secret(CreateSecret(name="/app/secrets/one", value="v1", token=self.token))
+        self.assertTrue(is_conflict(context.exception))
+
+        response = self.api.get_secret_value(GetSecretValue(names=["/app/secrets/one"], token=self.token))
+        self.assertEqual(response, {"/app/secrets/one": "v1"})
+        self.assertEqual(self.stand_in.stats()["requests"]["/create-secret"], {"200": 1, "409": 1})
+
+    def test_list_items_pages_and_folders(self):
+        for name in ["/app/a", "/app/b", "/app/c", "/app/secrets/d"]:
+            self.api.create_secret(CreateSecret(name=name, value="v", token=self.token))
+
+        first = self.api.list_items(ListItems(path="/app", token=self.token))
+        second = self.api.list_items(ListItems(path="/app", pagination_token=first.next_page, token=self.token))
+        self.assertEqual([item.item_name for item in first.items + second.items], ["/app/a", "/app/b", "/app/c"])
+        self.assertEqual(first.folders, ["/app/secrets"])
+        self.assertIsNone(second.next_page)
+
+    def test_role_rules(self):
+        self.api.create_role(CreateRole(name="/app/roles/r", token=self.token))
+        self.api.set_role_rule(SetRoleRule(role_name="/app/roles/r", path="/app/*", rule_type="item-rule",
+                                           capability=["read", "list"], token=self.token))
+
+        role = self.api.get_role(GetRole(name="/app/roles/r", token=self.token))
+        self.assertEqual([(rule.type, rule.path, rule.capabilities) for rule in role.rules.path_rules],
+                         [("item-rule", "/app/*", ["read", "list"])])
+
+    def test_role_associations(self):
+        self.api.create_role(CreateRole(name="/app/roles/r", token=self.token))
+        self.api.auth_method_create_api_key(AuthMethodCreateApiKey(name="/app/auth/key", token=self.token))
+        assoc_id = self.api.assoc_role_auth_method(AssocRoleAuthMethod(
+            role_name="/app/roles/r", am_name="/app/auth/key", sub_claims={"groups": "a"}, token=self.token)).assoc_id
+
+        self.api.update_assoc(UpdateAssoc(assoc_id=assoc_id, sub_claims={"groups": "a,b"}, token=self.token))
+        role = self.api.get_role(GetRole(name="/app/roles/r", token=self.token))
+        self.assertEqual([(assoc.assoc_id, assoc.auth_method_name, assoc.auth_method_sub_claims)
+                          for assoc in role.role_auth_methods_assoc],
+                         [(assoc_id, "/app/auth/key", {"groups": ["a", "b"]})])
+
+        with self.assertRaises(ApiException) as context:
+            self.api.update_assoc(UpdateAssoc(assoc_id="ass-missing", sub_claims={}, token=self.token))
+        self.assertEqual(context.exception.status, 404)
+
+    def test_injected_faults(self):
+        self.stand_in.state.set_faults("/get-secret-value", {429: 1.0})
+        with self.assertRaises(ApiException) as context:
+            self.api.get_secret_value(GetSecretValue(names=["/missing"], token=self.token))
+        self.assertEqual(context.exception.status, 429)
+
+    def test_parsers(self):
+        self.assertEqual(parse_faults("429:0.05,503:0.01"), {429: 0.05, 503: 0.01})
+        self.assertEqual(parse_latency("fixed:0.05")(None), 0.05)
+        with self.assertRaises(ValueError):
+            parse_latency("pareto:1")
+
+
+if __name__ == "__main__":
+    unittest.main()
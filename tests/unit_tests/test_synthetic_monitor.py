@@ -0,0 +1,60 @@
+import unittest
+
+from configs.api_client import close_clients
+from toolkit.stand_in_server import StandInServer
+from toolkit.synthetic_monitor import AlertSink, RollingWindow, SyntheticMonitor
+
+
+def monitor_target(url, node):
+    return {"env": "TEST", "url": url, "node": node, "access_id": "p-123", "access_key": "key",
+            "static_secret": f"/monitor/static-node{node}", "rotated_secret": None}
+
+
+class RollingWindowTests(unittest.TestCase):
+    def test_old_samples_leave_the_window(self):
+        window = RollingWindow(window_seconds=10)
+        window.record(1.0, False, now=0)
+        window.record(0.2, True, now=5)
+        window.record(0.4, True, now=12)
+
+        stats = window.stats(now=12)
+        self.assertEqual(stats["count"], 2)
+        self.assertEqual(stats["errors"], 0)
+        self.assertEqual(stats["p95"], 0.4)
+
+
+class SyntheticMonitorTests(unittest.TestCase):
+    def setUp(self):
+        self.stand_in = StandInServer(seed=1)
+        self.stand_in.start()
+        self.addCleanup(self.stand_in.stop)
+        self.addCleanup(close_clients)
+        self.sink = AlertSink(alert_file=None)
+        self.monitor = SyntheticMonitor([monitor_target(self.stand_in.url, 0)], interval=0, min_samples=2,
+                                        alert_sink=self.sink)
+
+    def test_cycles_reuse_the_auth_token(self):
+        self.monitor.run(cycles=3, report_every=0)
+
+        requests = self.stand_in.stats()["requests"]
+        self.assertEqual(requests["/auth"], {"200": 1})
+        self.assertEqual(requests["/delete-item"], {"200": 3})
+        self.assertEqual(self.stand_in.stats()["items"], 0)
+        self.assertEqual(self.sink.alerts, [])
+
+    def test_alerts_fire_and_resolve(self):
+        self.stand_in.state.set_faults("/get-secret-value", {503: 1.0})
+        self.monitor.run(cycles=2, report_every=0)
+        self.assertEqual([(alert["state"], alert["operation"], alert["rule"]) for alert in self.sink.alerts],
+                         [("firing", "get_static_secret", "error_rate")])
+
+        self.stand_in.state.set_faults("/get-secret-value", {})
+        self.monitor.window_seconds = 0
+        for window in self.monitor.windows.values():
+            window.window_seconds = 0
+        self.monitor.run(cycles=3, report_every=0)
+        self.assertEqual(self.sink.alerts[-1]["state"], "resolved")
+
+
+if __name__ == '__main__':
+    unittest.main()
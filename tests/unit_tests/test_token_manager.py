@@ -0,0 +1,168 @@
+import json
+import os
+import stat
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+
+from akeyless import ApiException, AuthOutput, GetSecretValue
+
+from configs.token_manager import ReauthenticatingApi, TokenManager
+
+
+def make_api():
+    api = mock.Mock()
+    api.auth.side_effect = lambda body: AuthOutput(token=f"t-{api.auth.call_count}")
+    return api
+
+
+class TokenManagerTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.cache_file = os.path.join(self.temp_dir.name, "cache", "token_cache.json")
+
+    def test_token_is_shared_between_workers(self):
+        api = make_api()
+        token_manager = TokenManager(api, "UAT", "p-123", "key", cache_file=self.cache_file)
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            tokens = set(executor.map(lambda i: token_manager.token, range(100)))
+
+        self.assertEqual({"t-1"}, tokens)
+        api.auth.assert_called_once()
+
+    def test_cached_token_is_reused_by_a_new_process(self):
+        TokenManager(make_api(), "UAT", "p-123", "key", cache_file=self.cache_file).token
+
+        api = make_api()
+        token_manager = TokenManager(api, "UAT", "p-123", "key", cache_file=self.cache_file)
+
+        self.assertEqual("t-1", token_manager.token)
+        self.assertEqual(1, token_manager.cache_hits)
+        api.auth.assert_not_called()
+        self.assertEqual(0o600, stat.S_IMODE(os.stat(self.cache_file).st_mode))
+
+    def test_cache_is_keyed_by_environment_and_access_id(self):
+        TokenManager(make_api(), "UAT", "p-123", "key", cache_file=self.cache_file).token
+
+        api = make_api()
+        TokenManager(api, "PROD", "p-123", "key", cache_file=self.cache_file).token
+        TokenManager(api, "UAT", "p-456", "key", cache_file=self.cache_file).token
+
+        self.assertEqual(2, api.auth.call_count)
+        with open(self.cache_file, "r") as f:
+            self.assertEqual({"UAT:p-123", "PROD:p-123", "UAT:p-456"}, set(json.load(f)))
+
+    def test_expired_cache_entry_is_not_used(self):
+        os.makedirs(os.path.dirname(self.cache_file))
+        with open(self.cache_file, "w") as f:
+            json.dump({"UAT:p-123": {"token": "old", "expires_at": time.time() + 10}}, f)
+
+        token_manager = TokenManager(make_api(), "UAT", "p-123", "key", cache_file=self.cache_file)
+
+        self.assertEqual("t-1", token_manager.token)
+
+    def test_background_refresh_renews_before_expiry(self):
+        api = make_api()
+        refreshed = threading.Event()
+        auth = api.auth.side_effect
+
+        def auth_and_signal(body):
+            output = auth(body)
+            if api.auth.call_count > 1:
+                refreshed.set()
+            return output
+
+        api.auth.side_effect = auth_and_signal
+        token_manager = TokenManager(api, "UAT", "p-123", "key", cache_file=None, token_ttl=2, refresh_margin=1)
+        self.assertEqual("t-1", token_manager.token)
+
+        token_manager.start_background_refresh()
+        self.addCleanup(token_manager.stop_background_refresh)
+
+        self.assertTrue(refreshed.wait(5))
+        self.assertEqual("t-2", token_manager.token)
+
+    def test_readers_are_not_blocked_while_the_token_is_renewed(self):
+        api = make_api()
+        auth = api.auth.side_effect
+        renewing = threading.Event()
+        release = threading.Event()
+
+        def slow_auth(body):
+            if api.auth.call_count > 1:
+                renewing.set()
+                release.wait(5)
+            return auth(body)
+
+        api.auth.side_effect = slow_auth
+        token_manager = TokenManager(api, "UAT", "p-123", "key", cache_file=None, token_ttl=3600, refresh_margin=300)
+        self.assertEqual("t-1", token_manager.token)
+
+        # Due for renewal but still valid, so readers keep getting the current token during the auth round trip
+        token_manager.expires_at = time.time() + 200
+        token_manager.refresh_margin = 250
+        token_manager.start_background_refresh()
+        self.addCleanup(token_manager.stop_background_refresh)
+        self.addCleanup(release.set)
+        self.assertTrue(renewing.wait(5))
+
+        started = time.perf_counter()
+        self.assertEqual("t-1", token_manager.token)
+        self.assertLess(time.perf_counter() - started, 1)
+
+        release.set()
+        for _ in range(50):
+            if token_manager.refresh_count == 2:
+                break
+            time.sleep(0.1)
+        self.assertEqual("t-2", token_manager.token)
+
+    def test_invalidate_only_drops_the_rejected_token(self):
+        api = make_api()
+        token_manager = TokenManager(api, "UAT", "p-123", "key", cache_file=None)
+        token = token_manager.token
+
+        token_manager.invalidate("some-other-token")
+        self.assertEqual(token, token_manager.token)
+
+        token_manager.invalidate(token)
+        self.assertEqual("t-2", token_manager.token)
+
+
+    def test_rejected_cached_token_is_dropped(self):
+        TokenManager(make_api(), "UAT", "p-123", "key", cache_file=self.cache_file).token
+        api = make_api()
+        api.validate_token.side_effect = ApiException(status=401)
+        token_manager = TokenManager(api, "UAT", "p-123", "key", cache_file=self.cache_file)
+
+        self.assertFalse(token_manager.validate_cached_token())
+        self.assertEqual(token_manager.token, "t-1")
+        api.auth.assert_called_once()
+
+
+class ReauthenticatingApiTests(unittest.TestCase):
+    def test_rejected_call_is_sent_again_with_a_new_token(self):
+        token_manager = TokenManager(make_api(), "UAT", "p-123", "key", cache_file=None)
+        api = mock.Mock()
+        api.get_secret_value.side_effect = [ApiException(status=401), {"/a": "value"}]
+        body = GetSecretValue(names=["/a"], token=token_manager.token)
+
+        self.assertEqual(ReauthenticatingApi(api, token_manager).get_secret_value(body), {"/a": "value"})
+        self.assertEqual(body.token, "t-2")
+
+    def test_other_errors_are_raised(self):
+        token_manager = TokenManager(make_api(), "UAT", "p-123", "key", cache_file=None)
+        api = mock.Mock()
+        api.get_secret_value.side_effect = ApiException(status=403)
+
+        with self.assertRaises(ApiException):
+            ReauthenticatingApi(api, token_manager).get_secret_value(GetSecretValue(names=["/a"], token="t-1"))
+        api.get_secret_value.assert_called_once()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import json
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import urllib3
+from akeyless import ApiException, CreateSecret
+
+from toolkit.retry import RetryingApi, RetryPolicy
+from toolkit.tracing import TracedApi, Tracer, traced
+
+
+class TracerTests(unittest.TestCase):
+    def test_nested_spans_record_their_parent(self):
+        tracer = Tracer()
+        with tracer.span("outer"):
+            with tracer.span("inner", item_path="/app/secret"):
+                pass
+
+        inner, outer = tracer.events
+        self.assertEqual(inner["args"], {"item_path": "/app/secret", "parent": "outer"})
+        self.assertEqual(outer["name"], "outer")
+        self.assertLessEqual(outer["ts"], inner["ts"])
+
+    def test_failed_span_records_the_status(self):
+        tracer = Tracer()
+        with self.assertRaises(ApiException):
+            with tracer.span("fails"):
+                raise ApiException(status=404)
+        self.assertEqual(tracer.events[0]["args"]["status"], "404")
+
+    def test_save_writes_trace_events(self):
+        tracer = Tracer()
+        with tracer.span("phase"):
+            pass
+        with tempfile.TemporaryDirectory() as directory:
+            trace_file = tracer.save(os.path.join(directory, "trace.json"))
+            with open(trace_file) as f:
+                trace = json.load(f)
+        self.assertIn("phase", [event["name"] for event in trace["traceEvents"] if event["ph"] == "X"])
+
+    def test_traced_is_a_no_op_without_a_tracer(self):
+        @traced("choose")
+        def choose(config):
+            return "chosen"
+
+        self.assertEqual(choose(SimpleNamespace()), "chosen")
+        config = SimpleNamespace(tracer=Tracer())
+        self.assertEqual(choose(config), "chosen")
+        self.assertEqual(config.tracer.events[0]["name"], "choose")
+
+
+class TracedApiTests(unittest.TestCase):
+    def test_api_span_attributes(self):
+        api = mock.Mock()
+        refused = urllib3.exceptions.MaxRetryError(
+            None, "/create-secret", urllib3.exceptions.NewConnectionError(None, "connection refused"))
+        api.create_secret.side_effect = [refused, "created"]
+        tracer = Tracer()
+        traced_api = TracedApi(RetryingApi(api, RetryPolicy(base_delay=0)), tracer)
+
+        self.assertEqual(traced_api.create_secret(CreateSecret(name="/app/secret", value="v")), "created")
+        self.assertEqual(tracer.events[0]["name"], "V2Api.create_secret")
+        self.assertEqual(tracer.events[0]["args"], {"endpoint": "/create-secret", "item_path": "/app/secret",
+                                                    "retry_count": 1, "status": "ok"})
+
+
+if __name__ == '__main__':
+    unittest.main()
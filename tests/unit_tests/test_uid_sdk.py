@@ -0,0 +1,275 @@
+import base64
+import importlib.util
+import os
+import tempfile
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+import akeyless
+
+from toolkit.stand_in_server import StandInServer
+
+SAMPLE_FILE = os.path.join(os.path.dirname(__file__), "..", "..", "akeyless_setup_scripts", "sample_scripts",
+                           "python", "uid_sdk.py")
+spec = importlib.util.spec_from_file_location("uid_sdk", SAMPLE_FILE)
+uid_sdk = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(uid_sdk)
+
+
+class SecretCacheTests(unittest.TestCase):
+    def test_least_recently_used_entry_is_dropped(self):
+        cache = uid_sdk.SecretCache(max_size=2)
+        cache.put("/a", "a", 60)
+        cache.put("/b", "b", 60)
+        cache.get("/a")
+        cache.put("/c", "c", 60)
+
+        self.assertIsNone(cache.get("/b"))
+        self.assertEqual(cache.get("/a"), "a")
+        self.assertEqual(cache.get("/c"), "c")
+
+    def test_expired_entries_are_misses(self):
+        cache = uid_sdk.SecretCache()
+        cache.put("/a", "a", 0)
+        self.assertIsNone(cache.get("/a"))
+        self.assertEqual(cache.misses, 1)
+
+
+class SingleFlightTests(unittest.TestCase):
+    def test_concurrent_calls_share_one_upstream_call(self):
+        single_flight = uid_sdk.SingleFlight()
+        release = threading.Event()
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            release.wait(5)
+            return "value"
+
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            futures = [executor.submit(single_flight.do, "/a", fetch) for _ in range(5)]
+            while single_flight.upstream + single_flight.coalesced < 5:
+                time.sleep(0.01)
+            release.set()
+            self.assertEqual([future.result() for future in futures], ["value"] * 5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual((single_flight.upstream, single_flight.coalesced), (1, 4))
+
+    def test_failed_call_is_not_reused(self):
+        single_flight = uid_sdk.SingleFlight()
+        with self.assertRaises(ValueError):
+            single_flight.do("/a", mock.Mock(side_effect=ValueError))
+        self.assertEqual(single_flight.do("/a", lambda: "retried"), "retried")
+
+
+class FakeFernet:
+    # Stands in for cryptography's Fernet, which is an optional dependency of the sample
+    def __init__(self, key):
+        self.key = key
+
+    @staticmethod
+    def generate_key():
+        return base64.urlsafe_b64encode(os.urandom(32))
+
+    def encrypt(self, data):
+        return base64.b64encode(data[::-1])
+
+    def decrypt(self, token):
+        return base64.b64decode(token)[::-1]
+
+
+class AkeylessConnectionTests(unittest.TestCase):
+    def setUp(self):
+        self.stand_in = StandInServer(seed=1)
+        self.stand_in.start()
+        self.addCleanup(self.stand_in.stop)
+        self.api = akeyless.V2Api(akeyless.ApiClient(akeyless.Configuration(host=self.stand_in.url)))
+        token = self.api.auth(akeyless.Auth(access_id="p-123", access_key="key")).token
+        for name in ["/app/rotated/one", "/app/rotated/two"]:
+            self.api.create_rotated_secret(akeyless.CreateRotatedSecret(name=name, target_name="/target",
+                                                                        rotator_type="api-key", token=token))
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.addCleanup(os.chdir, os.getcwd())
+        os.chdir(directory.name)
+        with open(".vault-token", "w") as f:
+            f.write("u-token")
+        patcher = mock.patch.object(uid_sdk.AkeylessConnection, "setup_api", lambda connection: self.api)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch.dict(os.environ, {"AKEYLESS_CACHE_KEY": FakeFernet.generate_key().decode()})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def rotated_secret_requests(self):
+        return sum(self.stand_in.stats()["requests"].get("/rotated-secret-get-value", {}).values())
+
+    def test_rotated_secret_values_are_cached(self):
+        connection = uid_sdk.AkeylessConnection("p-123", "/app/rotated/one")
+
+        first = connection.get_rotated_secret_data()
+        self.assertEqual(connection.get_rotated_secret_data(), first)
+        connection.get_rotated_secret_data("/app/rotated/two")
+        self.assertEqual(self.rotated_secret_requests(), 2)
+        self.assertEqual(connection.get_fetch_stats()["upstream_fetches"], 2)
+
+        connection.invalidate_secret("/app/rotated/one")
+        connection.get_rotated_secret_data()
+        self.assertEqual(self.rotated_secret_requests(), 3)
+
+    def test_batch_fetch(self):
+        token = self.api.auth(akeyless.Auth(access_id="p-123", access_key="key")).token
+        for name in ["/app/static/one", "/app/static/two"]:
+            self.api.create_secret(akeyless.CreateSecret(name=name, value=f"{name} value", token=token))
+        connection = uid_sdk.AkeylessConnection("p-123", ["/app/rotated/one", "/app/rotated/two"])
+
+        secrets_data = connection.get_secrets_data(static_secret_paths=["/app/static/one", "/app/static/two"])
+        self.assertEqual(set(secrets_data), {"/app/rotated/one", "/app/rotated/two", "/app/static/one",
+                                             "/app/static/two"})
+        self.assertEqual(secrets_data["/app/static/two"], "/app/static/two value")
+        requests = self.stand_in.stats()["requests"]
+        self.assertEqual(requests["/get-secret-value"], {"200": 1})
+        self.assertEqual(self.rotated_secret_requests(), 2)
+
+    def test_refresh_rotates_the_uid_token_and_renews_the_auth_token(self):
+        connection = uid_sdk.AkeylessConnection("p-123", "/app/rotated/one", uid_token_ttl=60, refresh_margin=120)
+        auth_token = connection.auth_token
+
+        connection.refresh_tokens()
+        self.assertNotEqual(connection.auth_token, auth_token)
+        self.assertTrue(connection.uid_token.startswith("u-"))
+        with open(".vault-token") as f:
+            self.assertEqual(f.read(), connection.uid_token)
+        self.assertFalse(os.path.exists(".vault-token.tmp"))
+
+    def test_background_refresh_thread(self):
+        connection = uid_sdk.AkeylessConnection("p-123", "/app/rotated/one", background_refresh=True)
+        self.addCleanup(connection.stop_background_refresh)
+        self.assertTrue(connection.refresh_thread.is_alive())
+        connection.stop_background_refresh()
+        self.assertIsNone(connection.refresh_thread)
+
+    def test_disk_cache_serves_a_new_connection_without_auth(self):
+        patcher = mock.patch.multiple(uid_sdk, Fernet=FakeFernet, InvalidToken=ValueError)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        first = uid_sdk.AkeylessConnection("p-123", "/app/rotated/one", disk_cache_file="cache/secrets")
+        secret_data = first.get_rotated_secret_data()
+        with open("cache/secrets", "rb") as f:
+            self.assertNotIn(b"/app/rotated/one", f.read())
+        auth_requests = self.stand_in.stats()["requests"]["/auth"]["200"]
+
+        second = uid_sdk.AkeylessConnection("p-123", "/app/rotated/one", disk_cache_file="cache/secrets")
+        self.assertEqual(second.get_rotated_secret_data(), secret_data)
+        self.assertEqual(self.stand_in.stats()["requests"]["/auth"]["200"], auth_requests)
+        self.assertEqual(self.rotated_secret_requests(), 1)
+        self.assertEqual(sorted(os.listdir("cache")), ["secrets"])
+
+    def test_disk_cache_needs_a_key(self):
+        patcher = mock.patch.multiple(uid_sdk, Fernet=FakeFernet, InvalidToken=ValueError)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        del os.environ["AKEYLESS_CACHE_KEY"]
+
+        with self.assertRaises(Exception):
+            uid_sdk.AkeylessConnection("p-123", "/app/rotated/one", disk_cache_file="secrets")
+        self.assertFalse(os.path.exists("secrets.key"))
+
+    def test_stale_disk_cache_value_is_refreshed_in_the_background(self):
+        patcher = mock.patch.multiple(uid_sdk, Fernet=FakeFernet, InvalidToken=ValueError)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        uid_sdk.AkeylessConnection("p-123", "/app/rotated/one", disk_cache_file="secrets").get_rotated_secret_data()
+
+        connection = uid_sdk.AkeylessConnection("p-123", "/app/rotated/one", disk_cache_file="secrets",
+                                                disk_cache_fresh_seconds=0)
+        connection.get_rotated_secret_data()
+        for thread in [thread for thread in threading.enumerate() if thread.name == "akeyless-revalidate"]:
+            thread.join()
+        self.assertEqual(self.rotated_secret_requests(), 2)
+
+    def test_failed_background_refresh_keeps_serving_the_stale_value(self):
+        patcher = mock.patch.multiple(uid_sdk, Fernet=FakeFernet, InvalidToken=ValueError)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        secret_data = uid_sdk.AkeylessConnection("p-123", "/app/rotated/one",
+                                                 disk_cache_file="secrets").get_rotated_secret_data()
+        self.stand_in.state.set_faults("/rotated-secret-get-value", {500: 1.0})
+
+        connection = uid_sdk.AkeylessConnection("p-123", "/app/rotated/one", disk_cache_file="secrets",
+                                                disk_cache_fresh_seconds=0)
+        with mock.patch("builtins.print") as print_mock:
+            self.assertEqual(connection.get_rotated_secret_data(), secret_data)
+            for thread in [thread for thread in threading.enumerate() if thread.name == "akeyless-revalidate"]:
+                thread.join()
+            self.assertIn("the cached value stays in use", print_mock.call_args.args[0])
+            self.assertEqual(connection.get_rotated_secret_data(), secret_data)
+            for thread in [thread for thread in threading.enumerate() if thread.name == "akeyless-revalidate"]:
+                thread.join()
+
+    def test_background_refresh_waits_for_the_first_auth_with_a_disk_cache(self):
+        patcher = mock.patch.multiple(uid_sdk, Fernet=FakeFernet, InvalidToken=ValueError)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        auth_requests = self.stand_in.stats()["requests"]["/auth"]["200"]
+
+        connection = uid_sdk.AkeylessConnection("p-123", "/app/rotated/one", disk_cache_file="secrets",
+                                                background_refresh=True)
+        self.addCleanup(connection.stop_background_refresh)
+        time.sleep(0.2)
+
+        self.assertIsNone(connection.auth_token)
+        self.assertEqual(self.stand_in.stats()["requests"]["/auth"]["200"], auth_requests)
+
+    def test_cache_ttl_follows_the_next_rotation(self):
+        connection = uid_sdk.AkeylessConnection("p-123", "/app/rotated/one")
+        next_rotation = datetime.now(timezone.utc) + timedelta(hours=1)
+        item = mock.Mock(next_rotation_date=next_rotation, rotation_interval=30)
+        with mock.patch.object(self.api, "describe_item", return_value=item):
+            self.assertAlmostEqual(connection.secret_cache_ttl("/app/rotated/one"), 3600, delta=5)
+
+    def test_rotation_schedule_is_described_once_per_path(self):
+        connection = uid_sdk.AkeylessConnection("p-123", "/app/rotated/one")
+        item = mock.Mock(next_rotation_date=datetime.now(timezone.utc) + timedelta(hours=1), rotation_interval=30)
+        with mock.patch.object(self.api, "describe_item", return_value=item) as describe_item:
+            for _ in range(3):
+                connection.invalidate_secret()
+                connection.get_rotated_secret_data()
+
+            self.assertEqual(describe_item.call_count, 1)
+
+            # Once the rotation has passed the path is described again, but an overdue rotation is not described
+            # on every miss
+            item.next_rotation_date = datetime.now(timezone.utc) - timedelta(seconds=1)
+            connection.rotation_schedules["/app/rotated/one"].update(next_rotation=time.time() - 1,
+                                                                     described_at=time.time() - 2)
+            for _ in range(3):
+                self.assertEqual(connection.secret_cache_ttl("/app/rotated/one"), connection.default_cache_ttl)
+            self.assertEqual(describe_item.call_count, 2)
+
+    def test_item_without_a_rotation_date_is_described_once(self):
+        connection = uid_sdk.AkeylessConnection("p-123", "/app/rotated/one")
+        item = mock.Mock(next_rotation_date=None, rotation_interval=None)
+        with mock.patch.object(self.api, "describe_item", return_value=item) as describe_item:
+            for _ in range(3):
+                self.assertEqual(connection.secret_cache_ttl("/app/rotated/one"), connection.default_cache_ttl)
+
+            self.assertEqual(describe_item.call_count, 1)
+
+    def test_failed_describe_is_not_repeated(self):
+        connection = uid_sdk.AkeylessConnection("p-123", "/app/rotated/one")
+        with mock.patch.object(self.api, "describe_item", side_effect=akeyless.ApiException(status=403)) as describe_item:
+            for _ in range(3):
+                connection.invalidate_secret()
+                connection.get_rotated_secret_data()
+
+            self.assertEqual(describe_item.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
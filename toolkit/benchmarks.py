@@ -0,0 +1,348 @@
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from akeyless import CreateSecret, GetSecretValue, ListItems
+
+from configs.akeyless_config import AkeylessConfig
+from configs.api_client import close_clients
+from configs.request_phases import phase_recorder
+from create_resources.create_access_role import apply_role_rules, create_akeyless_role
+from create_resources.create_auth_method import create_api_auth_method
+from create_resources.create_rotated_secret import azure_bulk_load, azure_stream_bulk_load, SECRET_FAILED
+from toolkit.latency_recorder import LatencyRecorder, RecordedApi
+from toolkit.stand_in_server import StandInServer
+
+DEFAULT_BASELINE_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks",
+                                     "baseline.json")
+BULK_CSV_HEADER = ["cloud_env", "secret_path", "secret_name", "line_of_business", "app_name", "itpm_number",
+                   "description", "application_id", "owner1", "owner2", "owner3"]
+APPLICATION_ID = "f00913c3-0a8b-48a4-b9f6-30ed61626622"
+
+
+@contextlib.contextmanager
+def benchmark_environment(values):
+    # AkeylessConfig reads its settings from the environment, so set them for the run and put the old ones back after
+    saved = {key: os.environ.get(key) for key in values}
+    os.environ.update(values)
+    try:
+        yield
+    finally:
+        for key, value in saved.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+
+
+def write_bulk_csv(csv_file, rows, apps, scenario):
+    with open(csv_file, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(BULK_CSV_HEADER)
+        for row in range(rows):
+            writer.writerow(["azure", "", f"{scenario}-secret-{row}", "bench", f"app{row % apps}", "itpm0001", "",
+                             APPLICATION_ID, "owner1@email.com", "owner2@email.com", ""])
+
+
+def bulk_csv_load(config, work_dir, size):
+    csv_file = os.path.join(work_dir, "bulk_csv_load.csv")
+    write_bulk_csv(csv_file, size, 5, "serial")
+    config.default_bulk_load_location = csv_file
+    summary = azure_bulk_load(config)
+    return summary["rows"] - summary[SECRET_FAILED]
+
+
+def bulk_csv_concurrent_load(config, work_dir, size):
+    csv_file = os.path.join(work_dir, "bulk_csv_concurrent_load.csv")
+    write_bulk_csv(csv_file, size, 5, "concurrent")
+    config.default_bulk_load_location = csv_file
+    summary = azure_stream_bulk_load(config)
+    return summary["rows"] - summary[SECRET_FAILED]
+
+
+def role_rule_application(config, work_dir, size):
+    rules_per_role = 8
+    applied = 0
+    for role in range(max(1, size // rules_per_role)):
+        role_path = f"/cvs/bench/app{role}-itpm0001/roles/app{role}-itpm0001-role"
+        create_akeyless_role(config, role_path)
+        rules = [("item-rule", f"/cvs/bench/app{role}-itpm0001/secrets/path{rule}/*", ["read", "list"])
+                 for rule in range(rules_per_role)]
+        applied += apply_role_rules(config, role_path, rules)["applied"]
+    return applied
+
+
+def auth_method_creation(config, work_dir, size):
+    created = 0
+    for auth_method in range(size):
+        auth_data = create_api_auth_method(config, f"/cvs/bench/app{auth_method}-itpm0001/authmethod/api-key/am")
+        created += 1 if auth_data and auth_data["is_new"] else 0
+    return created
+
+
+def retrieval_secret_names():
+    return [f"/cvs/bench/app{secret % 5}-itpm0001/secrets/static/secret-{secret}" for secret in range(50)]
+
+
+def create_retrieval_secrets(config, work_dir):
+    for name in retrieval_secret_names():
+        config.api.create_secret(CreateSecret(name=name, value=f"value-{name}", token=config.auth_token))
+
+
+def secret_retrieval(config, work_dir, size):
+    names = retrieval_secret_names()
+
+    def get_secret(index):
+        config.api.get_secret_value(GetSecretValue(names=[names[index % len(names)]], token=config.auth_token))
+
+    with ThreadPoolExecutor(max_workers=config.bulk_load_workers) as executor:
+        list(executor.map(get_secret, range(size)))
+    return size
+
+
+def calibration_requests(config, work_dir, size):
+    # The simplest call there is, sent one at a time, so its speed shows how fast this machine runs the api stack
+    for _ in range(size):
+        config.api.list_items(ListItems(path="/cvs/calibration", token=config.auth_token))
+    return size
+
+
+# Run before the scenarios. Scenario results are also stored relative to it, so baselines can be compared across
+# machines. It runs in rounds, and how far the rounds' p95 spread shows how noisy the machine is during this run
+CALIBRATION = (calibration_requests, 100, None)
+CALIBRATION_ROUNDS = 5
+
+# Scenario name to (function, units at scale 1, untimed setup)
+SCENARIOS = {
+    "bulk_csv_load": (bulk_csv_load, 100, None),
+    "bulk_csv_concurrent_load": (bulk_csv_concurrent_load, 400, None),
+    "role_rule_application": (role_rule_application, 160, None),
+    "auth_method_creation": (auth_method_creation, 50, None),
+    "secret_retrieval": (secret_retrieval, 500, create_retrieval_secrets),
+}
+
+
+def run_benchmarks(latency=0.005, scale=1.0, workers=8, scenarios=None, seed=1):
+    """
+    Run the onboarding hot paths against a local stand-in with fixed latency
+
+    :param latency: Seconds of latency the stand-in adds to every request
+    :param scale: Multiplier for the number of rows, rules, auth methods and reads in each scenario
+    :param workers: Worker count for the concurrent paths
+    :param scenarios: Names of the scenarios to run. Defaults to all of them
+    :param seed: Seed for the stand-in
+    :return: results: Dictionary with the settings, the calibration run, each scenario's throughput and api call
+             latency, also relative to the calibration, and the request phases
+    """
+    scenarios = scenarios or list(SCENARIOS)
+    results = {"created": datetime.now(timezone.utc).isoformat(), "latency": latency, "scale": scale,
+               "workers": workers, "scenarios": {}}
+
+    with tempfile.TemporaryDirectory() as work_dir, \
+            StandInServer(latency={"*": f"fixed:{latency}"}, seed=seed) as stand_in:
+        env_file = os.path.join(work_dir, ".env")
+        open(env_file, "w").close()
+        settings = {
+            "ENV": "UAT",
+            "UAT_LOAD_BALANCER_BASE_URL": stand_in.url,
+            "UAT_API_ACCESS_ID": "p-benchmark",
+            "UAT_API_ACCESS_KEY": "benchmark",
+            "DEFAULT_ENGINEER": "Steven Sutton",
+            "DEFAULT_BULK_LOAD_WORKERS": str(workers),
+            "DEFAULT_LOCATION_BULK_JOURNAL_FILE": "",
+            "TOKEN_CACHE_FILE": os.path.join(work_dir, "token_cache.json"),
+            "NODE_SELECTION": "false",
+            "API_PHASE_TIMING": "true",
+        }
+        with benchmark_environment(settings), contextlib.redirect_stdout(io.StringIO()):
+            config = AkeylessConfig(env_file, is_testing=True)
+        try:
+            api = config.api
+            function, units, _ = CALIBRATION
+            rounds = [run_scenario(config, api, stand_in.url, work_dir, "calibration", function, units * scale)
+                      for _ in range(CALIBRATION_ROUNDS)]
+            rounds.sort(key=lambda calibration_round: calibration_round["p95"])
+            # The median round is the calibration the scenarios are stored relative to
+            calibration = rounds[len(rounds) // 2]
+            calibration["p95_spread"] = rounds[-1]["p95"] / rounds[0]["p95"] - 1 if rounds[0]["p95"] else 0.0
+            results["calibration"] = calibration
+
+            for name in scenarios:
+                function, units, setup = SCENARIOS[name]
+                if setup is not None:
+                    config.api = api
+                    setup(config, work_dir)
+                scenario = run_scenario(config, api, stand_in.url, work_dir, name, function, units * scale)
+                scenario["relative_throughput"] = \
+                    scenario["throughput"] / calibration["throughput"] if calibration["throughput"] else 0.0
+                scenario["relative_p95"] = scenario["p95"] / calibration["p95"] if calibration["p95"] else 0.0
+                results["scenarios"][name] = scenario
+        finally:
+            config.token_manager.stop_background_refresh()
+            results["stand_in"] = stand_in.stats()
+            results["phases"] = phase_recorder.summary()
+            close_clients()
+    return results
+
+
+# Run to run noise on a shared machine is up to about a quarter of the throughput, so only changes beyond that count
+# as regressions. The p95 threshold is widened to the calibration spread of either run when that is larger
+DEFAULT_THRESHOLD = 0.35
+DEFAULT_P95_THRESHOLD = 0.35
+
+
+def run_scenario(config, api, url, work_dir, name, function, units):
+    """
+    Time one scenario and record the latency of its api calls
+
+    :return: scenario: Dictionary with the units completed, seconds, throughput, p50/p95 and the api call summary
+    """
+    recorder = LatencyRecorder(name)
+    config.api = RecordedApi(api, recorder, url)
+    start_time = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        completed = function(config, work_dir, max(1, int(units)))
+    elapsed = time.perf_counter() - start_time
+
+    all_calls = recorder.combined()
+    return {
+        "units": completed,
+        "seconds": elapsed,
+        "throughput": completed / elapsed if elapsed > 0 else 0.0,
+        "p50": all_calls.percentile(50),
+        "p95": all_calls.percentile(95),
+        "api_calls": {row["operation"]: {key: row[key] for key in ["count", "errors", "p50", "p95"]}
+                      for row in recorder.summary()},
+    }
+
+
+def effective_p95_threshold(results, baseline, p95_threshold=DEFAULT_P95_THRESHOLD):
+    # The larger of the threshold and the p95 spread of either run's calibration rounds
+    return max([p95_threshold] + [run.get("calibration", {}).get("p95_spread", 0.0) for run in [results, baseline]])
+
+
+def compare_to_baseline(results, baseline, threshold=DEFAULT_THRESHOLD, p95_threshold=DEFAULT_P95_THRESHOLD):
+    """
+    Compare each scenario's throughput and p95 api call latency against a baseline run. Both are compared relative to
+    each run's calibration, so a baseline saved on a faster or slower machine still applies. Baselines saved before
+    calibration was added are compared on the absolute numbers
+
+    :param results: Results from run_benchmarks
+    :param baseline: Results of an earlier run
+    :param threshold: Share throughput may drop by before it counts as a regression
+    :param p95_threshold: Share p95 may grow by before it counts as a regression. Raised to the p95 spread of either
+                          run's calibration rounds when that is larger, so a noisy machine does not fail the run
+    :return: List of regression messages, empty when nothing regressed
+    """
+    p95_threshold = effective_p95_threshold(results, baseline, p95_threshold)
+    regressions = []
+    for name, scenario in results["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if before is None:
+            continue
+        if "relative_throughput" in scenario and "relative_throughput" in before:
+            throughput_key, throughput_unit, p95_key, p95_unit = \
+                "relative_throughput", "x calibration", "relative_p95", "x calibration"
+        else:
+            throughput_key, throughput_unit, p95_key, p95_unit = "throughput", "/s", "p95", "s"
+        if scenario[throughput_key] < before[throughput_key] * (1 - threshold):
+            regressions.append(f"{name}: throughput {scenario[throughput_key]:.2f}{throughput_unit} is down from "
+                               f"{before[throughput_key]:.2f}{throughput_unit}")
+        if before[p95_key] and scenario[p95_key] and scenario[p95_key] > before[p95_key] * (1 + p95_threshold):
+            regressions.append(f"{name}: p95 {scenario[p95_key]:.4f}{p95_unit} is up from "
+                               f"{before[p95_key]:.4f}{p95_unit}")
+    return regressions
+
+
+def print_benchmark_report(results, baseline=None):
+    print(f"Benchmarks against the stand-in with {results['latency']}s latency, scale {results['scale']}, "
+          f"{results['workers']} workers")
+    calibration = results.get("calibration")
+    if calibration:
+        print(f"\tCalibration: {calibration['throughput']:.1f} requests/s, p95 {calibration['p95']:.4f}s, "
+              f"p95 spread {calibration.get('p95_spread', 0.0):.0%} over {CALIBRATION_ROUNDS} rounds")
+    print(f"\t{'scenario':<28}{'units':>7}{'seconds':>9}{'units/s':>10}{'p50':>9}{'p95':>9}{'x calib':>9}"
+          f"{'base units/s':>14}{'base p95':>10}{'base x calib':>14}")
+    for name, scenario in results["scenarios"].items():
+        before = (baseline or {}).get("scenarios", {}).get(name)
+        if before:
+            base = f"{before['throughput']:>14.1f}{before['p95']:>10.4f}{before.get('relative_throughput', 0.0):>14.2f}"
+        else:
+            base = f"{'-':>14}{'-':>10}{'-':>14}"
+        print(f"\t{name:<28}{scenario['units']:>7}{scenario['seconds']:>9.2f}{scenario['throughput']:>10.1f}"
+              f"{scenario['p50']:>9.4f}{scenario['p95']:>9.4f}{scenario['relative_throughput']:>9.2f}{base}")
+    print("--" * 20)
+    if results.get("phases"):
+        print("Request phases per endpoint (mean seconds)")
+        for row in results["phases"]:
+            phases = ", ".join(f"{phase} {row[f'{phase}_mean']:.4f}" for phase in ["dns", "connect", "tls", "server",
+                                                                                 "deserialize", "other"])
+            print(f"\t{row['endpoint']:<40}{row['count']:>6}  {phases}")
+        print("--" * 20)
+
+
+def load_results(results_file):
+    with open(results_file, "r") as f:
+        return json.load(f)
+
+
+def save_results(results, results_file):
+    directory = os.path.dirname(results_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(results_file, "w") as f:
+        json.dump(results, f, indent=2)
+    return results_file
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the onboarding hot paths against a local stand-in")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_FILE,
+                        help=f"Baseline results to compare against (default {DEFAULT_BASELINE_FILE})")
+    parser.add_argument("--save-baseline", action="store_true", help="Save this run as the new baseline")
+    parser.add_argument("--output", default=None, help="Also save this run's results to a file")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help=f"Share throughput may drop by before the run fails (default {DEFAULT_THRESHOLD})")
+    parser.add_argument("--p95-threshold", type=float, default=DEFAULT_P95_THRESHOLD,
+                        help=f"Share p95 may grow by before the run fails, raised to the calibration p95 spread "
+                             f"when that is larger (default {DEFAULT_P95_THRESHOLD})")
+    parser.add_argument("--latency", type=float, default=0.005,
+                        help="Seconds of latency the stand-in adds to each request (default 0.005)")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier for the scenario sizes (default 1)")
+    parser.add_argument("--workers", type=int, default=8, help="Workers for the concurrent paths (default 8)")
+    parser.add_argument("--scenario", action="append", choices=list(SCENARIOS),
+                        help="Scenario to run. Can be repeated. Defaults to all")
+    args = parser.parse_args()
+
+    baseline = load_results(args.baseline) if os.path.exists(args.baseline) else None
+    if baseline is not None and not args.save_baseline and \
+            (baseline["latency"], baseline["scale"], baseline["workers"]) != (args.latency, args.scale, args.workers):
+        print(f"The baseline in {args.baseline} was run with different settings; run with the same --latency, "
+              f"--scale and --workers or save a new baseline")
+        sys.exit(2)
+
+    results = run_benchmarks(args.latency, args.scale, args.workers, args.scenario)
+    print_benchmark_report(results, baseline)
+    if args.output:
+        print(f"Results saved to {save_results(results, args.output)}")
+
+    if args.save_baseline:
+        print(f"Baseline saved to {save_results(results, args.baseline)}")
+    elif baseline is None:
+        print(f"No baseline at {args.baseline}. Run with --save-baseline to store one")
+    else:
+        regressions = compare_to_baseline(results, baseline, args.threshold, args.p95_threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions beyond {args.threshold:.0%} throughput or "
+              f"{effective_p95_threshold(results, baseline, args.p95_threshold):.0%} p95")
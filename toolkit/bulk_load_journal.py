@@ -0,0 +1,97 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime, timezone
+
+# Statuses that mean the row does not need to be sent again on a resumed run
+COMPLETED_STATUSES = ["created", "already-exists"]
+
+
+class BulkLoadJournal:
+    """
+    Append-only journal of finished bulk load rows, keyed by secret path and a hash of the csv row.
+
+    Every entry is a single json line written with one call while holding a lock, so worker threads never interleave
+    their entries. A run that is killed part way through can leave a partial last line behind; those lines are
+    ignored when the journal is read back in, so the row is simply loaded again on the next run.
+
+    Only keys from earlier runs are kept in memory. A run reads each csv row once, so the rows it records itself are
+    never looked up again and holding them would grow with the size of the file.
+    """
+
+    def __init__(self, journal_file):
+        self.journal_file = journal_file
+        self.lock = threading.Lock()
+        self.completed = set()
+        self.skipped_lines = 0
+        self.load()
+        self.file = open(self.journal_file, "a", encoding="utf-8")
+        # Start on a fresh line if the last run died part way through writing an entry
+        if self.file.tell() > 0:
+            with open(self.journal_file, "rb") as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    self.file.write("\n")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @staticmethod
+    def row_hash(row):
+        """
+        Hash of the csv row values, so a row that was edited after a failed run is loaded again
+
+        :param row: List of values from the csv row
+        :return: Hex sha256 digest of the row
+        """
+        return hashlib.sha256(json.dumps(row).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def key(secret_path, row_hash):
+        return f"{secret_path}|{row_hash}"
+
+    def load(self):
+        try:
+            with open(self.journal_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                        if entry["status"] in COMPLETED_STATUSES:
+                            self.completed.add(self.key(entry["secret_path"], entry["row_hash"]))
+                    except (ValueError, KeyError, TypeError):
+                        self.skipped_lines += 1
+        except FileNotFoundError:
+            pass
+
+    def is_complete(self, secret_path, row_hash):
+        return self.key(secret_path, row_hash) in self.completed
+
+    def record(self, secret_path, row_hash, status):
+        """
+        Append the result of a row to the journal. Safe to call from worker threads.
+
+        :param secret_path: Absolute path of the secret in akeyless
+        :param row_hash: Hash of the csv row from row_hash
+        :param status: Status the row finished with
+        """
+        entry = {
+            "secret_path": secret_path,
+            "row_hash": row_hash,
+            "status": status,
+            "time": datetime.now(timezone.utc).isoformat()
+        }
+        line = json.dumps(entry) + "\n"
+        with self.lock:
+            self.file.write(line)
+            self.file.flush()
+
+    def close(self):
+        with self.lock:
+            if not self.file.closed:
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self.file.close()
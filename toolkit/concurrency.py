@@ -0,0 +1,165 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+
+import urllib3
+from akeyless import ApiException
+
+from toolkit.retry import THROTTLE_STATUSES
+
+
+def is_throttle_signal(error):
+    """
+    Check if an error means the gateway is over capacity and callers should slow down
+
+    :param error: Exception raised by a V2Api call
+    """
+    if isinstance(error, ApiException):
+        return error.status in THROTTLE_STATUSES
+    return isinstance(error, (urllib3.exceptions.TimeoutError, urllib3.exceptions.MaxRetryError,
+                              urllib3.exceptions.ProtocolError, TimeoutError))
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Shared governor for the number of requests in flight, using additive increase / multiplicative decrease.
+
+    While latency and the error rate stay healthy the limit grows by about one request per limit's worth of
+    successes. A throttle signal (429, 503, timeouts) cuts the limit by backoff_factor, at most once per cooldown so a
+    burst of throttled requests that were already in flight only counts once.
+    """
+
+    def __init__(self, initial_limit=4, min_limit=1, max_limit=32, backoff_factor=0.5, latency_target=2.0,
+                 max_error_rate=0.05, window=100, cooldown=1.0):
+        """
+        :param initial_limit: Requests allowed in flight at the start
+        :param min_limit: Lowest the limit will go
+        :param max_limit: Highest the limit will go
+        :param backoff_factor: Multiplier applied to the limit on a throttle signal
+        :param latency_target: Seconds of smoothed latency above which the limit stops growing. None to ignore latency
+        :param max_error_rate: Share of failed requests in the window above which the limit stops growing
+        :param window: Number of recent requests used for the error rate
+        :param cooldown: Least number of seconds between two backoffs
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(max(min_limit, min(initial_limit, max_limit)))
+        self.backoff_factor = backoff_factor
+        self.latency_target = latency_target
+        self.max_error_rate = max_error_rate
+        self.cooldown = cooldown
+
+        self.condition = threading.Condition()
+        self.in_flight = 0
+        self.outcomes = deque(maxlen=window)
+        self.latency = None
+        self.last_backoff = 0.0
+        self.successes = 0
+        self.errors = 0
+        self.throttles = 0
+        self.backoffs = 0
+        self.peak_limit = self.limit
+
+    def acquire(self):
+        with self.condition:
+            while self.in_flight >= int(self.limit):
+                self.condition.wait()
+            self.in_flight += 1
+        return time.perf_counter()
+
+    def release(self, start_time, error=None):
+        latency = time.perf_counter() - start_time
+        throttled = error is not None and is_throttle_signal(error)
+        # Errors such as 404 and 409 are answered normally, so they do not count against gateway health
+        failed = throttled or (isinstance(error, ApiException) and (error.status or 0) >= 500)
+
+        with self.condition:
+            self.in_flight -= 1
+            self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+            self.outcomes.append(failed)
+
+            now = time.monotonic()
+            if throttled:
+                self.throttles += 1
+                if now - self.last_backoff >= self.cooldown:
+                    self.limit = max(self.min_limit, self.limit * self.backoff_factor)
+                    self.last_backoff = now
+                    self.backoffs += 1
+            elif failed:
+                self.errors += 1
+            else:
+                self.successes += 1
+                if self.is_healthy():
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+                    self.peak_limit = max(self.peak_limit, self.limit)
+
+            self.condition.notify_all()
+
+    def is_healthy(self):
+        # Callers hold self.condition
+        if self.latency_target is not None and self.latency is not None and self.latency > self.latency_target:
+            return False
+        return self.error_rate() <= self.max_error_rate
+
+    def error_rate(self):
+        return sum(self.outcomes) / len(self.outcomes) if self.outcomes else 0.0
+
+    @contextmanager
+    def slot(self):
+        start_time = self.acquire()
+        try:
+            yield
+        except BaseException as e:
+            self.release(start_time, e)
+            raise
+        else:
+            self.release(start_time)
+
+    def state(self):
+        """
+        Current state of the governor, for tuning gateway capacity
+
+        :return: Dictionary with the limit, requests in flight, smoothed latency, error rate and counters
+        """
+        with self.condition:
+            return {
+                "limit": int(self.limit),
+                "peak_limit": int(self.peak_limit),
+                "in_flight": self.in_flight,
+                "latency_seconds": round(self.latency, 4) if self.latency is not None else None,
+                "error_rate": round(self.error_rate(), 4),
+                "successes": self.successes,
+                "errors": self.errors,
+                "throttles": self.throttles,
+                "backoffs": self.backoffs,
+            }
+
+    def describe(self):
+        state = self.state()
+        return (f"Concurrency limit {state['limit']} (peak {state['peak_limit']}, range {self.min_limit}-"
+                f"{self.max_limit}), {state['in_flight']} in flight, latency {state['latency_seconds']}s, error rate "
+                f"{state['error_rate']:.1%}, {state['throttles']} throttled requests, {state['backoffs']} backoffs")
+
+
+class GovernedApi:
+    """
+    Wraps a V2Api so every call waits for a slot from the limiter and reports how it went
+    """
+
+    def __init__(self, api, limiter):
+        self.api = api
+        self.limiter = limiter
+
+    def __getattr__(self, name):
+        attribute = getattr(self.api, name)
+        if name.startswith("_") or not callable(attribute):
+            return attribute
+
+        @wraps(attribute)
+        def governed(*args, **kwargs):
+            with self.limiter.slot():
+                return attribute(*args, **kwargs)
+
+        return governed
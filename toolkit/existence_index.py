@@ -0,0 +1,163 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from akeyless import ListItems, ListRoles, ListAuthMethods
+
+from configs.akeyless_config import write_error
+
+
+def app_prefix(line_of_business, app_team_name, itpm):
+    return f"/cvs/{line_of_business}/{app_team_name}-{itpm}/"
+
+
+class ExistenceIndex:
+    """
+    In-memory set of the items, roles and auth methods that already exist under a set of app prefixes.
+
+    The create functions check the index before sending a create request, so items that already exist are skipped
+    without any network call. A path that is not in the index is created as normal, and the 409 handling still
+    catches anything created after the index was built, or under a prefix that could not be listed.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.paths = set()
+        self.prefixes = set()
+        self.listing = set()
+        self.failed_prefixes = set()
+        self.list_calls = 0
+
+    def exists(self, path):
+        with self.lock:
+            return path in self.paths
+
+    def add(self, path):
+        with self.lock:
+            self.paths.add(path)
+
+    def add_prefix(self, config, prefix):
+        """
+        List everything under the prefix once and add the existing paths to the index. A prefix that cannot be listed
+        is logged and left out of the index, so its items go through the normal create and 409 handling.
+
+        :param config: Akeyless configuration for api and auth token
+        :param prefix: App prefix in the form /cvs/<lob>/<app>-<itpm>/
+        :return: True if the prefix is indexed
+        """
+        with self.lock:
+            if prefix in self.prefixes or prefix in self.listing:
+                return prefix in self.prefixes
+            self.listing.add(prefix)
+
+        paths = set()
+        try:
+            paths.update(self.list_items(config, prefix))
+            paths.update(self.list_roles(config, prefix))
+            paths.update(self.list_auth_methods(config, prefix))
+        except Exception as e:
+            write_error(e, f"Unable to list existing items under {prefix}. They will be checked when created\n")
+            with self.lock:
+                self.failed_prefixes.add(prefix)
+            return False
+        finally:
+            with self.lock:
+                self.listing.discard(prefix)
+
+        # Only a complete listing marks the prefix done, so a failed one is listed again next time
+        with self.lock:
+            self.paths.update(paths)
+            self.prefixes.add(prefix)
+            self.failed_prefixes.discard(prefix)
+        return True
+
+    def list_items(self, config, prefix):
+        folders = [prefix.rstrip("/")]
+        listed = set()
+        while folders:
+            folder = folders.pop().rstrip("/")
+            if folder in listed:
+                continue
+            listed.add(folder)
+            pagination_token = None
+            while True:
+                body = ListItems(path=folder, pagination_token=pagination_token, auto_pagination="disabled",
+                                 token=config.auth_token)
+                response = config.api.list_items(body)
+                self.count_call()
+                for item in response.items or []:
+                    yield item.item_name
+                folders.extend(sub_folder for sub_folder in response.folders or [] if sub_folder.startswith(prefix))
+                pagination_token = response.next_page
+                if not pagination_token:
+                    break
+
+    def list_roles(self, config, prefix):
+        pagination_token = None
+        while True:
+            body = ListRoles(filter=prefix, pagination_token=pagination_token, token=config.auth_token)
+            response = config.api.list_roles(body)
+            self.count_call()
+            for role in response.roles or []:
+                if role.role_name.startswith(prefix):
+                    yield role.role_name
+            pagination_token = response.next_page
+            if not pagination_token:
+                break
+
+    def list_auth_methods(self, config, prefix):
+        pagination_token = None
+        while True:
+            body = ListAuthMethods(filter=prefix, pagination_token=pagination_token, token=config.auth_token)
+            response = config.api.list_auth_methods(body)
+            self.count_call()
+            for auth_method in response.auth_methods or []:
+                if auth_method.auth_method_name.startswith(prefix):
+                    yield auth_method.auth_method_name
+            pagination_token = response.next_page
+            if not pagination_token:
+                break
+
+    def count_call(self):
+        with self.lock:
+            self.list_calls += 1
+
+
+def build_existence_index(config, prefixes, workers=4):
+    """
+    Pre-flight phase for create runs. Lists every prefix once, in parallel, and stores the index on the config as
+    config.existence_index so the create functions can skip items that already exist.
+
+    :param config: Akeyless configuration for api and auth token
+    :param prefixes: App prefixes in the form /cvs/<lob>/<app>-<itpm>/
+    :param workers: Number of prefixes to list at the same time
+    :return: index: The ExistenceIndex stored on the config
+    """
+    if config.existence_index is None:
+        config.existence_index = ExistenceIndex()
+    index = config.existence_index
+
+    prefixes = set(prefixes)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(lambda prefix: index.add_prefix(config, prefix), prefixes))
+
+    print(f"Found {len(index.paths)} existing items under {len(index.prefixes)} app paths "
+          f"using {index.list_calls} list calls")
+    if index.failed_prefixes:
+        print(f"Unable to list {len(index.failed_prefixes)} app paths, their items will be checked when created")
+    print("--" * 20)
+    return index
+
+
+def already_exists(config, path):
+    """
+    Check the pre-flight index for the path. Always False when no index was built.
+
+    :param config: Akeyless configuration for api and auth token
+    :param path: Absolute path of the item, role or auth method
+    """
+    return config.existence_index is not None and config.existence_index.exists(path)
+
+
+def mark_created(config, path):
+    if config.existence_index is not None:
+        config.existence_index.add(path)
@@ -0,0 +1,355 @@
+import argparse
+import csv
+import json
+import math
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from functools import wraps
+
+SUMMARY_CSV_FIELDS = ["operation", "url", "count", "errors", "mean", "p50", "p95", "p99", "max", "statuses"]
+STATUS_OK = "ok"
+
+
+def error_status(error):
+    """
+    Status recorded for a failed call: the http status for api errors, otherwise the exception name
+    """
+    return str(getattr(error, "status", None) or type(error).__name__)
+
+
+def api_host(api):
+    """
+    Gateway url a V2Api talks to, or None if it cannot be told
+    """
+    try:
+        return api.api_client.configuration.host
+    except AttributeError:
+        return None
+
+
+class LatencyHistogram:
+    """
+    Latency histogram with log-spaced buckets, so memory stays bounded however many samples are recorded.
+
+    Each bucket is growth times wider than the last, so percentiles are accurate to within that factor. min and max are
+    kept exactly.
+    """
+
+    def __init__(self, min_value=0.0001, growth=1.05):
+        self.min_value = min_value
+        self.growth = growth
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def bucket(self, value):
+        if value <= self.min_value:
+            return 0
+        return int(math.log(value / self.min_value) / math.log(self.growth)) + 1
+
+    def record(self, value, count=1):
+        index = self.bucket(value)
+        self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += count
+        self.total += value * count
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def merge(self, other):
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        if other.count:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def percentile(self, percent):
+        if not self.count:
+            return None
+        rank = max(1, math.ceil(self.count * percent / 100))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                upper = self.min_value * self.growth ** index
+                return min(max(upper, self.min), self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def to_dict(self):
+        return {
+            "min_value": self.min_value,
+            "growth": self.growth,
+            "count": self.count,
+            "total": self.total,
+            "min": self.min,
+            "max": self.max,
+            "buckets": {str(index): count for index, count in sorted(self.buckets.items())},
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        histogram = cls(data["min_value"], data["growth"])
+        histogram.buckets = {int(index): count for index, count in data["buckets"].items()}
+        histogram.count = data["count"]
+        histogram.total = data["total"]
+        histogram.min = data["min"]
+        histogram.max = data["max"]
+        return histogram
+
+
+class LatencyRecorder:
+    """
+    Thread-safe store of latency samples, one histogram per operation, url and status
+    """
+
+    def __init__(self, name=None):
+        """
+        :param name: Label saved with the run, such as the environment tested
+        """
+        self.name = name
+        self.started = datetime.now(timezone.utc).isoformat()
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def record(self, operation, url, status, latency):
+        """
+        Record one sample
+
+        :param operation: Operation name, such as get_static_secret
+        :param url: Gateway url the call went to
+        :param status: STATUS_OK or the error status
+        :param latency: Seconds the call took
+        """
+        key = (operation, url or "", str(status))
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = LatencyHistogram()
+            self.histograms[key].record(latency)
+
+    @contextmanager
+    def measure(self, operation, url):
+        """
+        Time the block and record it, with the error status if it raises
+        """
+        start_time = time.perf_counter()
+        try:
+            yield
+        except Exception as e:
+            self.record(operation, url, error_status(e), time.perf_counter() - start_time)
+            raise
+        self.record(operation, url, STATUS_OK, time.perf_counter() - start_time)
+
+    def combined(self):
+        """
+        One histogram of every sample recorded, across operations, urls and statuses
+        """
+        combined = LatencyHistogram()
+        with self.lock:
+            for histogram in self.histograms.values():
+                combined.merge(histogram)
+        return combined
+
+    def summary(self):
+        """
+        Latency for each operation and url, across all statuses
+
+        :return: List of dictionaries with count, errors, mean, p50, p95, p99, max and the count for each status
+        """
+        with self.lock:
+            items = list(self.histograms.items())
+
+        merged = {}
+        for (operation, url, status), histogram in items:
+            if (operation, url) not in merged:
+                merged[(operation, url)] = (LatencyHistogram(histogram.min_value, histogram.growth), {})
+            combined, statuses = merged[(operation, url)]
+            combined.merge(histogram)
+            statuses[status] = statuses.get(status, 0) + histogram.count
+
+        rows = []
+        for (operation, url), (histogram, statuses) in sorted(merged.items()):
+            rows.append({
+                "operation": operation,
+                "url": url,
+                "count": histogram.count,
+                "errors": sum(count for status, count in statuses.items() if status != STATUS_OK),
+                "mean": histogram.mean(),
+                "p50": histogram.percentile(50),
+                "p95": histogram.percentile(95),
+                "p99": histogram.percentile(99),
+                "max": histogram.max,
+                "statuses": statuses,
+            })
+        return rows
+
+    def save(self, results_file):
+        """
+        Save the run as json (histograms and summary, can be loaded again) or as a csv summary when the file name ends
+        in .csv
+
+        :param results_file: File to write
+        """
+        summary = self.summary()
+        with open(results_file, "w", newline="") as f:
+            if results_file.lower().endswith(".csv"):
+                writer = csv.DictWriter(f, fieldnames=SUMMARY_CSV_FIELDS)
+                writer.writeheader()
+                for row in summary:
+                    writer.writerow({**row, "statuses": json.dumps(row["statuses"])})
+            else:
+                with self.lock:
+                    histograms = [{"operation": operation, "url": url, "status": status, **histogram.to_dict()}
+                                  for (operation, url, status), histogram in self.histograms.items()]
+                json.dump({"name": self.name, "started": self.started, "histograms": histograms,
+                           "summary": summary}, f, indent=2)
+        return results_file
+
+    @classmethod
+    def load(cls, results_file):
+        with open(results_file, "r") as f:
+            data = json.load(f)
+        recorder = cls(data.get("name"))
+        recorder.started = data.get("started")
+        for histogram in data["histograms"]:
+            recorder.histograms[(histogram["operation"], histogram["url"], histogram["status"])] = \
+                LatencyHistogram.from_dict(histogram)
+        return recorder
+
+    def print_summary(self):
+        print(f"\t{'operation':<24}{'count':>7}{'errors':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}  url")
+        for row in self.summary():
+            latencies = "".join(f"{row[key]:>9.4f}" for key in ["p50", "p95", "p99", "max"])
+            print(f"\t{row['operation']:<24}{row['count']:>7}{row['errors']:>8}{latencies}  {row['url']}")
+        print("--" * 20)
+
+
+class RecordedApi:
+    """
+    Wraps a V2Api so every call is recorded in a LatencyRecorder under the method name
+    """
+
+    def __init__(self, api, recorder, url=None):
+        self.api = api
+        self.recorder = recorder
+        self.url = url
+
+    def __getattr__(self, name):
+        attribute = getattr(self.api, name)
+        if name.startswith("_") or not callable(attribute):
+            return attribute
+
+        @wraps(attribute)
+        def recorded(*args, **kwargs):
+            with self.recorder.measure(name, self.url):
+                return attribute(*args, **kwargs)
+
+        return recorded
+
+
+def rank_urls(summary):
+    """
+    Rank gateway urls by how they did on the same operations, nodes without errors first and then fastest first
+
+    :param summary: Summary rows from LatencyRecorder.summary
+    :return: List of dictionaries with url, errors, total mean latency and the mean latency of each operation
+    """
+    urls = {}
+    for row in summary:
+        node = urls.setdefault(row["url"], {"url": row["url"], "errors": 0, "total": 0.0, "operations": {}})
+        node["errors"] += row["errors"]
+        node["total"] += row["mean"] or 0.0
+        node["operations"][row["operation"]] = row["mean"]
+    return sorted(urls.values(), key=lambda node: (node["errors"] > 0, node["total"]))
+
+
+def print_url_ranking(summary):
+    ranking = rank_urls(summary)
+    operations = sorted({operation for node in ranking for operation in node["operations"]})
+    print("Nodes ranked by total latency, nodes with errors last (mean seconds per operation)")
+    print(f"\t{'rank':<6}{'url':<40}{'errors':>7}{'total':>9}" + "".join(f"{name:>23}" for name in operations))
+    for rank, node in enumerate(ranking, start=1):
+        latencies = "".join(f"{node['operations'][name]:>23.4f}" if node["operations"].get(name) is not None
+                            else f"{'-':>23}" for name in operations)
+        print(f"\t{rank:<6}{node['url']:<40}{node['errors']:>7}{node['total']:>9.4f}{latencies}")
+    print("--" * 20)
+    return ranking
+
+
+def load_summary(results_file):
+    """
+    Read the summary rows of a saved run, json or csv
+    """
+    if results_file.lower().endswith(".csv"):
+        with open(results_file, "r", newline="") as f:
+            return [{**row, "count": int(row["count"]), "errors": int(row["errors"]),
+                     **{key: float(row[key]) if row[key] else None for key in ["mean", "p50", "p95", "p99", "max"]}}
+                    for row in csv.DictReader(f)]
+    with open(results_file, "r") as f:
+        return json.load(f)["summary"]
+
+
+def compare_runs(baseline_summary, current_summary, threshold=0.1):
+    """
+    Compare p95 latency of two runs for each operation and url
+
+    :param baseline_summary: Summary rows of the earlier run
+    :param current_summary: Summary rows of the later run
+    :param threshold: Share the p95 may grow by before it counts as a regression
+    :return: List of dictionaries with operation, url, both p95 values, the change and whether it regressed
+    """
+    baseline = {(row["operation"], row["url"]): row for row in baseline_summary}
+    comparison = []
+    for row in current_summary:
+        before = baseline.get((row["operation"], row["url"]))
+        if before is None or before["p95"] is None or row["p95"] is None:
+            continue
+        change = (row["p95"] - before["p95"]) / before["p95"] if before["p95"] else 0.0
+        comparison.append({
+            "operation": row["operation"],
+            "url": row["url"],
+            "baseline_p95": before["p95"],
+            "current_p95": row["p95"],
+            "change": change,
+            "regressed": change > threshold,
+        })
+    return comparison
+
+
+def print_comparison(comparison, threshold):
+    print(f"\t{'operation':<24}{'base p95':>10}{'p95':>10}{'change':>9}  url")
+    for row in comparison:
+        flag = "  REGRESSED" if row["regressed"] else ""
+        print(f"\t{row['operation']:<24}{row['baseline_p95']:>10.4f}{row['current_p95']:>10.4f}"
+              f"{row['change']:>+9.1%}  {row['url']}{flag}")
+    regressions = [row for row in comparison if row["regressed"]]
+    print(f"{len(regressions)} of {len(comparison)} operations regressed by more than {threshold:.0%} at p95")
+    print("--" * 20)
+    return regressions
+
+
+def compare_files(baseline_file, current_file, threshold=0.1):
+    comparison = compare_runs(load_summary(baseline_file), load_summary(current_file), threshold)
+    return print_comparison(comparison, threshold)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Work with saved latency runs")
+    subparsers = parser.add_subparsers(dest="mode", required=True)
+    compare_parser = subparsers.add_parser("compare", help="Flag p95 regressions between two saved runs")
+    compare_parser.add_argument("baseline", help="Saved run to compare against (.json or .csv)")
+    compare_parser.add_argument("current", help="Saved run to check (.json or .csv)")
+    compare_parser.add_argument("--threshold", type=float, default=0.1,
+                                help="Share the p95 may grow by before it is flagged (default 0.1)")
+    args = parser.parse_args()
+
+    if args.mode == "compare":
+        sys.exit(1 if compare_files(args.baseline, args.current, args.threshold) else 0)
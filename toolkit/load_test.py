@@ -0,0 +1,130 @@
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from toolkit.latency_recorder import LatencyRecorder, STATUS_OK, error_status
+
+
+def parse_operation_mix(mix):
+    """
+    Parse an operation mix such as "auth=1,get_static=5,get_rotated=5,create=1,delete=1"
+
+    :param mix: Comma separated operation=weight pairs. A name without a weight gets weight 1
+    :return: Dictionary of operation name to weight
+    """
+    weights = {}
+    for pair in mix.split(","):
+        if not pair.strip():
+            continue
+        name, _, weight = pair.partition("=")
+        weights[name.strip()] = float(weight) if weight.strip() else 1.0
+    return weights
+
+
+class VirtualUser:
+    """
+    State kept by one virtual user between operations, such as its auth token and the items it created
+    """
+
+    def __init__(self, user_id, seed=None):
+        self.user_id = user_id
+        self.random = random.Random(None if seed is None else seed + user_id)
+        self.token = None
+        self.created = []
+        self.iterations = 0
+
+
+def run_load_test(operations, mix, users=1, duration=None, iterations=None, ramp_up=0.0, think_time=0.0,
+                  setup_user=None, seed=None, url=None, recorder=None):
+    """
+    Run virtual users concurrently, each picking operations at random by weight until the duration or iteration count
+    is reached
+
+    :param operations: Dictionary of operation name to a function taking a VirtualUser. An operation that returns False
+        was skipped and is not recorded
+    :param mix: Dictionary of operation name to weight
+    :param users: Number of concurrent virtual users
+    :param duration: Seconds to run for after the ramp-up starts
+    :param iterations: Operations each virtual user runs. The test runs until the first of duration or iterations
+    :param ramp_up: Seconds over which the virtual users are started, evenly spaced
+    :param think_time: Seconds each virtual user waits between operations
+    :param setup_user: Optional function run once per virtual user before its first operation, not recorded
+    :param seed: Seed for the operation choice, for repeatable runs
+    :param url: Gateway url the samples are recorded against
+    :param recorder: LatencyRecorder to record samples in. A new one is made when left out
+    :return: results: Dictionary with the run's elapsed time and the recorder holding its samples
+    """
+    unknown = [name for name in mix if name not in operations]
+    if unknown:
+        raise ValueError(f"Unknown operations {unknown}. Choose from {list(operations)}")
+    if duration is None and iterations is None:
+        raise ValueError("Set a duration, an iteration count or both")
+
+    names = [name for name in mix if mix[name] > 0]
+    weights = [mix[name] for name in names]
+    if recorder is None:
+        recorder = LatencyRecorder()
+    start_time = time.perf_counter()
+    deadline = start_time + duration if duration is not None else None
+
+    def run_user(user_id):
+        time.sleep(ramp_up * user_id / users)
+        user = VirtualUser(user_id, seed)
+        if setup_user is not None:
+            setup_user(user)
+        while (iterations is None or user.iterations < iterations) and \
+                (deadline is None or time.perf_counter() < deadline):
+            name = user.random.choices(names, weights)[0]
+            operation_start = time.perf_counter()
+            try:
+                status = STATUS_OK if operations[name](user) is not False else None
+            except Exception as e:
+                status = error_status(e)
+            latency = time.perf_counter() - operation_start
+            user.iterations += 1
+            if status is not None:
+                recorder.record(name, url, status, latency)
+            if think_time:
+                time.sleep(think_time)
+        return user
+
+    with ThreadPoolExecutor(max_workers=users) as executor:
+        virtual_users = list(executor.map(run_user, range(users)))
+
+    return {
+        "users": users,
+        "elapsed": time.perf_counter() - start_time,
+        "operations": names,
+        "recorder": recorder,
+        "virtual_users": virtual_users,
+    }
+
+
+def summarize_load_test(results):
+    """
+    Throughput and latency percentiles for each operation
+
+    :param results: Results returned by run_load_test
+    :return: Dictionary of operation name to its count, errors, throughput and p50/p95/p99/max latency in seconds
+    """
+    elapsed = results["elapsed"]
+    summary = {name: {"count": 0, "errors": 0, "p50": None, "p95": None, "p99": None, "max": None}
+               for name in results["operations"]}
+    for row in results["recorder"].summary():
+        summary[row["operation"]] = {key: row[key] for key in ["count", "errors", "p50", "p95", "p99", "max"]}
+    for operation in summary.values():
+        operation["throughput"] = operation["count"] / elapsed if elapsed > 0 else 0.0
+    return summary
+
+
+def print_load_test_summary(results, summary):
+    total = sum(operation["count"] for operation in summary.values())
+    print(f"{results['users']} virtual users ran {total} operations in {results['elapsed']:.2f} seconds "
+          f"({total / results['elapsed']:.2f} ops/sec)")
+    print(f"\t{'operation':<14}{'count':>8}{'errors':>8}{'ops/sec':>10}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    for name, operation in summary.items():
+        latencies = "".join(f"{operation[key]:>9.4f}" if operation[key] is not None else f"{'-':>9}"
+                            for key in ["p50", "p95", "p99", "max"])
+        print(f"\t{name:<14}{operation['count']:>8}{operation['errors']:>8}{operation['throughput']:>10.2f}"
+              f"{latencies}")
+    print("--" * 20)
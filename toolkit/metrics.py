@@ -0,0 +1,257 @@
+import os
+import threading
+import time
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from toolkit.latency_recorder import STATUS_OK, error_status
+from toolkit.retry import current, last_attempts
+
+# Upper bounds in seconds of the request latency buckets
+DEFAULT_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0]
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REQUESTS = "akeyless_requests_total"
+REQUEST_DURATION = "akeyless_request_duration_seconds"
+IN_FLIGHT = "akeyless_requests_in_flight"
+RETRIES = "akeyless_retries_total"
+TOKEN_REFRESHES = "akeyless_token_refreshes_total"
+CONCURRENCY_LIMIT = "akeyless_concurrency_limit"
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    escaped = [(key, str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n"))
+               for key, value in labels]
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """
+    Thread-safe counters, gauges and histograms rendered in the Prometheus text format.
+
+    Metrics are declared once with counter, gauge or histogram and then updated by name with labels as keyword
+    arguments. Values owned by other objects, like the token refresh count, are read when the metrics are rendered
+    through a callback.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    def declare(self, name, metric_type, description, buckets=None, callback=None):
+        with self.lock:
+            self.metrics.setdefault(name, {"type": metric_type, "help": description, "buckets": buckets,
+                                           "callback": callback, "values": {}})
+
+    def counter(self, name, description):
+        self.declare(name, "counter", description)
+
+    def gauge(self, name, description):
+        self.declare(name, "gauge", description)
+
+    def histogram(self, name, description, buckets=None):
+        self.declare(name, "histogram", description, buckets=sorted(buckets or DEFAULT_BUCKETS))
+
+    def callback(self, name, metric_type, description, callback):
+        """
+        Declare a metric whose value is read from callback() whenever the metrics are rendered
+        """
+        self.declare(name, metric_type, description, callback=callback)
+
+    def inc(self, name, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            values = self.metrics[name]["values"]
+            values[key] = values.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        with self.lock:
+            self.metrics[name]["values"][tuple(sorted(labels.items()))] = value
+
+    def observe(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            metric = self.metrics[name]
+            if key not in metric["values"]:
+                metric["values"][key] = {"buckets": [0] * len(metric["buckets"]), "count": 0, "sum": 0.0}
+            histogram = metric["values"][key]
+            for index, bound in enumerate(metric["buckets"]):
+                if value <= bound:
+                    histogram["buckets"][index] += 1
+            histogram["count"] += 1
+            histogram["sum"] += value
+
+    def value(self, name, **labels):
+        """
+        Current value of a counter or gauge, or the histogram dictionary, for the given labels
+        """
+        with self.lock:
+            metric = self.metrics[name]
+            if metric["callback"] is not None:
+                return metric["callback"]()
+            return metric["values"].get(tuple(sorted(labels.items())))
+
+    def render(self):
+        """
+        :return: Every metric in the Prometheus text exposition format
+        """
+        lines = []
+        with self.lock:
+            metrics = {name: dict(metric, values={labels: dict(value, buckets=list(value["buckets"]))
+                                                  if isinstance(value, dict) else value
+                                                  for labels, value in metric["values"].items()})
+                       for name, metric in self.metrics.items()}
+        for name, metric in sorted(metrics.items()):
+            lines.append(f"# HELP {name} {metric['help']}")
+            lines.append(f"# TYPE {name} {metric['type']}")
+            if metric["callback"] is not None:
+                try:
+                    lines.append(f"{name} {format_value(metric['callback']())}")
+                except Exception as e:
+                    lines.append(f"# {name} unavailable: {e}")
+                continue
+            for labels, value in sorted(metric["values"].items()):
+                if metric["type"] != "histogram":
+                    lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+                    continue
+                for bound, count in zip(metric["buckets"] + [float("inf")], value["buckets"] + [value["count"]]):
+                    bucket_labels = labels + (("le", format_value(bound)),)
+                    lines.append(f"{name}_bucket{format_labels(bucket_labels)} {count}")
+                lines.append(f"{name}_sum{format_labels(labels)} {format_value(value['sum'])}")
+                lines.append(f"{name}_count{format_labels(labels)} {value['count']}")
+        return "\n".join(lines) + "\n"
+
+    def save(self, metrics_file):
+        """
+        Write the current metrics to a file in the Prometheus text format, such as for the node exporter's
+        textfile collector
+        """
+        temp_file = f"{metrics_file}.tmp"
+        with open(temp_file, "w") as f:
+            f.write(self.render())
+        os.replace(temp_file, metrics_file)
+        return metrics_file
+
+
+def api_metrics(token_manager=None, concurrency_limiter=None):
+    """
+    Registry with the metrics MeteredApi records, plus the token refreshes and concurrency limit when given
+    """
+    registry = MetricsRegistry()
+    registry.counter(REQUESTS, "Akeyless api calls by endpoint and status")
+    registry.histogram(REQUEST_DURATION, "Seconds each Akeyless api call took, including retries")
+    registry.gauge(IN_FLIGHT, "Akeyless api calls in progress")
+    registry.counter(RETRIES, "Retried Akeyless api call attempts")
+    if token_manager is not None:
+        registry.callback(TOKEN_REFRESHES, "counter", "Akeyless auth tokens fetched, including the first",
+                          lambda: token_manager.refresh_count)
+    if concurrency_limiter is not None:
+        registry.callback(CONCURRENCY_LIMIT, "gauge", "Api calls the concurrency governor allows at once",
+                          lambda: concurrency_limiter.state()["limit"])
+    return registry
+
+
+class MeteredApi:
+    """
+    Wraps a V2Api so every call counts towards the request, latency, in-flight and retry metrics.
+
+    Put it outside RetryingApi so each call is counted once with its retries.
+    """
+
+    def __init__(self, api, registry, **labels):
+        """
+        :param labels: Extra labels for every metric, such as the gateway a probe targets
+        """
+        self.api = api
+        self.registry = registry
+        self.labels = labels
+
+    def __getattr__(self, name):
+        attribute = getattr(self.api, name)
+        if name.startswith("_") or not callable(attribute):
+            return attribute
+
+        @wraps(attribute)
+        def metered_call(*args, **kwargs):
+            labels = dict(self.labels, endpoint="/" + name.replace("_", "-"))
+            self.registry.inc(IN_FLIGHT, **labels)
+            current.attempts = 1
+            status = STATUS_OK
+            start_time = time.perf_counter()
+            try:
+                return attribute(*args, **kwargs)
+            except Exception as e:
+                status = error_status(e)
+                raise
+            finally:
+                self.registry.observe(REQUEST_DURATION, time.perf_counter() - start_time, **labels)
+                self.registry.inc(IN_FLIGHT, -1, **labels)
+                self.registry.inc(REQUESTS, status=status, **labels)
+                if last_attempts() > 1:
+                    self.registry.inc(RETRIES, last_attempts() - 1, **labels)
+
+        return metered_call
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsServer:
+    """
+    Serves a registry on http://host:port/metrics from a daemon thread so Prometheus can scrape a long run
+    """
+
+    def __init__(self, registry, port=0, host="127.0.0.1"):
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        self.server.daemon_threads = True
+        self.server.registry = registry
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="akeyless-metrics", daemon=True)
+        self.thread.start()
+        return self.url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def start_metrics_server(registry, port=None):
+    """
+    Serve the registry on the given port, or on METRICS_PORT from the environment
+
+    :return: The running MetricsServer, or None when no port is set
+    """
+    port = port or os.getenv(f"METRICS_PORT")
+    if not port:
+        return None
+    server = MetricsServer(registry, int(port))
+    print(f"Serving metrics on {server.start()}")
+    return server
@@ -1,33 +1,70 @@
 import akeyless
+import argparse
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import wraps
 
 from akeyless import ApiException
 from dotenv import load_dotenv
-import time
-from functools import wraps
 
-# Load environment variables
-load_dotenv(r"C:\Users\c873104\AppData\Roaming\JetBrains\PyCharmCE2024.1\scratches\.env")
+from configs.api_client import connection_stats, get_api, pool_settings_from_env
+from configs.request_phases import report_phases
+from toolkit.latency_recorder import LatencyRecorder, STATUS_OK, api_host, error_status, print_url_ranking
+from toolkit.load_test import parse_operation_mix, print_load_test_summary, run_load_test, summarize_load_test
+from toolkit.metrics import MeteredApi, api_metrics, start_metrics_server
 
 # envs = ["UAT", "PROD"]
 # envs = ["PROD"]
 envs = ["UAT"]
 # envs = ["DEV"]
-test_static_secret = os.getenv("TEST_STATIC_SECRET")
-test_rotated_secret = os.getenv("TEST_ROTATED_SECRET")
 DEBUG = True
-
-
-def timeit(func):
-    @wraps(func)
-    def timeit_wrapper(*args, **kwargs):
-        start_time = time.perf_counter()
-        result = func(*args, **kwargs)
-        end_time = time.perf_counter()
-        total_time = end_time - start_time
-        print(f'Completed in {total_time:.4f} seconds')
-        return result
-    return timeit_wrapper
+DEFAULT_LOAD_TEST_MIX = "auth=1,get_static=4,get_rotated=4,create=1,delete=1"
+
+
+recorder = LatencyRecorder()
+# Kept for the whole process so a scrape sees every environment and run
+metrics = api_metrics()
+
+
+def record_latency(operation):
+    """
+    Time each call and record it in the run's LatencyRecorder with the gateway url and status. A call that raises is
+    recorded with the status of its error, which is appended to the call's errors list instead of being raised
+    """
+    def decorator(func):
+        @wraps(func)
+        def record_latency_wrapper(*args, **kwargs):
+            errors = kwargs.get("errors", args[-1] if args and isinstance(args[-1], list) else None)
+            url = next((api_host(arg) for arg in args if api_host(arg)), None)
+            start_time = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                recorder.record(operation, url, error_status(e), time.perf_counter() - start_time)
+                if errors is None:
+                    raise
+                print(e)
+                errors.append(e)
+                return None
+            total_time = time.perf_counter() - start_time
+            recorder.record(operation, url, STATUS_OK, total_time)
+            print(f'{operation} @ {url} completed in {total_time:.4f} seconds')
+            return result
+        return record_latency_wrapper
+    return decorator
+
+
+def default_latency_results_file(env, mode="run"):
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    return os.getenv("LATENCY_RESULTS_FILE") or f"response_times_{env.lower()}_{mode}_{timestamp}.json"
+
+
+def save_metrics():
+    metrics_file = os.getenv("METRICS_FILE")
+    if metrics_file:
+        print(f"Metrics saved to {metrics.save(metrics_file)}")
 
 
 def auth_api_key(api, access_id, access_key) -> str:
@@ -50,7 +87,7 @@ def auth_uid(api, access_id, token) -> str:
     return auth_response.token
 
 
-@timeit
+@record_latency("create_static_secret")
 def create_static_secret(api, name, token, errors: list):
     body = akeyless.CreateSecret(name=name,
                                  value="test secret",
@@ -60,17 +97,11 @@ def create_static_secret(api, name, token, errors: list):
     try:
         api.create_secret(body)
     except ApiException as e:
-        if e.status == 409:
-            pass
-        else:
-            print(e)
-            errors.append(e)
-    except Exception as e:
-        print(e)
-        errors.append(e)
+        if e.status != 409:
+            raise
 
 
-@timeit
+@record_latency("create_rotated_secret")
 def create_rotated_secret(api, name, token, env, errors: list):
     if env == "PROD":
         target_name = "/cvs/iam/asm/target/azure/ar-enterprise-asm-prod"
@@ -92,121 +123,237 @@ def create_rotated_secret(api, name, token, env, errors: list):
     try:
         api.create_rotated_secret(body)
     except ApiException as e:
-        if e.status == 409:
-            pass
-        else:
-            print(e)
-            errors.append(e)
-    except Exception as e:
-        print(e)
-        errors.append(e)
+        if e.status != 409:
+            raise
 
 
-@timeit
+@record_latency("get_static_secret")
 def get_static_secret(api, name, token, errors: list):
     body = akeyless.GetSecretValue(names=[name], token=token)
-    try:
-        api.get_secret_value(body)
-    except Exception as e:
-        print(e)
-        errors.append(e)
+    api.get_secret_value(body)
 
 
-@timeit
+@record_latency("get_rotated_secret")
 def get_rotated_secret(api, name, token, errors: list):
     body = akeyless.RotatedSecretGetValue(name=name, token=token)
-    try:
-        api.rotated_secret_get_value(body)
-    except Exception as e:
-        print(e)
-        errors.append(e)
+    api.rotated_secret_get_value(body)
 
 
-@timeit
+@record_latency("delete_static_secret")
 def delete_static_secret(api, name, token, errors: list):
     body = akeyless.DeleteItem(name=name, token=token)
-    try:
-        api.delete_item(body)
-    except Exception as e:
-        print(e)
-        errors.append(e)
+    api.delete_item(body)
 
 
-@timeit
+@record_latency("delete_rotated_secret")
 def delete_rotated_secret(api, name, token, errors: list):
     body = akeyless.DeleteItem(name=name, token=token)
-    try:
-        api.delete_item(body)
-    except Exception as e:
-        print(e)
-        errors.append(e)
-
-@timeit
-def auth(url, api, api_access_id, api_access_key):
-    # Api_key login test
-    try:
-        if DEBUG:
-            print(f"Authenticating to Akeyless @ {url}")
-        else:
-            print(url)
-        auth_token = auth_api_key(api, api_access_id, api_access_key)
-        return auth_token
-    except Exception as e:
-        print(e)
-        # return e
+    api.delete_item(body)
 
 
+@record_latency("auth")
+def auth(url, api, api_access_id, api_access_key, errors: list):
+    # Api_key login test
+    if DEBUG:
+        print(f"Authenticating to Akeyless @ {url}")
+    else:
+        print(url)
+    return auth_api_key(api, api_access_id, api_access_key)
+
+
+def probe_node(env, url, node, api_access_id, api_access_key):
+    """
+    Run the create/get/delete sequence against one gateway node
+
+    :param env: Environment the node belongs to, such as UAT
+    :param url: Gateway url
+    :param node: Index of the node, used to keep each node's test secrets apart while nodes run at the same time
+    :return: errors: The failures from this node only
+    """
+    # Akeyless api setup. The pooled client for each url is reused between runs
+    api = MeteredApi(get_api(url, **pool_settings_from_env()), metrics, env=env, gateway=url)
+    static_secret = f"{os.getenv('TEST_STATIC_SECRET')}-node{node}"
+    rotated_secret = f"{os.getenv('TEST_ROTATED_SECRET')}-node{node}"
+    errors = []
 
-@timeit
-def main():
-    global time
+    auth_token = auth(url, api, api_access_id, api_access_key, errors)
+    create_static_secret(api, static_secret, auth_token, errors)
+    create_rotated_secret(api, rotated_secret, auth_token, env, errors)
+    get_static_secret(api, static_secret, auth_token, errors)
+    get_rotated_secret(api, rotated_secret, auth_token, errors)
+    delete_static_secret(api, static_secret, auth_token, errors)
+    delete_rotated_secret(api, rotated_secret, auth_token, errors)
+    return errors
+
+
+def main(env):
+    """
+    Probe every node of one environment at the same time and report the response times of each
+
+    :param env: Environment to test, such as UAT
+    :return: errors: Every node's failures
+    """
+    global recorder
+    recorder = LatencyRecorder(env)
+    start_time = time.perf_counter()
     api_access_id = os.getenv(f"{env}_API_ACCESS_ID")
     api_access_key = os.getenv(f"{env}_API_ACCESS_KEY")
-    uid_token = os.getenv(f"{env}_UID_TOKEN")
     base_url_list = os.getenv(f"{env}_BASE_URL_LIST").split(",")
     errors = []
 
-    print(f"Running tests against {env}")
-    for url in base_url_list:
-        configuration = akeyless.Configuration(
-            host=url
-        )
-
-        # Akeyless api setup
-        api_client = akeyless.ApiClient(configuration)
-        api = akeyless.V2Api(api_client)
-
-        # url = "https://api.cvs.uat.akeyless.io"
-        auth_token = auth(url, api, api_access_id, api_access_key)
-
-        if DEBUG:
-            print(f"Creating static secret... ", end="")
-        create_static_secret(api, test_static_secret, auth_token, errors)
-
-        if DEBUG:
-            print(f"Creating rotated secret... ", end="")
-        create_rotated_secret(api, test_rotated_secret, auth_token, env, errors)
-
-        if DEBUG:
-            print(f"Retrieving static secret... ", end="")
-        get_static_secret(api, test_static_secret, auth_token, errors)
-
-        if DEBUG:
-            print(f"Retrieving rotated secret... ", end="")
-        get_rotated_secret(api, test_rotated_secret, auth_token, errors)
+    # Every node runs the same sequence at the same time, so a slow node does not hold up the others
+    print(f"Running tests against {env} on {len(base_url_list)} nodes")
+    with ThreadPoolExecutor(max_workers=len(base_url_list)) as executor:
+        probes = [executor.submit(probe_node, env, url, node, api_access_id, api_access_key)
+                  for node, url in enumerate(base_url_list)]
+        for probe in probes:
+            errors.extend(probe.result())
 
-        if DEBUG:
-            print(f"Deleting static secret... ", end="")
-        delete_static_secret(api, test_static_secret, auth_token, errors)
-
-        if DEBUG:
-            print(f"Deleting rotated secret... ", end="")
-        delete_rotated_secret(api, test_rotated_secret, auth_token, errors)
+    for url in base_url_list:
+        stats = connection_stats(get_api(url))
+        print(f"{url}: {stats['requests']} requests over {stats['connections']} connections "
+              f"({stats['reuse_ratio']:.0%} reused)")
+
+    print(f"Completed in {time.perf_counter() - start_time:.4f} seconds")
+    recorder.print_summary()
+    print_url_ranking(recorder.summary())
+    results_file = recorder.save(default_latency_results_file(env))
+    print(f"Latency results saved to {results_file}")
+    phases_file = report_phases(results_file)
+    if phases_file:
+        print(f"Request phases saved to {phases_file}")
+    save_metrics()
 
     if not errors:
         print("All URLs passed")
+    return errors
+
+
+def load_test_operations(api, api_access_id, api_access_key, test_static_secret, test_rotated_secret):
+    """
+    Operations a load test virtual user can run against one gateway
+
+    :return: Dictionary of operation name to a function taking a VirtualUser
+    """
+    def auth_operation(user):
+        user.token = auth_api_key(api, api_access_id, api_access_key)
+
+    def get_static_operation(user):
+        api.get_secret_value(akeyless.GetSecretValue(names=[test_static_secret], token=user.token))
+
+    def get_rotated_operation(user):
+        api.rotated_secret_get_value(akeyless.RotatedSecretGetValue(name=test_rotated_secret, token=user.token))
+
+    def create_operation(user):
+        name = f"{test_static_secret}-load-{user.user_id}-{user.iterations}"
+        api.create_secret(akeyless.CreateSecret(name=name, value="load test secret",
+                                                description="load test secret made from python sdk",
+                                                token=user.token))
+        user.created.append(name)
+
+    def delete_operation(user):
+        # Only delete what this user created, so there is nothing to delete until it has created something
+        if not user.created:
+            return False
+        api.delete_item(akeyless.DeleteItem(name=user.created.pop(), token=user.token))
+
+    return {
+        "auth": auth_operation,
+        "get_static": get_static_operation,
+        "get_rotated": get_rotated_operation,
+        "create": create_operation,
+        "delete": delete_operation,
+    }
+
+
+def load_test(env, url=None, users=10, duration=None, iterations=None, ramp_up=0.0, think_time=0.0,
+              mix=DEFAULT_LOAD_TEST_MIX, seed=None):
+    """
+    Run concurrent virtual users against one gateway and report throughput and latency for each operation
+
+    :param env: Environment to test, such as UAT
+    :param url: Gateway url. Defaults to the first url in {env}_BASE_URL_LIST
+    :param users: Number of concurrent virtual users
+    :param duration: Seconds to run for
+    :param iterations: Operations each virtual user runs
+    :param ramp_up: Seconds over which the virtual users are started
+    :param think_time: Seconds each virtual user waits between operations
+    :param mix: Operation mix such as "auth=1,get_static=4"
+    :param seed: Seed for the operation choice
+    :return: summary: Dictionary of operation name to its throughput and latency percentiles
+    """
+    api_access_id = os.getenv(f"{env}_API_ACCESS_ID")
+    api_access_key = os.getenv(f"{env}_API_ACCESS_KEY")
+    test_static_secret = os.getenv("TEST_STATIC_SECRET")
+    test_rotated_secret = os.getenv("TEST_ROTATED_SECRET")
+    if url is None:
+        url = os.getenv(f"{env}_BASE_URL_LIST").split(",")[0]
+    pool_settings = pool_settings_from_env()
+    pool_settings["pool_size"] = max(pool_settings["pool_size"], users)
+    api = MeteredApi(get_api(url, **pool_settings), metrics, env=env, gateway=url)
+    errors = []
+
+    print(f"Load testing {env} @ {url} with {users} virtual users, mix {mix}")
+    auth_token = auth_api_key(api, api_access_id, api_access_key)
+    create_static_secret(api, test_static_secret, auth_token, errors)
+    create_rotated_secret(api, test_rotated_secret, auth_token, env, errors)
+
+    def setup_user(user):
+        user.token = auth_api_key(api, api_access_id, api_access_key)
+
+    results = run_load_test(load_test_operations(api, api_access_id, api_access_key, test_static_secret,
+                                                 test_rotated_secret), parse_operation_mix(mix),
+                            users=users, duration=duration, iterations=iterations, ramp_up=ramp_up,
+                            think_time=think_time, setup_user=setup_user, seed=seed, url=url,
+                            recorder=LatencyRecorder(env))
+    summary = summarize_load_test(results)
+    print_load_test_summary(results, summary)
+    results_file = results["recorder"].save(default_latency_results_file(env, "load"))
+    print(f"Latency results saved to {results_file}")
+    phases_file = report_phases(results_file)
+    if phases_file:
+        print(f"Request phases saved to {phases_file}")
+
+    # Clean up whatever the virtual users created and did not delete
+    for user in results["virtual_users"]:
+        for name in user.created:
+            delete_static_secret(api, name, auth_token, errors)
+    delete_static_secret(api, test_static_secret, auth_token, errors)
+    delete_rotated_secret(api, test_rotated_secret, auth_token, errors)
+    save_metrics()
+
+    return summary
 
 
 if __name__ == "__main__":
-    for env in envs:
-        main()
+    parser = argparse.ArgumentParser(description="Measure Akeyless gateway response times")
+    parser.add_argument("--env-file", default=".env", help="File with the gateway settings (default .env)")
+    subparsers = parser.add_subparsers(dest="mode")
+    load_parser = subparsers.add_parser("load", help="Run concurrent virtual users against one gateway")
+    load_parser.add_argument("--env", default=envs[0], help=f"Environment to test (default {envs[0]})")
+    load_parser.add_argument("--url", default=None, help="Gateway url. Defaults to the first in {env}_BASE_URL_LIST")
+    load_parser.add_argument("--users", type=int, default=10, help="Concurrent virtual users (default 10)")
+    load_parser.add_argument("--duration", type=float, default=None, help="Seconds to run for")
+    load_parser.add_argument("--iterations", type=int, default=None, help="Operations per virtual user")
+    load_parser.add_argument("--ramp-up", type=float, default=0.0,
+                             help="Seconds over which the virtual users are started (default 0)")
+    load_parser.add_argument("--think-time", type=float, default=0.0,
+                             help="Seconds each virtual user waits between operations (default 0)")
+    load_parser.add_argument("--mix", default=DEFAULT_LOAD_TEST_MIX,
+                             help=f"Operation weights from auth, get_static, get_rotated, create, delete "
+                                  f"(default {DEFAULT_LOAD_TEST_MIX})")
+    load_parser.add_argument("--seed", type=int, default=None, help="Seed for a repeatable operation sequence")
+    args = parser.parse_args()
+
+    # Load environment variables
+    load_dotenv(args.env_file)
+    start_metrics_server(metrics)
+
+    if args.mode == "load":
+        if args.duration is None and args.iterations is None:
+            args.duration = 60.0
+        load_test(args.env.upper(), args.url, args.users, args.duration, args.iterations, args.ramp_up,
+                  args.think_time, args.mix, args.seed)
+    else:
+        for env in envs:
+            main(env)
@@ -0,0 +1,214 @@
+import random
+import threading
+import time
+from functools import wraps
+
+import urllib3
+from akeyless import ApiException
+
+ERROR_CONFLICT = "conflict"
+ERROR_THROTTLE = "throttle"
+ERROR_TRANSIENT = "transient"
+ERROR_FATAL = "fatal"
+
+# Gateway responses that mean it is over capacity. The concurrency governor backs off on the same statuses
+THROTTLE_STATUSES = [429, 502, 503, 504]
+TRANSIENT_STATUSES = [500]
+
+# Calls that only read or auth, so they can be sent again after any failure. Every other call changes something and
+# is only sent again when the first request never reached the gateway, or a timed out create could run twice
+IDEMPOTENT_PREFIXES = ("get_", "list_", "describe_", "validate_")
+IDEMPOTENT_CALLS = ["auth"]
+
+# Attempts made by the last call on each thread
+current = threading.local()
+
+
+def classify_error(error):
+    """
+    Sort an error from a V2Api call into one of ERROR_CONFLICT, ERROR_THROTTLE, ERROR_TRANSIENT or ERROR_FATAL
+
+    :param error: Exception raised by a V2Api call
+    """
+    if isinstance(error, ApiException):
+        if error.status == 409 or "Status 409 Conflict" in str(error.body or ""):
+            return ERROR_CONFLICT
+        if error.status in THROTTLE_STATUSES:
+            return ERROR_THROTTLE
+        if error.status in TRANSIENT_STATUSES:
+            return ERROR_TRANSIENT
+        return ERROR_FATAL
+    if isinstance(error, (urllib3.exceptions.HTTPError, ConnectionError, TimeoutError)):
+        return ERROR_TRANSIENT
+    return ERROR_FATAL
+
+
+def is_idempotent(name):
+    """
+    Check if a V2Api method can be sent again without making its change twice
+    """
+    return name in IDEMPOTENT_CALLS or name.startswith(IDEMPOTENT_PREFIXES)
+
+
+def is_connect_error(error):
+    """
+    Check if an error happened before the request reached the gateway, so sending it again cannot repeat it
+    """
+    if isinstance(error, urllib3.exceptions.MaxRetryError):
+        error = error.reason
+    return isinstance(error, (urllib3.exceptions.NewConnectionError, urllib3.exceptions.ConnectTimeoutError))
+
+
+def is_conflict(error):
+    """
+    Check if an error means the item already exists
+    """
+    return classify_error(error) == ERROR_CONFLICT
+
+
+def last_attempts():
+    """
+    Attempts made by the last call the retry policy ran on this thread
+    """
+    return getattr(current, "attempts", 1)
+
+
+def retry_after(error):
+    # Seconds the gateway asked us to wait, if it said
+    headers = getattr(error, "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryPolicy:
+    """
+    Retries throttled and transient V2Api errors with capped, jittered exponential backoff.
+
+    Conflicts and fatal errors are raised straight away. Calls that change something are only retried when the request
+    never reached the gateway, see call_change. Retries across the whole run draw from one budget so a gateway
+    outage fails fast instead of stalling every worker for max_attempts.
+    """
+
+    def __init__(self, max_attempts=4, base_delay=0.5, max_delay=10.0, retry_budget=100):
+        """
+        :param max_attempts: Most attempts for a single call, including the first
+        :param base_delay: Seconds of backoff cap after the first failure, doubling with every attempt
+        :param max_delay: Largest backoff in seconds
+        :param retry_budget: Most retries for the whole run. None for no limit
+        """
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_budget = retry_budget
+
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.attempts = 0
+        self.retries = 0
+        self.budget_exhausted = 0
+        self.errors = {ERROR_CONFLICT: 0, ERROR_THROTTLE: 0, ERROR_TRANSIENT: 0, ERROR_FATAL: 0}
+
+    def backoff(self, attempt, error=None):
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        requested = retry_after(error)
+        if requested is not None:
+            delay = max(delay, min(requested, self.max_delay))
+        return delay
+
+    def spend_retry(self):
+        with self.lock:
+            if self.retry_budget is not None and self.retries >= self.retry_budget:
+                self.budget_exhausted += 1
+                return False
+            self.retries += 1
+            return True
+
+    def call(self, func, *args, **kwargs):
+        """
+        Call func, retrying throttled and transient errors
+
+        :param func: V2Api method to call
+        :return: Whatever func returns
+        """
+        return self.run(func, args, kwargs, idempotent=True)
+
+    def call_change(self, func, *args, **kwargs):
+        """
+        Call a func that changes something, like a create, retrying only errors from before the request reached the
+        gateway. A create that timed out may have gone through, and sending it again would answer 409 and lose what it
+        returned, such as a new access key
+
+        :param func: V2Api method to call
+        :return: Whatever func returns
+        """
+        return self.run(func, args, kwargs, idempotent=False)
+
+    def run(self, func, args, kwargs, idempotent):
+        with self.lock:
+            self.calls += 1
+        attempt = 0
+        while True:
+            attempt += 1
+            current.attempts = attempt
+            with self.lock:
+                self.attempts += 1
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                error_type = classify_error(e)
+                with self.lock:
+                    self.errors[error_type] += 1
+                if error_type not in [ERROR_THROTTLE, ERROR_TRANSIENT] or attempt >= self.max_attempts:
+                    raise
+                if not idempotent and not is_connect_error(e):
+                    raise
+                if not self.spend_retry():
+                    raise
+                time.sleep(self.backoff(attempt, e))
+
+    def stats(self):
+        """
+        Counters for the run
+
+        :return: Dictionary with calls, attempts, retries, calls refused a retry by the budget and errors by type
+        """
+        with self.lock:
+            return {
+                "calls": self.calls,
+                "attempts": self.attempts,
+                "retries": self.retries,
+                "retry_budget": self.retry_budget,
+                "budget_exhausted": self.budget_exhausted,
+                "errors": dict(self.errors),
+            }
+
+    def describe(self):
+        stats = self.stats()
+        errors = ", ".join(f"{count} {error_type}" for error_type, count in stats["errors"].items())
+        budget = "unlimited" if self.retry_budget is None else f"{stats['retries']} of {self.retry_budget}"
+        return f"{stats['calls']} api calls in {stats['attempts']} attempts, retries used {budget}. Errors: {errors}"
+
+
+class RetryingApi:
+    """
+    Wraps a V2Api so every call goes through the retry policy. Calls that change something go through call_change
+    """
+
+    def __init__(self, api, policy):
+        self.api = api
+        self.policy = policy
+
+    def __getattr__(self, name):
+        attribute = getattr(self.api, name)
+        if name.startswith("_") or not callable(attribute):
+            return attribute
+
+        call = self.policy.call if is_idempotent(name) else self.policy.call_change
+
+        @wraps(attribute)
+        def retried(*args, **kwargs):
+            return call(attribute, *args, **kwargs)
+
+        return retried
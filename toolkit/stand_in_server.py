@@ -0,0 +1,354 @@
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+AUTH_METHOD_ENDPOINTS = [
+    "/create-auth-method-azure-ad",
+    "/auth-method-create-api-key",
+    "/auth-method-create-gcp",
+    "/auth-method-create-aws-iam",
+    "/create-auth-method-universal-identity",
+    "/gateway-create-k8s-auth-config",
+]
+
+
+def parse_latency(spec):
+    """
+    Parse a latency distribution such as "fixed:0.05", "uniform:0.01,0.05", "normal:0.05,0.01" (mean, standard
+    deviation) or "lognormal:0.05,0.5" (median, sigma). Values are in seconds
+
+    :return: Function that returns one latency sample when called with a random.Random
+    """
+    kind, _, args = spec.partition(":")
+    values = [float(value) for value in args.split(",") if value.strip()]
+    match kind:
+        case "fixed":
+            return lambda rng: values[0]
+        case "uniform":
+            return lambda rng: rng.uniform(values[0], values[1])
+        case "normal":
+            return lambda rng: max(0.0, rng.gauss(values[0], values[1]))
+        case "lognormal":
+            return lambda rng: values[0] * rng.lognormvariate(0, values[1])
+    raise ValueError(f"Unknown latency distribution {spec}. Use fixed, uniform, normal or lognormal")
+
+
+def parse_faults(spec):
+    """
+    Parse fault rates such as "429:0.05,503:0.01" into {429: 0.05, 503: 0.01}
+    """
+    faults = {}
+    for pair in spec.split(","):
+        if pair.strip():
+            status, _, rate = pair.partition(":")
+            faults[int(status)] = float(rate)
+    return faults
+
+
+class StandInState:
+    """
+    In-memory items, roles and auth methods behind the stand-in, with the latency, faults and request counters
+    """
+
+    def __init__(self, latency=None, faults=None, seed=None, page_size=1000):
+        """
+        :param latency: Dictionary of endpoint (or "*" for every endpoint) to a latency spec for parse_latency
+        :param faults: Dictionary of endpoint (or "*") to {status: rate} of injected errors
+        :param seed: Seed for latency and fault injection, for repeatable runs
+        :param page_size: Results per page for the list endpoints
+        """
+        self.lock = threading.Lock()
+        self.random = random.Random(seed)
+        self.page_size = page_size
+        self.latency = {endpoint: parse_latency(spec) for endpoint, spec in (latency or {}).items()}
+        self.faults = dict(faults or {})
+        self.items = {}
+        self.roles = {}
+        self.auth_methods = {}
+        self.requests = {}
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.items.clear()
+            self.roles.clear()
+            self.auth_methods.clear()
+            self.requests.clear()
+
+    def set_latency(self, endpoint, spec):
+        with self.lock:
+            self.latency[endpoint] = parse_latency(spec)
+
+    def set_faults(self, endpoint, faults):
+        with self.lock:
+            self.faults[endpoint] = dict(faults)
+
+    def count(self, endpoint, status):
+        with self.lock:
+            statuses = self.requests.setdefault(endpoint, {})
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    def stats(self):
+        with self.lock:
+            return {
+                "requests": {endpoint: dict(statuses) for endpoint, statuses in self.requests.items()},
+                "total_requests": sum(sum(statuses.values()) for statuses in self.requests.values()),
+                "items": len(self.items),
+                "roles": len(self.roles),
+                "auth_methods": len(self.auth_methods),
+            }
+
+    def delay(self, endpoint):
+        with self.lock:
+            sample = self.latency.get(endpoint, self.latency.get("*"))
+            return sample(self.random) if sample is not None else 0.0
+
+    def injected_fault(self, endpoint):
+        with self.lock:
+            faults = self.faults.get(endpoint, self.faults.get("*", {}))
+            roll = self.random.random()
+        for status, rate in faults.items():
+            if roll < rate:
+                return status
+            roll -= rate
+        return None
+
+    def handle(self, endpoint, body):
+        """
+        Answer one api request
+
+        :return: status, response: Http status and the json response body
+        """
+        with self.lock:
+            match endpoint:
+                case "/auth":
+                    return 200, {"token": f"t-{uuid.uuid4().hex}", "creds": {"expiry": int(time.time()) + 3600}}
+                case "/create-secret" | "/create-rotated-secret":
+                    return self.create(self.items, body["name"], {
+                        "item_name": body["name"],
+                        "item_type": "STATIC_SECRET" if endpoint == "/create-secret" else "ROTATED_SECRET",
+                        "value": body.get("value", f"value-of-{body['name']}"),
+                        "item_tags": body.get("tags"),
+                    }, {"name": body["name"]})
+                case "/get-secret-value":
+                    missing = [name for name in body.get("names", []) if name not in self.items]
+                    if missing:
+                        return 404, {"error": f"item {missing[0]} not found"}
+                    return 200, {name: self.items[name]["value"] for name in body["names"]}
+                case "/rotated-secret-get-value":
+                    if body.get("name") not in self.items:
+                        return 404, {"error": f"item {body.get('name')} not found"}
+                    return 200, {"value": {"username": body["name"], "password": self.items[body["name"]]["value"]}}
+                case "/create-role":
+                    return self.create(self.roles, body["name"], {"rules": {}, "auth_methods": {}}, {})
+                case "/set-role-rule":
+                    role = self.roles.get(body.get("role-name"))
+                    if role is None:
+                        return 404, {"error": f"role {body.get('role-name')} not found"}
+                    role["rules"][(body.get("rule-type", "item-rule"), body["path"])] = list(body["capability"])
+                    return 200, {}
+                case "/assoc-role-am":
+                    role = self.roles.get(body.get("role-name"))
+                    if role is None or body.get("am-name") not in self.auth_methods:
+                        return 404, {"error": "role or auth method not found"}
+                    if body["am-name"] in role["auth_methods"]:
+                        return 409, {"error": "Status 409 Conflict: association already exists"}
+                    assoc_id = f"ass-{uuid.uuid4().hex[:12]}"
+                    role["auth_methods"][body["am-name"]] = {"assoc_id": assoc_id, "sub_claims": body.get("sub-claims")}
+                    return 200, {"assoc_id": assoc_id}
+                case "/update-assoc":
+                    for role in self.roles.values():
+                        for association in role["auth_methods"].values():
+                            if association["assoc_id"] == body.get("assoc-id"):
+                                association["sub_claims"] = body.get("sub-claims")
+                                return 200, {}
+                    return 404, {"error": f"association {body.get('assoc-id')} not found"}
+                case "/get-role":
+                    role = self.roles.get(body.get("name"))
+                    if role is None:
+                        return 404, {"error": f"role {body.get('name')} not found"}
+                    return 200, {
+                        "role_name": body["name"],
+                        "rules": {"path_rules": [{"type": rule_type, "path": path, "capabilities": capabilities}
+                                                 for (rule_type, path), capabilities in role["rules"].items()]},
+                        "role_auth_methods_assoc": [{"assoc_id": association["assoc_id"], "auth_method_name": name,
+                                                     "auth_method_sub_claims": self.sub_claim_lists(association)}
+                                                    for name, association in role["auth_methods"].items()],
+                    }
+                case "/delete-item":
+                    if self.items.pop(body.get("name"), None) is None:
+                        return 404, {"error": f"item {body.get('name')} not found"}
+                    return 200, {"item_name": body["name"]}
+                case "/delete-items":
+                    names = list(body.get("item") or [])
+                    if body.get("path"):
+                        names += [name for name in self.items if name.startswith(body["path"].rstrip("/") + "/")]
+                    deleted = [name for name in names if self.items.pop(name, None) is not None]
+                    return 200, {"deleted_items": deleted,
+                                 "failed_deleted_items": [name for name in names if name not in deleted]}
+                case "/list-items":
+                    return self.list_items(body)
+                case "/list-roles":
+                    return 200, self.page(sorted(self.roles), body, "roles", "role_name")
+                case "/list-auth-methods":
+                    return 200, self.page(sorted(self.auth_methods), body, "auth_methods", "auth_method_name")
+                case "/uid-generate-token" | "/uid-rotate-token":
+                    return 200, {"token": f"u-{uuid.uuid4().hex}"}
+                case _ if endpoint in AUTH_METHOD_ENDPOINTS:
+                    access_id = f"p-{uuid.uuid4().hex[:12]}"
+                    response = {"access_id": access_id}
+                    if endpoint == "/auth-method-create-api-key":
+                        response["access_key"] = uuid.uuid4().hex
+                    if endpoint == "/gateway-create-k8s-auth-config":
+                        response = {"cluster_id": uuid.uuid4().hex[:12]}
+                    return self.create(self.auth_methods, body["name"], {"access_id": access_id}, response)
+        return 404, {"error": f"endpoint {endpoint} is not served by the stand-in"}
+
+    @staticmethod
+    def sub_claim_lists(association):
+        # Sub claims are sent as comma separated strings and read back as lists, like the gateway does
+        return {key: value.split(",") for key, value in (association["sub_claims"] or {}).items()}
+
+    @staticmethod
+    def create(store, name, record, response):
+        # Callers hold self.lock
+        if name in store:
+            return 409, {"error": f"Status 409 Conflict: {name} already exists"}
+        store[name] = record
+        return 200, response
+
+    def list_items(self, body):
+        folder = (body.get("path") or "/").rstrip("/") + "/"
+        names = sorted(name for name in self.items if name.startswith(folder) and "/" not in name[len(folder):])
+        folders = sorted({folder + name[len(folder):].split("/")[0] for name in self.items
+                          if name.startswith(folder) and "/" in name[len(folder):]})
+        response = self.page(names, body, "items", "item_name")
+        response["folders"] = folders
+        for item in response["items"]:
+            item["item_type"] = self.items[item["item_name"]]["item_type"]
+        return 200, response
+
+    def page(self, names, body, key, name_field):
+        if body.get("filter"):
+            names = [name for name in names if name.startswith(body["filter"])]
+        start = int(body.get("pagination-token") or 0)
+        end = start + self.page_size
+        return {key: [{name_field: name} for name in names[start:end]],
+                "next_page": str(end) if end < len(names) else None}
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body are separate writes, so without this the body waits on the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        raw = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        endpoint = self.path.split("?")[0]
+        state = self.server.state
+        time.sleep(state.delay(endpoint))
+
+        if endpoint == "/__reset":
+            state.reset()
+            return self.reply(200, {})
+        fault = state.injected_fault(endpoint)
+        if fault is not None:
+            status, response = fault, {"error": f"Status {fault}: injected by the stand-in"}
+        else:
+            try:
+                status, response = state.handle(endpoint, json.loads(raw or b"{}"))
+            except (KeyError, TypeError, ValueError) as e:
+                status, response = 400, {"error": f"bad request: {e}"}
+        state.count(endpoint, status)
+        self.reply(status, response)
+
+    def do_GET(self):
+        if self.path.split("?")[0] == "/__stats":
+            return self.reply(200, self.server.state.stats())
+        self.reply(200, {"status": "ok"})
+
+    def reply(self, status, response):
+        body = json.dumps(response).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StandInServer:
+    """
+    Local stand-in for the Akeyless gateway endpoints this repo uses, with configurable latency, injected errors and
+    request counters. Point get_api or AkeylessConfig's load balancer url at server.url to run offline.
+
+    Use as a context manager, or call start() and stop().
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=None, faults=None, seed=None, page_size=1000):
+        self.state = StandInState(latency, faults, seed, page_size)
+        self.server = ThreadingHTTPServer((host, port), StandInHandler)
+        self.server.daemon_threads = True
+        self.server.state = self.state
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="akeyless-stand-in", daemon=True)
+        self.thread.start()
+        return self.url
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def stats(self):
+        return self.state.stats()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+
+def parse_endpoint_settings(values, parse):
+    settings = {}
+    for value in values or []:
+        endpoint, _, spec = value.partition("=")
+        settings[endpoint] = parse(spec) if parse is not None else spec
+    return settings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the Akeyless gateway")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--latency", action="append",
+                        help="endpoint=distribution, such as '*=fixed:0.02' or "
+                             "'/create-rotated-secret=lognormal:0.1,0.5'. Can be repeated")
+    parser.add_argument("--fault", action="append",
+                        help="endpoint=status:rate,..., such as '*=429:0.02,503:0.01'. Can be repeated")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--page-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    stand_in = StandInServer(args.host, args.port, parse_endpoint_settings(args.latency, None),
+                             parse_endpoint_settings(args.fault, parse_faults), args.seed, args.page_size)
+    print(f"Akeyless stand-in listening on {stand_in.url}. GET {stand_in.url}/__stats for request counters")
+    try:
+        stand_in.server.serve_forever()
+    except KeyboardInterrupt:
+        print(json.dumps(stand_in.stats(), indent=2))
+        stand_in.server.server_close()
@@ -0,0 +1,364 @@
+import argparse
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from akeyless import CreateSecret, DeleteItem, GetSecretValue, RotatedSecretGetValue
+from dotenv import load_dotenv
+
+from configs.api_client import get_api, pool_settings_from_env
+from configs.token_manager import TokenManager
+from toolkit.latency_recorder import STATUS_OK, error_status
+from toolkit.metrics import MeteredApi, api_metrics, start_metrics_server
+from toolkit.retry import is_conflict
+
+DEFAULT_THRESHOLDS = {"error_rate": 0.2, "p95_seconds": 2.0}
+PROBE_VALUE = "synthetic monitor probe"
+# Statuses that mean the token was rejected, so the next cycle authenticates again
+AUTH_FAILURE_STATUSES = [401, 403]
+
+
+class RollingWindow:
+    """
+    Latency and error samples from the last window_seconds, for alerting on recent behaviour only
+    """
+
+    def __init__(self, window_seconds=900):
+        self.window_seconds = window_seconds
+        self.samples = deque()
+        self.lock = threading.Lock()
+
+    def prune(self, now):
+        # Callers hold self.lock
+        while self.samples and self.samples[0][0] < now - self.window_seconds:
+            self.samples.popleft()
+
+    def record(self, latency, ok, now=None):
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.samples.append((now, latency, ok))
+            self.prune(now)
+
+    def stats(self, now=None):
+        """
+        :return: Dictionary with the sample count, errors, error rate and p50, p95 and max latency in seconds
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            self.prune(now)
+            samples = list(self.samples)
+        latencies = sorted(latency for _, latency, _ in samples)
+        errors = sum(1 for _, _, ok in samples if not ok)
+
+        def percentile(percent):
+            if not latencies:
+                return None
+            return latencies[max(1, math.ceil(len(latencies) * percent / 100)) - 1]
+
+        return {
+            "count": len(samples),
+            "errors": errors,
+            "error_rate": errors / len(samples) if samples else 0.0,
+            "p50": percentile(50),
+            "p95": percentile(95),
+            "max": latencies[-1] if latencies else None,
+        }
+
+
+class AlertSink:
+    """
+    Appends alerts as json lines to a local file and prints them
+    """
+
+    def __init__(self, alert_file="monitor_alerts.jsonl"):
+        self.alert_file = alert_file
+        self.lock = threading.Lock()
+        self.alerts = []
+
+    def send(self, alert):
+        with self.lock:
+            self.alerts.append(alert)
+            print(f"ALERT {alert['state']}: {alert['env']} {alert['url']} {alert['operation']} "
+                  f"{alert['rule']} {alert['value']:.4f} (threshold {alert['threshold']})")
+            if not self.alert_file:
+                return
+            try:
+                with open(self.alert_file, "a") as f:
+                    f.write(json.dumps(alert) + "\n")
+            except OSError as e:
+                print(f"Unable to write the alert to {self.alert_file}: {e}")
+
+
+def monitor_targets(envs):
+    """
+    One probe target per gateway node, read from the same .env settings as test_envs.py
+
+    :param envs: Environments such as ["UAT", "PROD"]
+    :return: List of target dictionaries
+    """
+    targets = []
+    for env in envs:
+        urls = [url.strip() for url in (os.getenv(f"{env}_BASE_URL_LIST") or "").split(",") if url.strip()]
+        if not urls:
+            print(f"No {env}_BASE_URL_LIST set, skipping {env}")
+        for node, url in enumerate(urls):
+            targets.append({
+                "env": env,
+                "url": url,
+                "node": node,
+                "access_id": os.getenv(f"{env}_API_ACCESS_ID"),
+                "access_key": os.getenv(f"{env}_API_ACCESS_KEY"),
+                "static_secret": f"{os.getenv('TEST_STATIC_SECRET') or '/monitor/static'}-monitor-node{node}",
+                "rotated_secret": os.getenv("TEST_ROTATED_SECRET") or None,
+            })
+    return targets
+
+
+class SyntheticMonitor:
+    """
+    Runs the create/get/delete probe against every gateway node on a schedule.
+
+    Each node keeps its pooled client and auth token between cycles, so a cycle only authenticates when the token is
+    near expiry or was rejected. Every step is recorded in a rolling window per node and operation, and an alert is
+    sent when a window crosses a threshold and again when it recovers.
+    """
+
+    def __init__(self, targets, interval=60.0, window_seconds=900, thresholds=None, min_samples=3, alert_sink=None,
+                 metrics=None):
+        """
+        :param targets: Targets from monitor_targets
+        :param interval: Seconds between the start of each cycle
+        :param window_seconds: Seconds of samples the alert thresholds are checked against
+        :param thresholds: Dictionary with the highest allowed error_rate and p95_seconds
+        :param min_samples: Samples a window needs before it can alert
+        :param alert_sink: Where alerts go. Defaults to an AlertSink writing monitor_alerts.jsonl
+        :param metrics: Registry the probe calls are counted in. A new one is made when left out
+        """
+        self.targets = targets
+        self.interval = interval
+        self.window_seconds = window_seconds
+        self.thresholds = dict(DEFAULT_THRESHOLDS, **(thresholds or {}))
+        self.min_samples = min_samples
+        self.alert_sink = alert_sink if alert_sink is not None else AlertSink()
+        self.metrics = metrics if metrics is not None else api_metrics()
+        self.windows = {}
+        self.firing = set()
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.cycles = 0
+        self.clients = {}
+        for target in targets:
+            api = MeteredApi(get_api(target["url"], **pool_settings_from_env()), self.metrics, env=target["env"],
+                             gateway=target["url"])
+            token_manager = TokenManager(api, target["env"], target["access_id"], target["access_key"],
+                                         cache_file=None)
+            self.clients[(target["env"], target["url"])] = (api, token_manager)
+
+    def window(self, key):
+        with self.lock:
+            if key not in self.windows:
+                self.windows[key] = RollingWindow(self.window_seconds)
+            return self.windows[key]
+
+    def step(self, target, operation, func, results):
+        """
+        Run and record one probe step
+
+        :return: True if the step passed
+        """
+        start_time = time.perf_counter()
+        try:
+            func()
+            status = STATUS_OK
+        except Exception as e:
+            status = error_status(e)
+            if getattr(e, "status", None) in AUTH_FAILURE_STATUSES:
+                self.clients[(target["env"], target["url"])][1].invalidate()
+        latency = time.perf_counter() - start_time
+        self.window((target["env"], target["url"], operation)).record(latency, status == STATUS_OK)
+        results.append({"operation": operation, "status": status, "latency": latency})
+        return status == STATUS_OK
+
+    def probe(self, target):
+        """
+        Authenticate if needed, then create, read and delete a static secret and read the rotated secret if one is set
+
+        :return: List of the steps run with their status and latency
+        """
+        api, token_manager = self.clients[(target["env"], target["url"])]
+        name = target["static_secret"]
+        results = []
+        token = []
+
+        def authenticate():
+            refreshes = token_manager.refresh_count
+            token.append(token_manager.token)
+            return token_manager.refresh_count > refreshes
+
+        def create():
+            try:
+                api.create_secret(CreateSecret(name=name, value=PROBE_VALUE, description="synthetic monitor probe",
+                                               token=token[0]))
+            except Exception as e:
+                # Left behind by a cycle that stopped before its delete
+                if not is_conflict(e):
+                    raise
+
+        def get():
+            value = api.get_secret_value(GetSecretValue(names=[name], token=token[0]))
+            if value.get(name) != PROBE_VALUE:
+                raise ValueError(f"{name} returned an unexpected value")
+
+        start_time = time.perf_counter()
+        try:
+            refreshed = authenticate()
+        except Exception as e:
+            self.window((target["env"], target["url"], "auth")).record(time.perf_counter() - start_time, False)
+            return [{"operation": "auth", "status": error_status(e), "latency": time.perf_counter() - start_time}]
+        # A reused token costs nothing, so only real authentications are recorded
+        if refreshed:
+            latency = time.perf_counter() - start_time
+            self.window((target["env"], target["url"], "auth")).record(latency, True)
+            results.append({"operation": "auth", "status": STATUS_OK, "latency": latency})
+
+        if self.step(target, "create_static_secret", create, results):
+            self.step(target, "get_static_secret", get, results)
+            self.step(target, "delete_static_secret",
+                      lambda: api.delete_item(DeleteItem(name=name, token=token[0])), results)
+        if target["rotated_secret"]:
+            self.step(target, "get_rotated_secret",
+                      lambda: api.rotated_secret_get_value(RotatedSecretGetValue(name=target["rotated_secret"],
+                                                                                 token=token[0])), results)
+        return results
+
+    def check_thresholds(self):
+        """
+        Send an alert for every window that started or stopped breaching a threshold since the last check
+        """
+        with self.lock:
+            windows = dict(self.windows)
+        for (env, url, operation), window in sorted(windows.items()):
+            stats = window.stats()
+            values = {"error_rate": stats["error_rate"], "p95_seconds": stats["p95"]}
+            for rule, threshold in self.thresholds.items():
+                value = values.get(rule)
+                key = (env, url, operation, rule)
+                breached = stats["count"] >= self.min_samples and value is not None and value > threshold
+                if breached == (key in self.firing):
+                    continue
+                if breached:
+                    self.firing.add(key)
+                else:
+                    self.firing.discard(key)
+                self.alert_sink.send({
+                    "time": datetime.now(timezone.utc).isoformat(),
+                    "state": "firing" if breached else "resolved",
+                    "env": env,
+                    "url": url,
+                    "operation": operation,
+                    "rule": rule,
+                    "value": value or 0.0,
+                    "threshold": threshold,
+                    "window_seconds": self.window_seconds,
+                    "samples": stats["count"],
+                })
+
+    def run_cycle(self, executor):
+        """
+        Probe every target at the same time and check the thresholds
+
+        :return: Dictionary of (env, url) to the probe steps
+        """
+        probes = {(target["env"], target["url"]): executor.submit(self.probe, target) for target in self.targets}
+        results = {key: probe.result() for key, probe in probes.items()}
+        self.cycles += 1
+        self.check_thresholds()
+        return results
+
+    def run(self, cycles=None, report_every=10):
+        """
+        Run cycles every interval seconds until stop() is called or the given number of cycles is reached. A cycle
+        that overruns the interval starts the next one straight away instead of queueing missed cycles
+
+        :param cycles: Cycles to run, or None to run until stopped
+        :param report_every: Print the rolling window stats every this many cycles
+        """
+        next_run = time.monotonic()
+        first_cycle = self.cycles
+        with ThreadPoolExecutor(max_workers=max(1, len(self.targets)), thread_name_prefix="monitor") as executor:
+            while not self.stop_event.is_set():
+                print_cycle(self.cycles + 1, self.run_cycle(executor))
+                if report_every and self.cycles % report_every == 0:
+                    self.print_summary()
+                if cycles is not None and self.cycles - first_cycle >= cycles:
+                    break
+                next_run = max(next_run + self.interval, time.monotonic())
+                self.stop_event.wait(next_run - time.monotonic())
+        self.print_summary()
+
+    def stop(self):
+        self.stop_event.set()
+
+    def summary(self):
+        """
+        :return: List of the rolling window stats for every env, url and operation
+        """
+        with self.lock:
+            windows = dict(self.windows)
+        return [dict(env=env, url=url, operation=operation, **window.stats())
+                for (env, url, operation), window in sorted(windows.items())]
+
+    def print_summary(self):
+        print("--" * 20)
+        print(f"Last {self.window_seconds:g} seconds after {self.cycles} cycles:")
+        print(f"{'env':<6}{'url':<45}{'operation':<23}{'count':>7}{'errors':>8}{'p50':>9}{'p95':>9}")
+        for row in self.summary():
+            p50 = f"{row['p50']:.3f}" if row["p50"] is not None else "-"
+            p95 = f"{row['p95']:.3f}" if row["p95"] is not None else "-"
+            print(f"{row['env']:<6}{row['url']:<45}{row['operation']:<23}{row['count']:>7}{row['errors']:>8}"
+                  f"{p50:>9}{p95:>9}")
+        print("--" * 20)
+
+
+def print_cycle(cycle, results):
+    print(f"Cycle {cycle} at {datetime.now().strftime('%H:%M:%S')}")
+    for (env, url), steps in results.items():
+        failed = [f"{step['operation']} ({step['status']})" for step in steps if step["status"] != STATUS_OK]
+        total = sum(step["latency"] for step in steps)
+        print(f"\t{env} {url}: {'failed ' + ', '.join(failed) if failed else 'ok'} in {total:.3f} seconds")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Continuously probe every Akeyless gateway node and alert on "
+                                                 "errors and slow responses")
+    parser.add_argument("--env-file", default=".env", help="File with the test_envs.py settings (default .env)")
+    parser.add_argument("--envs", default="UAT,PROD", help="Comma separated environments (default UAT,PROD)")
+    parser.add_argument("--interval", type=float, default=60.0, help="Seconds between cycles (default 60)")
+    parser.add_argument("--window", type=float, default=900.0,
+                        help="Seconds of samples the thresholds are checked against (default 900)")
+    parser.add_argument("--cycles", type=int, default=None, help="Stop after this many cycles")
+    parser.add_argument("--max-error-rate", type=float, default=DEFAULT_THRESHOLDS["error_rate"],
+                        help=f"Alert above this error rate (default {DEFAULT_THRESHOLDS['error_rate']})")
+    parser.add_argument("--max-p95", type=float, default=DEFAULT_THRESHOLDS["p95_seconds"],
+                        help=f"Alert above this p95 latency in seconds (default {DEFAULT_THRESHOLDS['p95_seconds']})")
+    parser.add_argument("--min-samples", type=int, default=3, help="Samples a window needs to alert (default 3)")
+    parser.add_argument("--alert-file", default="monitor_alerts.jsonl",
+                        help="File alerts are appended to (default monitor_alerts.jsonl)")
+    args = parser.parse_args()
+
+    load_dotenv(args.env_file)
+    monitor = SyntheticMonitor(monitor_targets([env.strip().upper() for env in args.envs.split(",") if env.strip()]),
+                               interval=args.interval, window_seconds=args.window,
+                               thresholds={"error_rate": args.max_error_rate, "p95_seconds": args.max_p95},
+                               min_samples=args.min_samples, alert_sink=AlertSink(args.alert_file))
+    start_metrics_server(monitor.metrics)
+    print(f"Monitoring {len(monitor.targets)} gateway nodes every {args.interval:g} seconds")
+    try:
+        monitor.run(args.cycles)
+    except KeyboardInterrupt:
+        monitor.print_summary()
@@ -0,0 +1,123 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+from toolkit.latency_recorder import STATUS_OK, error_status
+from toolkit.retry import current, last_attempts
+
+# Request body fields that name the item a V2Api call works on, in order of preference
+ITEM_PATH_FIELDS = ["name", "role_name", "am_name", "auth_method_name", "names", "item", "path", "filter"]
+
+
+def item_path(body):
+    for field in ITEM_PATH_FIELDS:
+        value = getattr(body, field, None)
+        if value:
+            return ",".join(value) if isinstance(value, list) else value
+    return None
+
+
+class Tracer:
+    """
+    Records nested spans on every thread and saves them in the Chrome Trace Event format, which opens in
+    chrome://tracing, Perfetto (ui.perfetto.dev) and speedscope
+    """
+
+    def __init__(self):
+        self.start_time = time.perf_counter()
+        self.lock = threading.Lock()
+        self.events = []
+        self.local = threading.local()
+
+    @contextmanager
+    def span(self, name, category="phase", **attributes):
+        """
+        Time a block as a span. Spans opened inside it on the same thread are its children
+
+        :param name: Span name
+        :param category: Span category, such as phase or api
+        :param attributes: Values shown with the span in the trace viewer. More can be added to the yielded dictionary
+        """
+        stack = self.local.__dict__.setdefault("stack", [])
+        attributes = dict(attributes)
+        if stack:
+            attributes["parent"] = stack[-1]
+        stack.append(name)
+        start_time = time.perf_counter()
+        try:
+            yield attributes
+        except Exception as e:
+            attributes.setdefault("status", error_status(e))
+            raise
+        finally:
+            duration = time.perf_counter() - start_time
+            stack.pop()
+            event = {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": round((start_time - self.start_time) * 1e6, 1),
+                "dur": round(duration * 1e6, 1),
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": {key: value for key, value in attributes.items() if value is not None},
+            }
+            with self.lock:
+                self.events.append(event)
+
+    def save(self, trace_file):
+        with self.lock:
+            events = sorted(self.events, key=lambda event: event["ts"])
+        thread_names = [{"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": thread.ident,
+                         "args": {"name": thread.name}} for thread in threading.enumerate()]
+        with open(trace_file, "w") as f:
+            json.dump({"traceEvents": thread_names + events, "displayTimeUnit": "ms"}, f)
+        return trace_file
+
+
+def traced(name):
+    """
+    Trace a function taking the Akeyless configuration as its first argument. Nothing is recorded unless the
+    configuration has a tracer
+    """
+    def decorator(func):
+        @wraps(func)
+        def traced_wrapper(config, *args, **kwargs):
+            tracer = getattr(config, "tracer", None)
+            with tracer.span(name) if tracer is not None else nullcontext():
+                return func(config, *args, **kwargs)
+        return traced_wrapper
+    return decorator
+
+
+class TracedApi:
+    """
+    Wraps a V2Api so every call is a span with the item path, endpoint, status and retry count
+    """
+
+    def __init__(self, api, tracer):
+        self.api = api
+        self.tracer = tracer
+
+    def __getattr__(self, name):
+        attribute = getattr(self.api, name)
+        if name.startswith("_") or not callable(attribute):
+            return attribute
+
+        @wraps(attribute)
+        def traced_call(*args, **kwargs):
+            body = args[0] if args else kwargs.get("body")
+            with self.tracer.span(f"V2Api.{name}", "api", endpoint="/" + name.replace("_", "-"),
+                                  item_path=item_path(body)) as attributes:
+                current.attempts = 1
+                try:
+                    result = attribute(*args, **kwargs)
+                finally:
+                    attributes["retry_count"] = max(0, last_attempts() - 1)
+                attributes["status"] = STATUS_OK
+                return result
+
+        return traced_call